@@ -1,6 +1,8 @@
+from importlib.util import find_spec
 from pathlib import Path
 from dotenv import load_dotenv
 from os import getenv, path
+from tempfile import gettempdir
 import six
 load_dotenv()
 
@@ -29,6 +31,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 REST_FRAMEWORK = {
@@ -39,15 +42,27 @@ REST_FRAMEWORK = {
         #'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.TokenAuthentication',
-    ]
+    ],
+    # orjson when installed, the renderer falls back to the stock encoder otherwise
+    'DEFAULT_RENDERER_CLASSES': [
+        'library_app.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
+if find_spec('msgpack'):
+    # Accept: application/msgpack or ?format=msgpack
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('library_app.renderers.MessagePackRenderer')
 
 MIDDLEWARE = [
+    'library_app.metrics.MetricsMiddleware',
+    'library_app.profiling.QueryProfileMiddleware',
+    'library_app.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'library_app.profiling.RequestProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -73,21 +88,57 @@ TEMPLATES = [
 WSGI_APPLICATION = 'library.wsgi.application'
 
 
+# connections are kept for PG_CONN_MAX_AGE seconds and checked before a request reuses them.
+# asgi serves every request from a new thread, which persistent connections do not outlive:
+# run uvicorn with PG_CONN_MAX_AGE=0 and PG_POOL set, the pool then lends a connection to each
+# request and takes it back at its end
+PG_POOL = getenv('PG_POOL', 'false').lower() == 'true'
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'library_app.pooled_postgresql' if PG_POOL else 'django.db.backends.postgresql',
         'NAME': getenv('PG_DBNAME'),
         'USER': getenv('PG_USER'),
         'PASSWORD': getenv('PG_PASSWORD'),
         'HOST': getenv('PG_HOST'),
         'PORT': getenv('PG_PORT'),
         'OPTIONS': {'options': '-c search_path=public,library'},
+        'CONN_MAX_AGE': 0 if PG_POOL else int(getenv('PG_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': getenv('PG_CONN_HEALTH_CHECKS', 'true').lower() == 'true',
+        # per process: PG_POOL_MAX_SIZE times the workers has to stay below max_connections
+        # pooled connections idle for PG_POOL_CHECK_IDLE seconds or more are pinged before reuse
+        'POOL': {
+            'min_size': int(getenv('PG_POOL_MIN_SIZE', 1)),
+            'max_size': int(getenv('PG_POOL_MAX_SIZE', 10)),
+            'timeout': float(getenv('PG_POOL_TIMEOUT', 10)),
+            'max_idle': float(getenv('PG_POOL_MAX_IDLE', 600)),
+            'max_lifetime': float(getenv('PG_POOL_MAX_LIFETIME', 3600)),
+            'check_idle': float(getenv('PG_POOL_CHECK_IDLE', 0)),
+        },
         'TEST': {
             'NAME': 'test_db',
         },
     }
 }
 
+# read replicas as PG_REPLICA_HOSTS=host:port,host:port with PG_REPLICA_WEIGHTS=2,1: catalog reads
+# of safe requests go to them in proportion to the weights. Writes, unsafe requests and the
+# requests of a client for DATABASE_REPLICA_LAG seconds after one of its writes stay on the primary
+PG_REPLICA_HOSTS = [host for host in getenv('PG_REPLICA_HOSTS', '').split(',') if host]
+PG_REPLICA_WEIGHTS = [int(weight) for weight in getenv('PG_REPLICA_WEIGHTS', '').split(',') if weight]
+DATABASE_REPLICAS = {}
+for number, replica in enumerate(PG_REPLICA_HOSTS, start=1):
+    replica_host, _, replica_port = replica.partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'PORT': replica_port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS[f'replica_{number}'] = PG_REPLICA_WEIGHTS[number - 1] if number <= len(PG_REPLICA_WEIGHTS) else 1
+DATABASE_ROUTERS = ['library_app.replicas.ReplicaRouter']
+DATABASE_REPLICA_LAG = float(getenv('DATABASE_REPLICA_LAG', 5))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -134,12 +185,82 @@ if DEBUG:
     AWS_S3_ENDPOINT_URL = getenv('MINIO_API')
     AWS_S3_USE_SSL = False
 
+OWNED_BOOKS_CACHE_TIMEOUT = int(getenv('OWNED_BOOKS_CACHE_TIMEOUT', 0))
+
+# rendered catalog pages and, when the backend is shared, the versions behind the rest list etags;
+# local memory is per process, so point CATALOG_CACHE_BACKEND at a shared backend such as redis
+# when running several workers
+CATALOG_CACHE_BACKEND = getenv('CATALOG_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': CATALOG_CACHE_BACKEND,
+        'LOCATION': getenv('CATALOG_CACHE_LOCATION', 'catalog'),
+        'TIMEOUT': int(getenv('CATALOG_CACHE_TIMEOUT', 300)),
+    },
+}
+if CATALOG_CACHE_BACKEND.endswith('LocMemCache'):
+    # local memory culls the least recently used entries past MAX_ENTRIES
+    CACHES['catalog']['OPTIONS'] = {'MAX_ENTRIES': int(getenv('CATALOG_CACHE_MAX_ENTRIES', 1000))}
+
+# how read/file/ hands book files out: "stream" through django with byte ranges, "accel" via an
+# nginx internal location under BOOK_FILE_ACCEL_PREFIX, "presigned" by redirecting to a short lived url
+BOOK_FILE_DELIVERY = getenv('BOOK_FILE_DELIVERY', 'stream')
+BOOK_FILE_ACCEL_PREFIX = getenv('BOOK_FILE_ACCEL_PREFIX', '/protected/')
+BOOK_FILE_URL_EXPIRY = int(getenv('BOOK_FILE_URL_EXPIRY', 60))
+
+# resumable uploads keep one part in memory for MinIO, uploads idle longer than the expiry
+# are aborted by the cleanup_uploads command
+BOOK_UPLOAD_MAX_PART_SIZE = int(getenv('BOOK_UPLOAD_MAX_PART_SIZE', 64 * 1024 * 1024))
+BOOK_UPLOAD_EXPIRY_HOURS = int(getenv('BOOK_UPLOAD_EXPIRY_HOURS', 24))
+
+# items accepted by one request to the bulk endpoints of the catalog viewsets
+REST_BULK_MAX_ITEMS = int(getenv('REST_BULK_MAX_ITEMS', 1000))
+
+# ids accepted by one ?ids= read of the catalog viewsets
+REST_MAX_IDS = int(getenv('REST_MAX_IDS', 200))
+
+# unfiltered admin changelists of tables estimated past this many rows show the planner
+# estimate from pg_class.reltuples instead of counting every row
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(getenv('ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000))
+
+# every request counts and times its queries: a Server-Timing header reports them when
+# SQL_PROFILE_HEADERS is set, requests past the limits and statements run at least
+# SQL_PROFILE_REPEATED times, which is how an N+1 shows up, are logged as warnings
+SQL_PROFILE_HEADERS = getenv('SQL_PROFILE_HEADERS', str(DEBUG)).lower() == 'true'
+SQL_PROFILE_MAX_QUERIES = int(getenv('SQL_PROFILE_MAX_QUERIES', 30))
+SQL_PROFILE_MAX_DURATION_MS = float(getenv('SQL_PROFILE_MAX_DURATION_MS', 500))
+SQL_PROFILE_REPEATED = int(getenv('SQL_PROFILE_REPEATED', 5))
+
+# /metrics in the prometheus text format. Every process keeps its own counts, so with several
+# gunicorn workers point METRICS_DIR at a directory they share and clear it on deploy: each
+# worker writes its counts there at most every METRICS_FLUSH_INTERVAL seconds
+METRICS_DIR = getenv('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(getenv('METRICS_FLUSH_INTERVAL', 1))
+METRICS_TOKEN = getenv('METRICS_TOKEN')
+
+# requests are profiled when they carry an X-Profile header, from a staff session or holding
+# REQUEST_PROFILE_TOKEN, and at random at REQUEST_PROFILE_SAMPLE_RATE. REQUEST_PROFILER is
+# "cprofile" for pstats files or "sampling" for folded flamegraph stacks sampled every
+# REQUEST_PROFILE_INTERVAL seconds; the last REQUEST_PROFILE_KEEP are kept for staff under /profiles/
+REQUEST_PROFILER = getenv('REQUEST_PROFILER', 'cprofile')
+REQUEST_PROFILE_SAMPLE_RATE = float(getenv('REQUEST_PROFILE_SAMPLE_RATE', 0))
+REQUEST_PROFILE_TOKEN = getenv('REQUEST_PROFILE_TOKEN')
+REQUEST_PROFILE_INTERVAL = float(getenv('REQUEST_PROFILE_INTERVAL', 0.005))
+REQUEST_PROFILE_DIR = getenv('REQUEST_PROFILE_DIR', path.join(gettempdir(), 'library_profiles'))
+REQUEST_PROFILE_KEEP = int(getenv('REQUEST_PROFILE_KEEP', 100))
+
 MINIO_ENDPOINT = 'localhost:9000'
 MINIO_ACCESS_KEY = getenv('MINIO_ACCESS_KEY_ID')
 MINIO_SECRET_KEY = getenv('MINIO_SECRET_ACCESS_KEY')
 MINIO_USE_HTTPS = False
 MINIO_CONSISTENCY_CHECK_ON_START = bool(getenv('MINIO_CONSISTENCY_CHECK_ON_START', False))
-MINIO_PRIVATE_BUCKETS = []
+# book files, only handed out by read/file/ to their owners, Book.file stores them in 'books'
+MINIO_PRIVATE_BUCKETS = [
+    'books',
+]
 MINIO_PUBLIC_BUCKETS = [
     'static',
 ]
@@ -1,35 +1,63 @@
+import re
 from typing import Any
 from django.contrib import admin
+from django.db.models import Exists, OuterRef, Q
 from django.db.models.query import QuerySet
 from .models import Author, Genre, Book, BookAuthor, BookGenre, Client, BookClient
+from .pagination import EstimatedCountPaginator
 from datetime import date
 from django.utils.translation import gettext_lazy as _
 
+class ScalableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # the "N total" link next to the filtered count would count the whole table again
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # the default UPPER(field) LIKE is served by no index, a case-insensitive regex is served by gin_trgm_ops
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        condition = Q()
+        for field in self.search_fields:
+            condition |= Q(**{f'{field}__iregex': re.escape(search_term)})
+        return queryset.filter(condition), False
+
 class BookAuthorInline(admin.TabularInline):
     model = BookAuthor
     extra = 1
+    autocomplete_fields = ('book', 'author')
 
 class BookGenreInline(admin.TabularInline):
     model = BookGenre
     extra = 1
+    autocomplete_fields = ('book', 'genre')
 
 class BookClientInline(admin.TabularInline):
     model = BookClient
     extra = 1
+    autocomplete_fields = ('book',)
+    raw_id_fields = ('client',)
 
 @admin.register(Client)
-class ClientAdmin(admin.ModelAdmin):
+class ClientAdmin(ScalableAdmin):
     model = Client
     inlines = (BookClientInline,)
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    # balances change through the ledger only
+    readonly_fields = ('money',)
 
 @admin.register(Author)
-class AuthorAdmin(admin.ModelAdmin):
+class AuthorAdmin(ScalableAdmin):
     model = Author
     inlines = (BookAuthorInline,)
+    search_fields = ('full_name',)
 
 @admin.register(Genre)
-class GenreAdmin(admin.ModelAdmin):
+class GenreAdmin(ScalableAdmin):
     model = Genre
+    search_fields = ('name',)
 
 DECADE = 10
 
@@ -52,20 +80,40 @@ class NewestBookFilter(admin.SimpleListFilter):
             return queryset.filter(year__gte=date.today().year - DECADE * 2)
         return queryset
 
+class GenreFilter(admin.SimpleListFilter):
+    title = _('genres')
+    parameter_name = 'genre'
+
+    def lookups(self, *args) -> list[tuple[Any, str]]:
+        return list(Genre.objects.order_by('name').values_list('id', 'name'))
+
+    def queryset(self, _: Any, queryset: QuerySet[Any]) -> QuerySet[Any] | None:
+        # a semi-join rather than a join through the m2m, which would need DISTINCT over the whole table
+        if self.value():
+            return queryset.filter(Exists(BookGenre.objects.filter(book=OuterRef('pk'), genre_id=self.value())))
+        return queryset
+
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(ScalableAdmin):
     model = Book
     inlines = (BookAuthorInline, BookGenreInline)
     list_filter = (
         'type',
-        'genres',
+        GenreFilter,
         NewestBookFilter,
     )
+    search_fields = ('title',)
 
 @admin.register(BookGenre)
-class BookGenreAdmin(admin.ModelAdmin):
+class BookGenreAdmin(ScalableAdmin):
     model = BookGenre
+    list_display = ('book', 'genre')
+    list_select_related = ('book', 'genre')
+    autocomplete_fields = ('book', 'genre')
 
 @admin.register(BookAuthor)
-class BookAuthorAdmin(admin.ModelAdmin):
-    model = BookAuthor
\ No newline at end of file
+class BookAuthorAdmin(ScalableAdmin):
+    model = BookAuthor
+    list_display = ('book', 'author')
+    list_select_related = ('book', 'author')
+    autocomplete_fields = ('book', 'author')
\ No newline at end of file
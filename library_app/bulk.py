@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Model
+from rest_framework import serializers
+
+from . import catalog_cache, counters
+from .models import get_datetime
+
+CREATED = 'created'
+UPDATED = 'updated'
+DELETED = 'deleted'
+INVALID = 'invalid'
+NOT_FOUND = 'not_found'
+
+
+class BatchError(Exception):
+    pass
+
+
+def check_batch(items) -> list:
+    if not isinstance(items, list):
+        raise BatchError('expected a list')
+    if len(items) > settings.REST_BULK_MAX_ITEMS:
+        raise BatchError(f'at most {settings.REST_BULK_MAX_ITEMS} items per request')
+    return items
+
+
+def _model(serializer_class) -> type[Model]:
+    return serializer_class.Meta.model
+
+
+def _pk(model: type[Model], value):
+    try:
+        return model._meta.pk.to_python(value)
+    except ValidationError:
+        return None
+
+
+def _result(status: str, **fields) -> dict:
+    return {'status': status, **fields}
+
+
+def _validate(serializer, item, instance=None) -> tuple[dict | None, dict | None]:
+    # one serializer validates the whole batch, building its fields per item would dominate the request
+    serializer.instance = instance
+    try:
+        return serializer.run_validation(item), None
+    except serializers.ValidationError as error:
+        return None, error.detail
+
+
+def create(serializer_class, items: list, context: dict) -> list[dict]:
+    model = _model(serializer_class)
+    serializer = serializer_class(context=context)
+    results, instances = [], []
+    for item in check_batch(items):
+        validated, errors = _validate(serializer, item)
+        if errors is not None:
+            results.append(_result(INVALID, errors=errors))
+            continue
+        instance = model(**validated)
+        instances.append(instance)
+        results.append(_result(CREATED, instance=instance))
+    # bulk_create skips post_save, so counters and cached lists are maintained here
+    counters.bulk_create(model, instances)
+    if instances:
+        catalog_cache.bump([(model._meta.model_name,)])
+    return _serialized(serializer_class, results, context)
+
+
+def update(serializer_class, items: list, context: dict) -> list[dict]:
+    model = _model(serializer_class)
+    items = check_batch(items)
+    ids = [_pk(model, item.get('id')) if isinstance(item, dict) else None for item in items]
+    # every row of the batch in one query
+    existing = model.objects.in_bulk([id_ for id_ in ids if id_ is not None])
+    serializer = serializer_class(context=context)
+    results, changed, fields = [], {}, set()
+    for id_, item in zip(ids, items):
+        if id_ is None:
+            results.append(_result(INVALID, errors={'id': ['a valid id is required']}))
+            continue
+        if id_ not in existing:
+            results.append(_result(NOT_FOUND, id=id_))
+            continue
+        validated, errors = _validate(serializer, item, existing[id_])
+        if errors is not None:
+            results.append(_result(INVALID, id=id_, errors=errors))
+            continue
+        for name, value in validated.items():
+            setattr(existing[id_], name, value)
+        fields.update(validated)
+        changed[id_] = existing[id_]
+        results.append(_result(UPDATED, id=id_, instance=existing[id_]))
+    if changed:
+        # bulk_update skips save, which is where modified is bumped otherwise
+        now = get_datetime()
+        for instance in changed.values():
+            instance.modified = now
+        with transaction.atomic():
+            model.objects.bulk_update(list(changed.values()), [*fields, 'modified'])
+        catalog_cache.bump_instances(model._meta.model_name, changed)
+    return _serialized(serializer_class, results, context)
+
+
+def delete(serializer_class, items: list) -> list[dict]:
+    model = _model(serializer_class)
+    ids = [_pk(model, item) for item in check_batch(items)]
+    found = set(model.objects.filter(pk__in=[id_ for id_ in ids if id_ is not None]).values_list('pk', flat=True))
+    # QuerySet.delete collects cascades and sends post_delete, which keeps counters, caches and blobs in step
+    with transaction.atomic():
+        model.objects.filter(pk__in=found).delete()
+    results = []
+    for item, id_ in zip(items, ids):
+        if id_ is None:
+            results.append(_result(INVALID, id=item, errors={'id': ['a valid id is required']}))
+        else:
+            results.append(_result(DELETED if id_ in found else NOT_FOUND, id=id_))
+    return results
+
+
+def _serialized(serializer_class, results: list[dict], context: dict) -> list[dict]:
+    written = [result for result in results if 'instance' in result]
+    data = serializer_class([result['instance'] for result in written], many=True, context=context).data
+    for result, item in zip(written, data):
+        result['id'] = result.pop('instance').pk
+        result['data'] = item
+    return results
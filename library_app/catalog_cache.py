@@ -0,0 +1,108 @@
+from contextlib import nullcontext
+from functools import partial
+from hashlib import md5
+from time import time
+from typing import Awaitable, Callable, Iterable, TypeVar
+from uuid import uuid4
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, transaction
+
+from . import replicas
+
+CACHE_ALIAS = 'catalog'
+T = TypeVar('T')
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def is_shared() -> bool:
+    # whether every worker sees the same versions, local memory keeps a set of its own per process
+    return not isinstance(get_cache(), (LocMemCache, DummyCache))
+
+
+def _version_key(scope: tuple) -> str:
+    return 'version:' + ':'.join(str(part) for part in scope)
+
+
+def _token() -> str:
+    # a version is a random token rather than a counter, so an evicted version can never come back;
+    # it starts with its creation time, pages of a version younger than the replica lag are built
+    # from the primary rather than stored from a replica that may not have the change yet
+    return f'{time():.3f}-{uuid4().hex}'
+
+
+def token_time(token: str) -> float:
+    return float(token.partition('-')[0])
+
+
+def _fresh(tokens: list[str]) -> bool:
+    return any(replicas.is_recent(token_time(token)) for token in tokens)
+
+
+def versions(scopes: Iterable[tuple]) -> list[str]:
+    cache = get_cache()
+    keys = [_version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            token = _token()
+            found[key] = token if cache.add(key, token, None) else cache.get(key, token)
+    return [found[key] for key in keys]
+
+
+async def aversions(scopes: Iterable[tuple]) -> list[str]:
+    cache = get_cache()
+    keys = [_version_key(scope) for scope in scopes]
+    found = await cache.aget_many(keys)
+    for key in keys:
+        if key not in found:
+            token = _token()
+            found[key] = token if await cache.aadd(key, token, None) else await cache.aget(key, token)
+    return [found[key] for key in keys]
+
+
+def bump(scopes: Iterable[tuple]) -> None:
+    keys = [_version_key(scope) for scope in scopes]
+    get_cache().delete_many(keys)
+    # a reader between the write and its commit takes a new version for the old rows,
+    # so the version is bumped again once they are visible
+    if connection.in_atomic_block:
+        transaction.on_commit(partial(get_cache().delete_many, keys))
+
+
+def bump_instances(model_name: str, ids: Iterable) -> None:
+    bump([(model_name,), *((model_name, id_) for id_ in ids)])
+
+
+def _key(parts: tuple, tokens: list[str]) -> str:
+    # parts may carry query strings, hashing keeps keys valid for memcached as well
+    return md5(':'.join(str(part) for part in (*parts, *tokens)).encode()).hexdigest()
+
+
+def cached(parts: tuple, scopes: Iterable[tuple], build: Callable[[], T]) -> T:
+    cache = get_cache()
+    tokens = versions(scopes)
+    key = _key(parts, tokens)
+    value = cache.get(key)
+    if value is None:
+        with replicas.primary_reads() if _fresh(tokens) else nullcontext():
+            value = build()
+        cache.set(key, value)
+    return value
+
+
+async def acached(parts: tuple, scopes: Iterable[tuple], build: Callable[[], Awaitable[T]]) -> T:
+    cache = get_cache()
+    tokens = await aversions(scopes)
+    key = _key(parts, tokens)
+    value = await cache.aget(key)
+    if value is None:
+        with replicas.primary_reads() if _fresh(tokens) else nullcontext():
+            value = await build()
+        await cache.aset(key, value)
+    return value
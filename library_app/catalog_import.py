@@ -0,0 +1,233 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from io import StringIO
+from itertools import islice
+from time import perf_counter
+from typing import Callable, Iterable, Iterator
+from uuid import uuid4
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Model
+
+from . import catalog_cache, counters
+from .models import Author, Book, BookAuthor, BookGenre, Genre, get_datetime, validate_book
+
+COPY = 'copy'
+BULK = 'bulk'
+METHODS = (COPY, BULK)
+NAMES_SEPARATOR = ';'
+
+
+class InvalidRecord(Exception):
+    pass
+
+
+def read_csv(stream) -> Iterator[dict]:
+    return csv.DictReader(stream)
+
+
+def read_jsonl(stream) -> Iterator[dict]:
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                yield None
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+def _names(value, separator: str) -> list[str]:
+    if not value:
+        return []
+    names = value if isinstance(value, list) else str(value).split(separator)
+    # dict keeps the first occurrence order while dropping repeated names
+    return list(dict.fromkeys(name.strip() for name in names if name and name.strip()))
+
+
+def _optional(value, convert: Callable):
+    return None if value is None or value == '' else convert(value)
+
+
+def parse_record(record: dict | None, separator: str = NAMES_SEPARATOR) -> tuple[dict, list[str], list[str]]:
+    if not isinstance(record, dict):
+        raise InvalidRecord('malformed record')
+    try:
+        attrs = {
+            'title': (record.get('title') or '').strip(),
+            'description': record.get('description') or None,
+            'volume': _optional(record.get('volume'), int),
+            'type': record.get('type') or None,
+            'year': _optional(record.get('year'), int),
+            'price': _optional(record.get('price'), Decimal),
+        }
+    except (ValueError, TypeError, InvalidOperation) as error:
+        raise InvalidRecord(str(error)) from error
+    if not attrs['title']:
+        raise InvalidRecord('title is required')
+    if attrs['volume'] is None:
+        raise InvalidRecord('volume is required')
+    # validate only what was provided, exactly like BookManager.create does
+    attrs = {key: value for key, value in attrs.items() if value is not None}
+    try:
+        validate_book(attrs)
+    except ValidationError as error:
+        raise InvalidRecord('; '.join(error.messages)) from error
+    return attrs, _names(record.get('authors'), separator), _names(record.get('genres'), separator)
+
+
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return '\\N'
+    if isinstance(value, str):
+        return value.translate(COPY_ESCAPES)
+    return str(value)
+
+
+class Table:
+    # rows are plain attname -> value dicts, instantiating models would dominate the import time
+    def __init__(self, model: type[Model]) -> None:
+        self.model = model
+        fields = model._meta.concrete_fields
+        self.attnames = [field.attname for field in fields]
+        self.defaults = {field.attname: field.get_default() for field in fields}
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        self.copy_sql = f'COPY {model._meta.db_table} ({columns}) FROM STDIN'
+
+    def copy(self, rows: list[dict]) -> None:
+        buffer = StringIO()
+        for row in rows:
+            buffer.write('\t'.join(_copy_value(row.get(name, self.defaults[name])) for name in self.attnames))
+            buffer.write('\n')
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(self.copy_sql, buffer)
+
+    def bulk_create(self, rows: list[dict], batch_size: int) -> None:
+        self.model.objects.bulk_create([self.model(**row) for row in rows], batch_size=batch_size)
+
+
+class ImportStats:
+    def __init__(self) -> None:
+        self.rows = 0
+        self.books = 0
+        self.authors = 0
+        self.genres = 0
+        self.errors = 0
+        self.started = perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return perf_counter() - self.started
+
+    @property
+    def rate(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+class CatalogImporter:
+    def __init__(self, batch_size: int = 5000, method: str = COPY, strict: bool = False,
+                 separator: str = NAMES_SEPARATOR,
+                 on_batch: Callable[[ImportStats], None] | None = None,
+                 on_error: Callable[[int, str], None] | None = None) -> None:
+        if method not in METHODS:
+            raise ValueError(f'unknown import method {method}')
+        self.batch_size = batch_size
+        self.method = method
+        self.strict = strict
+        self.separator = separator
+        self.on_batch = on_batch
+        self.on_error = on_error
+        self.stats = ImportStats()
+        self.tables = {}
+        # name -> id maps hold one entry per author/genre, never per book
+        self.author_ids = self._load_names(Author, 'full_name')
+        self.genre_ids = self._load_names(Genre, 'name')
+
+    @staticmethod
+    def _load_names(model: type[Model], field: str) -> dict:
+        names = {}
+        for name, id_ in model.objects.order_by('created').values_list(field, 'id').iterator():
+            names.setdefault(name, id_)
+        return names
+
+    def _write(self, model: type[Model], rows: list[dict]) -> None:
+        if not rows:
+            return
+        if model not in self.tables:
+            self.tables[model] = Table(model)
+        if self.method == COPY:
+            self.tables[model].copy(rows)
+        else:
+            self.tables[model].bulk_create(rows, self.batch_size)
+        counters.increment(model, len(rows))
+
+    @staticmethod
+    def _resolve(names: Iterable[str], ids: dict, field: str, now) -> list[dict]:
+        created = []
+        for name in names:
+            if name not in ids:
+                ids[name] = uuid4()
+                created.append({'id': ids[name], field: name, 'created': now, 'modified': now})
+        return created
+
+    def _import_batch(self, batch: list[tuple[int, dict]]) -> None:
+        now = get_datetime()
+        books, book_authors, book_genres = [], [], []
+        new_authors, new_genres = [], []
+        for number, record in batch:
+            try:
+                attrs, authors, genres = parse_record(record, self.separator)
+            except InvalidRecord as error:
+                self.stats.errors += 1
+                if self.strict:
+                    raise InvalidRecord(f'record {number}: {error}') from error
+                if self.on_error:
+                    self.on_error(number, str(error))
+                continue
+            book_id = uuid4()
+            books.append({'id': book_id, 'created': now, 'modified': now, **attrs})
+            new_authors += self._resolve(authors, self.author_ids, 'full_name', now)
+            new_genres += self._resolve(genres, self.genre_ids, 'name', now)
+            book_authors += [
+                {'id': uuid4(), 'book_id': book_id, 'author_id': self.author_ids[name], 'created': now}
+                for name in authors
+            ]
+            book_genres += [
+                {'id': uuid4(), 'book_id': book_id, 'genre_id': self.genre_ids[name], 'created': now}
+                for name in genres
+            ]
+        try:
+            with transaction.atomic():
+                self._write(Author, new_authors)
+                self._write(Genre, new_genres)
+                self._write(Book, books)
+                self._write(BookAuthor, book_authors)
+                self._write(BookGenre, book_genres)
+        except Exception:
+            # names created by the rolled back batch must not be reused
+            for row in new_authors:
+                del self.author_ids[row['full_name']]
+            for row in new_genres:
+                del self.genre_ids[row['name']]
+            raise
+        # COPY and bulk_create send no signals, so the cached catalog lists are dropped here
+        catalog_cache.bump([('book',), ('author',), ('genre',)])
+        self.stats.rows += len(batch)
+        self.stats.books += len(books)
+        self.stats.authors += len(new_authors)
+        self.stats.genres += len(new_genres)
+
+    def run(self, records: Iterable[dict]) -> ImportStats:
+        numbered = enumerate(records, start=1)
+        while batch := list(islice(numbered, self.batch_size)):
+            self._import_batch(batch)
+            if self.on_batch:
+                self.on_batch(self.stats)
+        return self.stats
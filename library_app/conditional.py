@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+from hashlib import md5
+from typing import Awaitable, Callable
+
+from django.db.models import Count, Max, QuerySet
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+from . import catalog_cache
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def make_etag(*parts) -> str:
+    return quote_etag(md5(':'.join(str(part) for part in parts).encode()).hexdigest())
+
+
+def entity_state(queryset: QuerySet, pk, **annotations) -> tuple | None:
+    # modified plus any annotations in one primary key lookup, None when the row is missing
+    return _state_query(queryset, pk, annotations).first()
+
+
+async def aentity_state(queryset: QuerySet, pk, **annotations) -> tuple | None:
+    return await _state_query(queryset, pk, annotations).afirst()
+
+
+def _state_query(queryset: QuerySet, pk, annotations: dict) -> QuerySet:
+    return queryset.filter(pk=pk).annotate(**annotations).values_list('modified', *annotations)
+
+
+def list_state(queryset: QuerySet, related: list[str] = ()) -> dict:
+    # related relations are joined in so that renaming an expanded author changes the book list etag
+    aggregates = {name: Max(f'{name}__modified') for name in related}
+    return queryset.order_by().aggregate(
+        modified=Max('modified'), count=Count('pk', distinct=bool(related)), **aggregates,
+    )
+
+
+def collection_state(queryset: QuerySet, related: list[str] = ()) -> tuple[list, datetime | None]:
+    # the catalog cache versions of the model and of the expanded relations, bumped on every write
+    # to them: one cache read, where an aggregate scans the whole filtered table for each page;
+    # versions of a per process cache would keep validating in the workers that missed a write
+    if not catalog_cache.is_shared():
+        state = list_state(queryset, related)
+        return list(state.values()), state['modified']
+    model = queryset.model
+    names = [model._meta.model_name, *(model._meta.get_field(name).related_model._meta.model_name for name in related)]
+    tokens = catalog_cache.versions([(name,) for name in names])
+    # a version starts with the time it was created, which is after the change it follows
+    return tokens, datetime.fromtimestamp(max(catalog_cache.token_time(token) for token in tokens), timezone.utc)
+
+
+def _timestamp(last_modified: datetime | None) -> int | None:
+    return int(last_modified.timestamp()) if last_modified else None
+
+
+def _precondition(request, etag: str, timestamp: int | None, check_modified: bool) -> HttpResponse | None:
+    return get_conditional_response(request, etag=etag, last_modified=timestamp if check_modified else None)
+
+
+def _validators(response: HttpResponse, etag: str, timestamp: int | None) -> HttpResponse:
+    if response.status_code in (200, 304):
+        response.headers['ETag'] = etag
+        if timestamp is not None:
+            response.headers['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+def respond(request, etag: str, last_modified: datetime | None, render: Callable[[], HttpResponse],
+            check_modified: bool = True) -> HttpResponse:
+    if request.method not in SAFE_METHODS:
+        return render()
+    timestamp = _timestamp(last_modified)
+    response = _precondition(request, etag, timestamp, check_modified)
+    if response is None:
+        response = render()
+    return _validators(response, etag, timestamp)
+
+
+async def arespond(request, etag: str, last_modified: datetime | None, render: Callable[[], Awaitable[HttpResponse]],
+                   check_modified: bool = True) -> HttpResponse:
+    if request.method not in SAFE_METHODS:
+        return await render()
+    timestamp = _timestamp(last_modified)
+    response = _precondition(request, etag, timestamp, check_modified)
+    if response is None:
+        response = await render()
+    return _validators(response, etag, timestamp)
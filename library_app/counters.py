@@ -0,0 +1,85 @@
+from typing import Iterable
+from zlib import crc32
+
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.contrib.postgres.aggregates import BoolOr
+from django.db.models import F, Func, Model, Q, Sum, TextField, Value
+
+from .models import Author, Book, BookAuthor, BookClient, BookGenre, Counter, Genre
+
+COUNTED_MODELS = (Book, Author, Genre, BookAuthor, BookGenre, BookClient)
+# hot counters are spread over rows named "<counter>:<shard>", which readers add to the counter's row
+SHARDS = 16
+
+INCREMENT_SHARD = f'''
+    INSERT INTO {Counter._meta.db_table} AS counter (name, value) VALUES (%s, %s)
+    ON CONFLICT (name) DO UPDATE SET value = counter.value + EXCLUDED.value
+'''
+
+
+def counter_name(model: type[Model]) -> str:
+    return model._meta.model_name
+
+
+def increment(model: type[Model], delta: int = 1) -> None:
+    if delta:
+        Counter.objects.filter(name=counter_name(model)).update(value=F('value') + delta)
+
+
+def decrement(model: type[Model], delta: int = 1) -> None:
+    increment(model, -delta)
+
+
+def increment_sharded(model: type[Model], key, delta: int = 1) -> None:
+    # writers with different keys update different rows, within their own transaction as the others
+    if delta:
+        with connection.cursor() as cursor:
+            cursor.execute(INCREMENT_SHARD, [f'{counter_name(model)}:{crc32(str(key).encode()) % SHARDS}', delta])
+
+
+def bulk_create(model: type[Model], objs: Iterable[Model], batch_size: int | None = None) -> list[Model]:
+    with transaction.atomic():
+        created = model.objects.bulk_create(objs, batch_size=batch_size)
+        increment(model, len(created))
+    return created
+
+
+def rebuild(models: Iterable[type[Model]] = COUNTED_MODELS) -> dict[str, int]:
+    counts = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model in models:
+            # SHARE mode blocks writers until commit, so the count and the counter agree
+            cursor.execute(f'LOCK TABLE {model._meta.db_table} IN SHARE MODE')
+            counts[counter_name(model)] = model.objects.count()
+            Counter.objects.filter(name__startswith=f'{counter_name(model)}:').delete()
+            Counter.objects.update_or_create(
+                name=counter_name(model), defaults={'value': counts[counter_name(model)]},
+            )
+    return counts
+
+
+def _totals(names: list[str]):
+    counter = Func(F('name'), Value(':'), Value(1), function='split_part', output_field=TextField())
+    # shards without the counter's own row do not make a count, the counter is rebuilt instead
+    return Counter.objects.annotate(counter=counter).filter(counter__in=names).values('counter').annotate(
+        total=Sum('value'), own=BoolOr(Q(name=F('counter'))),
+    ).filter(own=True).values_list('counter', 'total')
+
+
+def get_counts(*models: type[Model]) -> dict[str, int]:
+    names = [counter_name(model) for model in models]
+    counts = dict(_totals(names))
+    missing = [model for model in models if counter_name(model) not in counts]
+    if missing:
+        counts.update(rebuild(missing))
+    return counts
+
+
+async def aget_counts(*models: type[Model]) -> dict[str, int]:
+    names = [counter_name(model) for model in models]
+    counts = {name: value async for name, value in _totals(names)}
+    missing = [model for model in models if counter_name(model) not in counts]
+    if missing:
+        counts.update(await sync_to_async(rebuild)(missing))
+    return counts
@@ -0,0 +1,111 @@
+import mimetypes
+import re
+from datetime import timedelta
+from typing import Iterator
+
+from django.conf import settings
+from django.db.models.fields.files import FieldFile
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django_minio_backend import MinioBackend
+
+from . import metrics
+
+STREAM = 'stream'
+ACCEL = 'accel'
+PRESIGNED = 'presigned'
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    # a single byte range as (start, end inclusive), None serves the whole file;
+    # multiple ranges are answered with the whole file, which RFC 9110 allows
+    if not header:
+        return None
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        suffix = int(last)
+        if not suffix or not size:
+            raise RangeNotSatisfiable(header)
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+def read_chunks(storage, name: str, start: int, length: int) -> Iterator[bytes]:
+    # MinioBackend.open reads the whole object into memory, so its client is asked for the range instead
+    if isinstance(storage, MinioBackend):
+        response = storage.client.get_object(storage.bucket, name, offset=start, length=length)
+        try:
+            yield from response.stream(CHUNK_SIZE)
+        finally:
+            response.close()
+            response.release_conn()
+        return
+    with storage.open(name, 'rb') as file:
+        file.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def presigned_url(storage, name: str) -> str | None:
+    if not isinstance(storage, MinioBackend):
+        return None
+    client = storage.client if storage.same_endpoints else storage.client_external
+    return client.presigned_get_object(
+        storage.bucket, name, expires=timedelta(seconds=settings.BOOK_FILE_URL_EXPIRY),
+    )
+
+
+def file_response(request, file: FieldFile) -> HttpResponse:
+    storage, name = file.storage, file.name
+    if settings.BOOK_FILE_DELIVERY == PRESIGNED:
+        with metrics.timed(metrics.STORAGE_SECONDS, operation='presign'):
+            url = presigned_url(storage, name)
+        if url:
+            return HttpResponseRedirect(url)
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if settings.BOOK_FILE_DELIVERY == ACCEL:
+        # nginx serves the internal location itself, ranges included
+        response = HttpResponse(content_type=content_type)
+        response.headers['X-Accel-Redirect'] = f'{settings.BOOK_FILE_ACCEL_PREFIX}{name}'
+        return response
+    with metrics.timed(metrics.STORAGE_SECONDS, operation='size'):
+        size = storage.size(name)
+    try:
+        byte_range = parse_range(request.headers.get('Range'), size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response.headers['Content-Range'] = f'bytes */{size}'
+        return response
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+    chunks = iter(()) if request.method == 'HEAD' else metrics.timed_chunks(
+        read_chunks(storage, name, start, length), metrics.STORAGE_SECONDS, operation='read',
+    )
+    response = StreamingHttpResponse(chunks, status=206 if byte_range else 200, content_type=content_type)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Length'] = str(length)
+    if byte_range:
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
@@ -0,0 +1,96 @@
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.db import connection, transaction
+from django.db.models import DecimalField, F, OuterRef, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Client, LedgerEntry, check_positive
+
+# the balance is Client.money, the entries compacted so far, plus the entries appended since;
+# appending only takes a KEY SHARE lock on the client row, so top-ups never wait for each other
+CLIENT_TABLE = Client._meta.db_table
+LEDGER_TABLE = LedgerEntry._meta.db_table
+
+# NO KEY UPDATE serialises the charges of one client without conflicting with the KEY SHARE
+# locks of appended entries
+LOCK_CLIENT = f'SELECT money FROM {CLIENT_TABLE} WHERE user_id = %s FOR NO KEY UPDATE'
+
+# a statement of its own: its snapshot, unlike that of the locking one, includes every charge
+# committed while the lock was waited for
+PENDING = f'SELECT coalesce(sum(amount), 0) FROM {LEDGER_TABLE} WHERE client_id = %s AND NOT compacted'
+
+INSERT_ENTRY = f'''
+    INSERT INTO {LEDGER_TABLE} (client_id, kind, amount, book_id, compacted, created)
+    VALUES (%s, %s, %s, %s, false, now())
+'''
+
+# folding and adding up in one statement, so no entry is counted twice or lost in between;
+# a concurrent run skips the rows this one folds
+COMPACT = f'''
+    WITH folded AS (
+        UPDATE {LEDGER_TABLE} SET compacted = true WHERE NOT compacted RETURNING client_id, amount
+    ), totals AS (
+        SELECT client_id, sum(amount) AS amount FROM folded GROUP BY client_id
+    )
+    UPDATE {CLIENT_TABLE} client SET money = client.money + totals.amount, modified = now()
+    FROM totals WHERE client.user_id = totals.client_id
+'''
+
+RECONCILE = f'''
+    SELECT client.user_id, client.money, coalesce(entries.amount, 0)
+    FROM {CLIENT_TABLE} client LEFT JOIN (
+        SELECT client_id, sum(amount) AS amount FROM {LEDGER_TABLE} WHERE compacted GROUP BY client_id
+    ) entries ON entries.client_id = client.user_id
+    WHERE client.money <> coalesce(entries.amount, 0)
+    ORDER BY client.user_id
+'''
+
+
+class Mismatch(NamedTuple):
+    client_id: int
+    money: Decimal
+    ledger: Decimal
+
+
+def with_balance(queryset: QuerySet) -> QuerySet:
+    pending = LedgerEntry.objects.filter(client=OuterRef('pk'), compacted=False).values('client')
+    pending = pending.annotate(total=Sum('amount')).values('total')
+    output_field = DecimalField(max_digits=11, decimal_places=2)
+    return queryset.annotate(
+        balance=F('money') + Coalesce(Subquery(pending), Value(Decimal(0)), output_field=output_field),
+    )
+
+
+def balance(client_id) -> Decimal:
+    return with_balance(Client.objects.filter(pk=client_id)).values_list('balance', flat=True).get()
+
+
+def top_up(client_id, amount: Decimal) -> LedgerEntry:
+    check_positive(amount)
+    return LedgerEntry.objects.create(client_id=client_id, kind=LedgerEntry.TOP_UP, amount=amount)
+
+
+def charge(client_id, amount: Decimal, book_id=None) -> Decimal | None:
+    # the balance left, None when it does not cover the amount; runs inside the caller's transaction
+    with connection.cursor() as cursor:
+        cursor.execute(LOCK_CLIENT, [client_id])
+        money = cursor.fetchone()[0]
+        cursor.execute(PENDING, [client_id])
+        available = money + cursor.fetchone()[0]
+        if available < amount:
+            return None
+        cursor.execute(INSERT_ENTRY, [client_id, LedgerEntry.PURCHASE, -amount, book_id])
+    return available - amount
+
+
+def compact() -> int:
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(COMPACT)
+        return cursor.rowcount
+
+
+def reconcile() -> list[Mismatch]:
+    with connection.cursor() as cursor:
+        cursor.execute(RECONCILE)
+        return [Mismatch(*row) for row in cursor.fetchall()]
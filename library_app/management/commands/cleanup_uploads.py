@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from library_app import uploads
+
+
+class Command(BaseCommand):
+    help = 'Aborts resumable book uploads that received no part for a while, meant to run from cron.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=settings.BOOK_UPLOAD_EXPIRY_HOURS)
+
+    def handle(self, *args, **options):
+        count = uploads.cleanup(timedelta(hours=options['hours']))
+        self.stdout.write(f'{count} abandoned uploads aborted')
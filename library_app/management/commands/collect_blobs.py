@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from library_app import uploads
+
+
+class Command(BaseCommand):
+    help = 'Deletes stored book files that no book has referenced for a while, meant to run from cron.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='grace period before an unreferenced file goes')
+
+    def handle(self, *args, **options):
+        count = uploads.collect_blobs(timedelta(hours=options['hours']))
+        self.stdout.write(f'{count} unreferenced blobs deleted')
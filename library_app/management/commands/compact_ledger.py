@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from library_app import ledger
+
+
+class Command(BaseCommand):
+    help = 'Folds the ledger entries appended since the last run into the client balances, meant to run from cron.'
+
+    def handle(self, *args, **options):
+        count = ledger.compact()
+        self.stdout.write(f'{count} client balances compacted')
@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library_app.catalog_import import (
+    BULK, COPY, METHODS, NAMES_SEPARATOR, READERS, CatalogImporter, ImportStats, InvalidRecord,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams books with their author and genre names from CSV or JSONL into the catalog. '
+        'Columns: title, description, volume, type, year, price, authors, genres.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='input file, "-" for stdin')
+        parser.add_argument('--format', choices=sorted(READERS), help='defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--method', choices=METHODS, default=COPY,
+                            help=f'"{COPY}" uses postgres COPY, "{BULK}" uses bulk_create')
+        parser.add_argument('--separator', default=NAMES_SEPARATOR, help='separates names in CSV cells')
+        parser.add_argument('--strict', action='store_true', help='abort on the first invalid row')
+
+    def _report(self, stats: ImportStats) -> None:
+        self.stdout.write(
+            f'{stats.rows} rows, {stats.books} books, {stats.authors} new authors, '
+            f'{stats.genres} new genres, {stats.errors} skipped in {stats.elapsed:.1f}s '
+            f'({stats.rate:.0f} rows/s)'
+        )
+
+    def _error(self, number: int, message: str) -> None:
+        self.stderr.write(f'record {number}: {message}')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        data_format = options['format'] or Path(path).suffix.lstrip('.').lower()
+        if data_format not in READERS:
+            raise CommandError(f'unknown format "{data_format}", use --format')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        importer = CatalogImporter(
+            batch_size=options['batch_size'],
+            method=options['method'],
+            strict=options['strict'],
+            separator=options['separator'],
+            on_batch=self._report,
+            on_error=self._error,
+        )
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            stats = importer.run(READERS[data_format](stream))
+        except InvalidRecord as error:
+            raise CommandError(str(error)) from error
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self._report(stats)
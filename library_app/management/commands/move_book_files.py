@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library_app import uploads
+from library_app.models import LEGACY_BOOK_FILE_BUCKET
+
+
+class Command(BaseCommand):
+    help = 'Copies book files from the public bucket they were stored in before into the private book bucket.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=LEGACY_BOOK_FILE_BUCKET, help='bucket the files are copied from')
+        parser.add_argument('--delete', action='store_true', help='remove the files from the source bucket as well')
+
+    def handle(self, *args, **options):
+        try:
+            count = uploads.move_book_files(options['source'], options['delete'])
+        except uploads.UploadError as error:
+            raise CommandError(str(error)) from error
+        self.stdout.write(f'{count} book files copied')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from library_app import counters
+
+
+class Command(BaseCommand):
+    help = 'Recounts the rows behind the maintained entity counters.'
+
+    def handle(self, *args, **options):
+        for name, value in counters.rebuild().items():
+            self.stdout.write(f'{name}: {value}')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library_app import ledger
+
+
+class Command(BaseCommand):
+    help = 'Checks that every client balance equals the sum of its compacted ledger entries.'
+
+    def handle(self, *args, **options):
+        mismatches = ledger.reconcile()
+        for mismatch in mismatches:
+            self.stderr.write(f'client {mismatch.client_id}: money {mismatch.money}, ledger {mismatch.ledger}')
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} balances do not match the ledger')
+        self.stdout.write('balances match the ledger')
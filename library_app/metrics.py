@@ -0,0 +1,278 @@
+import json
+import os
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock, local
+from time import monotonic, perf_counter
+from uuid import uuid4
+from weakref import finalize
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import profiling
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+UNRESOLVED = '<unresolved>'
+
+_registry = []
+
+
+class ShardOwner:
+    pass
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        # each thread writes to its own shard, readers add the shards up; asgi runs every request
+        # in a new thread, so the shard of a finished thread is folded into the retired totals
+        self._local = local()
+        self._shards = []
+        self._retired = {}
+        self._lock = Lock()
+        _registry.append(self)
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            # only the thread's locals refer to the owner, it goes when the thread does
+            self._local.owner = ShardOwner()
+            finalize(self._local.owner, self._retire, shard)
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _retire(self, shard: dict) -> None:
+        with self._lock:
+            self._shards.remove(shard)
+            for key, value in shard.items():
+                self._retired[key] = merge(self._retired.get(key), value)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def collect(self) -> dict:
+        with self._lock:
+            shards = [self._retired.copy(), *(shard.copy() for shard in self._shards)]
+        samples = {}
+        for shard in shards:
+            for key, value in shard.items():
+                samples[key] = merge(samples.get(key), value)
+        return samples
+
+
+def merge(total, value):
+    if total is None:
+        return list(value) if isinstance(value, list) else value
+    if isinstance(value, list):
+        return [left + right for left, right in zip(total, value)]
+    return total + value
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        # one count per bucket plus the sum and the count, made cumulative on export
+        shard = self._shard()
+        key = self._key(labels)
+        values = shard.get(key)
+        if values is None:
+            values = shard[key] = [0] * (len(self.buckets) + 3)
+        values[bisect_left(self.buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Request latency by URL name', ('route', 'method', 'status'),
+)
+REQUEST_DB_SECONDS = Histogram(
+    'http_request_db_duration_seconds', 'Time spent in the database per request', ('route',),
+)
+REQUEST_DB_QUERIES = Counter('http_request_db_queries_total', 'Queries run by requests', ('route',))
+STORAGE_SECONDS = Histogram('storage_operation_duration_seconds', 'Book file storage operations', ('operation',))
+PURCHASES = Counter('purchases_total', 'Purchase attempts by outcome', ('status',))
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(perf_counter() - start, **labels)
+
+
+def timed_chunks(chunks, histogram: Histogram, **labels):
+    # only the time spent producing chunks, not the time the client takes to receive them
+    duration = 0.0
+    chunks = iter(chunks)
+    try:
+        while True:
+            start = perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                duration += perf_counter() - start
+            yield chunk
+    finally:
+        histogram.observe(duration, **labels)
+
+
+def snapshot() -> dict:
+    return {
+        metric.name: [[list(key), value] for key, value in metric.collect().items()]
+        for metric in _registry
+    }
+
+
+class ProcessFile:
+    # gunicorn workers each flush their snapshot to METRICS_DIR, /metrics adds them up
+    def __init__(self) -> None:
+        self.pid = None
+        self.path = None
+        self.flushed = 0.0
+        self.lock = Lock()
+
+    def current(self, directory: str) -> Path:
+        # a forked worker writes its own file, a restarted one does not overwrite the last
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.path = Path(directory) / f'{self.pid}-{uuid4().hex}.json'
+        return self.path
+
+    def flush(self, directory: str) -> None:
+        with self.lock:
+            path = self.current(directory)
+            temporary = path.with_suffix('.tmp')
+            temporary.write_text(json.dumps(snapshot()))
+            os.replace(temporary, path)
+            self.flushed = monotonic()
+
+    def flush_due(self, directory: str) -> None:
+        if monotonic() - self.flushed >= settings.METRICS_FLUSH_INTERVAL and not self.lock.locked():
+            self.flush(directory)
+
+
+process_file = ProcessFile()
+
+
+def collect() -> dict[str, dict]:
+    directory = settings.METRICS_DIR
+    if not directory:
+        return {metric.name: metric.collect() for metric in _registry}
+    process_file.flush(directory)
+    collected = {metric.name: {} for metric in _registry}
+    for path in Path(directory).glob('*.json'):
+        try:
+            processes = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        for name, samples in processes.items():
+            if name not in collected:
+                continue
+            for key, value in samples:
+                key = tuple(key)
+                collected[name][key] = merge(collected[name].get(key), value)
+    return collected
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names, values) -> str:
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return f'{{{pairs}}}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition() -> str:
+    collected = collect()
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for key, value in sorted(collected[metric.name].items()):
+            if metric.type != 'histogram':
+                lines.append(f'{metric.name}{_labels(metric.labels, key)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip([*metric.buckets, '+Inf'], value):
+                cumulative += count
+                labels = _labels([*metric.labels, 'le'], [*key, str(bound)])
+                lines.append(f'{metric.name}_bucket{labels} {cumulative}')
+            labels = _labels(metric.labels, key)
+            lines.append(f'{metric.name}_sum{labels} {_number(value[-2])}')
+            lines.append(f'{metric.name}_count{labels} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def route(request) -> str:
+    match = request.resolver_match
+    if match is None:
+        return UNRESOLVED
+    return match.url_name or match.route
+
+
+def record(request, response, duration: float, profile: profiling.QueryProfile) -> None:
+    name = route(request)
+    REQUEST_SECONDS.observe(duration, route=name, method=request.method, status=response.status_code)
+    REQUEST_DB_SECONDS.observe(profile.duration, route=name)
+    REQUEST_DB_QUERIES.inc(profile.count, route=name)
+    if settings.METRICS_DIR:
+        process_file.flush_due(settings.METRICS_DIR)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = perf_counter()
+        with profiling.profile_queries() as profile:
+            response = self.get_response(request)
+        record(request, response, perf_counter() - start, profile)
+        return response
+
+    async def __acall__(self, request):
+        start = perf_counter()
+        with profiling.profile_queries() as profile:
+            response = await self.get_response(request)
+        record(request, response, perf_counter() - start, profile)
+        return response
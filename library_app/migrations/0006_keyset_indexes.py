@@ -0,0 +1,31 @@
+# Generated by Django 4.1.7 on 2026-10-17 22:10
+
+from django.db import migrations, models
+import django_minio_backend.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0005_book_file_alter_book_price'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='file',
+            field=models.FileField(blank=True, null=True, storage=django_minio_backend.models.MinioBackend(bucket_name='static'), upload_to=django_minio_backend.models.iso_date_prefix),
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['full_name', 'id'], name='author_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title', 'type', 'year', 'id'], name='book_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='genre',
+            index=models.Index(fields=['name', 'id'], name='genre_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.1.7 on 2026-10-17 22:12
+
+from django.db import migrations, models
+
+COUNTED_MODELS = ('Book', 'Author', 'Genre', 'BookAuthor', 'BookGenre', 'BookClient')
+
+
+def fill_counters(apps, schema_editor):
+    Counter = apps.get_model('library_app', 'Counter')
+    Counter.objects.bulk_create([
+        Counter(name=name.lower(), value=apps.get_model('library_app', name).objects.count())
+        for name in COUNTED_MODELS
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0006_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('name', models.TextField(primary_key=True, serialize=False, verbose_name='name')),
+                ('value', models.BigIntegerField(default=0, verbose_name='value')),
+            ],
+            options={
+                'verbose_name': 'counter',
+                'verbose_name_plural': 'counters',
+                'db_table': '"library"."counter"',
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
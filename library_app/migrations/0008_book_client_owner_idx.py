@@ -0,0 +1,17 @@
+# Generated by Django 4.1.7 on 2026-10-17 22:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0007_counter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookclient',
+            index=models.Index(fields=['client', 'book'], name='book_client_owner_idx'),
+        ),
+    ]
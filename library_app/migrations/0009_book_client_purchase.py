@@ -0,0 +1,27 @@
+# Generated by Django 4.1.7 on 2026-10-17 22:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0008_book_client_owner_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookclient',
+            name='idempotency_key',
+            field=models.TextField(blank=True, max_length=100, null=True, verbose_name='idempotency key'),
+        ),
+        migrations.AddField(
+            model_name='bookclient',
+            name='price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=11, null=True, verbose_name='price'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookclient',
+            constraint=models.UniqueConstraint(fields=('client', 'idempotency_key'), name='book_client_idempotency_key'),
+        ),
+    ]
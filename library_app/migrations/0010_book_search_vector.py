@@ -0,0 +1,52 @@
+# Generated by Django 4.1.7 on 2026-10-17 22:22
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_VECTOR = '''
+    setweight(to_tsvector('russian', coalesce({row}title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce({row}title, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce({row}description, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce({row}description, '')), 'B')
+'''
+
+CREATE_TRIGGER = f'''
+CREATE FUNCTION book_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_VECTOR.format(row='NEW.')};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER book_search_vector
+    BEFORE INSERT OR UPDATE OF title, description, search_vector ON "library"."book"
+    FOR EACH ROW EXECUTE FUNCTION book_search_vector_update();
+
+UPDATE "library"."book" SET search_vector = {SEARCH_VECTOR.format(row='')};
+'''
+
+DROP_TRIGGER = '''
+DROP TRIGGER book_search_vector ON "library"."book";
+DROP FUNCTION book_search_vector_update();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0009_book_client_purchase'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='book_search_idx'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.7 on 2026-10-17 22:33
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0010_book_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='author',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['full_name'], name='author_full_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='genre',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='genre_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
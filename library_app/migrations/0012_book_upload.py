@@ -0,0 +1,55 @@
+# Generated by Django 4.1.7 on 2026-10-17 22:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+import library_app.models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0011_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookUpload',
+            fields=[
+                ('id', models.UUIDField(blank=True, default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(blank=True, default=library_app.models.get_datetime, null=True, validators=[library_app.models.check_created], verbose_name='created')),
+                ('modified', models.DateTimeField(blank=True, default=library_app.models.get_datetime, null=True, validators=[library_app.models.check_modified], verbose_name='modified')),
+                ('name', models.TextField(verbose_name='object name')),
+                ('upload_id', models.TextField(verbose_name='upload id')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='library_app.book', verbose_name='book')),
+            ],
+            options={
+                'verbose_name': 'book upload',
+                'verbose_name_plural': 'book uploads',
+                'db_table': '"library"."book_upload"',
+            },
+        ),
+        migrations.CreateModel(
+            name='BookUploadPart',
+            fields=[
+                ('id', models.UUIDField(blank=True, default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(blank=True, default=library_app.models.get_datetime, null=True, validators=[library_app.models.check_created], verbose_name='created')),
+                ('number', models.PositiveIntegerField(verbose_name='number')),
+                ('size', models.BigIntegerField(verbose_name='size')),
+                ('checksum', models.TextField(verbose_name='sha256')),
+                ('etag', models.TextField(verbose_name='etag')),
+                ('upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parts', to='library_app.bookupload', verbose_name='upload')),
+            ],
+            options={
+                'verbose_name': 'book upload part',
+                'verbose_name_plural': 'book upload parts',
+                'db_table': '"library"."book_upload_part"',
+                'ordering': ['number'],
+                'unique_together': {('upload', 'number')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='bookupload',
+            index=models.Index(fields=['modified'], name='book_upload_modified_idx'),
+        ),
+    ]
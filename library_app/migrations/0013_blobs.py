@@ -0,0 +1,46 @@
+# Generated by Django 4.1.7 on 2026-10-17 22:47
+
+from django.db import migrations, models
+import django_minio_backend.models
+import library_app.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0012_book_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('created', models.DateTimeField(blank=True, default=library_app.models.get_datetime, null=True, validators=[library_app.models.check_created], verbose_name='created')),
+                ('modified', models.DateTimeField(blank=True, default=library_app.models.get_datetime, null=True, validators=[library_app.models.check_modified], verbose_name='modified')),
+                ('sha256', models.TextField(primary_key=True, serialize=False, verbose_name='sha256')),
+                ('name', models.TextField(unique=True, verbose_name='object name')),
+                ('size', models.BigIntegerField(verbose_name='size')),
+                ('references', models.BigIntegerField(default=0, verbose_name='references')),
+            ],
+            options={
+                'verbose_name': 'blob',
+                'verbose_name_plural': 'blobs',
+                'db_table': '"library"."blob"',
+            },
+        ),
+        migrations.AddField(
+            model_name='bookupload',
+            name='sha256',
+            field=models.TextField(default='', verbose_name='sha256'),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='file',
+            field=library_app.models.ContentAddressedFileField(blank=True, null=True, storage=django_minio_backend.models.MinioBackend(bucket_name='static'), upload_to=django_minio_backend.models.iso_date_prefix),
+        ),
+        migrations.AddIndex(
+            model_name='blob',
+            index=models.Index(fields=['references', 'modified'], name='blob_unreferenced_idx'),
+        ),
+    ]
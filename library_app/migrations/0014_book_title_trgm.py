@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-17 23:40
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0013_blobs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='book_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
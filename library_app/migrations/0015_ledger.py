@@ -0,0 +1,42 @@
+# Generated by Django 4.1.7 on 2026-10-17 23:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+import library_app.models
+
+# the balances so far become the opening, already compacted, entries
+OPENING_ENTRIES = '''
+INSERT INTO "library"."ledger_entry" (client_id, kind, amount, compacted, created)
+SELECT user_id, 'opening', money, true, now() FROM "library"."client" WHERE money <> 0;
+'''
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0014_book_title_trgm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('created', models.DateTimeField(blank=True, default=library_app.models.get_datetime, null=True, validators=[library_app.models.check_created], verbose_name='created')),
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.TextField(choices=[('opening', 'opening'), ('top_up', 'top up'), ('purchase', 'purchase'), ('refund', 'refund')], verbose_name='kind')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=11, verbose_name='amount')),
+                ('compacted', models.BooleanField(default=False, verbose_name='compacted')),
+                ('book', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='library_app.book', verbose_name='book')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='library_app.client', verbose_name='client')),
+            ],
+            options={
+                'verbose_name': 'ledger entry',
+                'verbose_name_plural': 'ledger entries',
+                'db_table': '"library"."ledger_entry"',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(condition=models.Q(('compacted', False)), fields=['client'], name='ledger_entry_pending_idx'),
+        ),
+        migrations.RunSQL(OPENING_ENTRIES, migrations.RunSQL.noop),
+    ]
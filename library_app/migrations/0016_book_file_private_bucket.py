@@ -0,0 +1,22 @@
+# Generated by Django 4.1.7 on 2026-10-17 23:47
+
+from django.db import migrations
+import django_minio_backend.models
+import library_app.models
+
+
+# only the field changes, the stored objects stay where they are: run manage.py move_book_files
+# to copy them from the public static bucket, then again with --delete once nothing reads them there
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0015_ledger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='file',
+            field=library_app.models.ContentAddressedFileField(blank=True, null=True, storage=django_minio_backend.models.MinioBackend(bucket_name='books'), upload_to=django_minio_backend.models.iso_date_prefix),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+# until 0009 the buy view was the only paid way to own a book and recorded no price; those rows
+# are refunded at the book's price, any owned book without a price afterwards was granted for free
+BACKFILL_PRICES = '''
+UPDATE "library"."book_client" owned SET price = book.price
+FROM "library"."book" book
+WHERE book.id = owned.book_id AND owned.price IS NULL AND owned.created < (
+    SELECT applied FROM django_migrations WHERE app = 'library_app' AND name = '0009_book_client_purchase'
+);
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0016_book_file_private_bucket'),
+    ]
+
+    operations = [
+        migrations.RunSQL(BACKFILL_PRICES, migrations.RunSQL.noop),
+    ]
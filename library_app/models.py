@@ -1,15 +1,43 @@
+import hashlib
+import re
+from functools import partial
+from pathlib import PurePosixPath
 from typing import Any
-from django.db import models
+from django.db import connection, models, transaction
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField, TrigramWordSimilarity
+from django.db.models.functions import Cast
 from uuid import uuid4
 from datetime import datetime, timezone
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
+from django.conf import settings
 from django.conf.global_settings import AUTH_USER_MODEL
+from django.core.cache import cache
+from django.utils.functional import cached_property
 from django_minio_backend import MinioBackend, iso_date_prefix
 
 def get_datetime():
     return datetime.now(timezone.utc)
 
+@models.Field.register_lookup
+class AnyLookup(models.Lookup):
+    # field = ANY(%s) binds one array instead of one parameter per value as IN does
+    lookup_name = 'any'
+    prepare_rhs = False
+
+    def get_prep_lookup(self):
+        return [self.lhs.output_field.get_prep_value(value) for value in self.rhs]
+
+    def get_db_prep_lookup(self, value, connection):
+        field = self.lhs.output_field
+        return '%s', [[field.get_db_prep_value(item, connection, prepared=True) for item in value]]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} = ANY({rhs})', [*lhs_params, *rhs_params]
+
 def check_created(dt: datetime) -> None:
     if dt > get_datetime():
         raise ValidationError(
@@ -62,11 +90,41 @@ class ModifiedMixin(models.Model):
         ]
     )
 
+    def save(self, *args, **kwargs) -> None:
+        self.modified = get_datetime()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'modified' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'modified']
+        super().save(*args, **kwargs)
+
     class Meta:
         abstract = True
 
+def touch_books(book_ids) -> None:
+    Book.objects.filter(pk__in=book_ids).update(modified=get_datetime())
+
+class TrigramSearchManager(models.Manager):
+    search_field = ''
+
+    def search(self, query: str) -> models.QuerySet:
+        # both the word similarity operator and the anchored regex are served by the gin_trgm_ops index
+        field = self.search_field
+        return self.get_queryset().filter(
+            models.Q(**{f'{field}__trigram_word_similar': query})
+            | models.Q(**{f'{field}__iregex': f'^{re.escape(query)}'}),
+        ).annotate(
+            similarity=Cast(TrigramWordSimilarity(query, field), models.FloatField()),
+        ).order_by('-similarity')
+
+class AuthorManager(TrigramSearchManager):
+    search_field = 'full_name'
+
+class GenreManager(TrigramSearchManager):
+    search_field = 'name'
+
 class Author(UUIDMixin, CreatedMixin, ModifiedMixin):
     full_name = models.TextField(_('full name'), null=False, blank=False, max_length=NAMES_MAX_LENGTH)
+    objects = AuthorManager()
 
     books = models.ManyToManyField(
         'Book', through='BookAuthor',
@@ -79,12 +137,17 @@ class Author(UUIDMixin, CreatedMixin, ModifiedMixin):
     class Meta:
         db_table = '"library"."author"'
         ordering = ['full_name']
+        indexes = [
+            models.Index(fields=['full_name', 'id'], name='author_keyset_idx'),
+            GinIndex(fields=['full_name'], opclasses=['gin_trgm_ops'], name='author_full_name_trgm_idx'),
+        ]
         verbose_name = _('author')
         verbose_name_plural = _('authors')
 
 class Genre(UUIDMixin, CreatedMixin, ModifiedMixin):
     name = models.TextField(_('name'), null=False, blank=False, max_length=NAMES_MAX_LENGTH)
     description = models.TextField(_('description'), null=True, blank=True, max_length=DESCRIPTION_MAX_LENGTH)
+    objects = GenreManager()
 
     books = models.ManyToManyField(
         'Book', through='BookGenre',
@@ -97,6 +160,10 @@ class Genre(UUIDMixin, CreatedMixin, ModifiedMixin):
     class Meta:
         db_table = '"library"."genre"'
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'id'], name='genre_keyset_idx'),
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='genre_name_trgm_idx'),
+        ]
         verbose_name = _('genre')
         verbose_name_plural = _('genres')
 
@@ -110,24 +177,71 @@ def check_positive(number) -> None:
         raise ValidationError(_('value has to be greater than zero'))
 
 
+def validate_book(attrs: dict) -> None:
+    if 'year' in attrs.keys():
+        validate_year(attrs['year'])
+    if 'price' in attrs.keys():
+        check_positive(attrs['price'])
+    if 'volume' in attrs.keys():
+        check_positive(attrs['volume'])
+    if 'created' in attrs.keys():
+        check_created(attrs['created'])
+    if 'modified' in attrs.keys():
+        check_modified(attrs['modified'])
+    if 'type' in attrs.keys():
+        if not any([option[0] == attrs['type'] for option in book_types]):
+            raise ValidationError(f'type {attrs["type"]} is unknown')
+
+
+BLOB_CHUNK_SIZE = 64 * 1024
+# listed in MINIO_PRIVATE_BUCKETS, book files were kept in the public static bucket before
+BOOK_FILE_BUCKET = 'books'
+LEGACY_BOOK_FILE_BUCKET = 'static'
+
+def blob_name(sha256: str, filename: str) -> str:
+    # the extension is kept so that content types can still be guessed from the name
+    return f'blobs/{sha256[:2]}/{sha256}{PurePosixPath(filename).suffix.lower()}'
+
+def hash_chunks(chunks) -> tuple[str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in chunks:
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+class ContentAddressedFileField(models.FileField):
+    # new files are stored once per content under their sha256, a known content is never uploaded again
+    def pre_save(self, model_instance, add):
+        file = getattr(model_instance, self.attname)
+        if file and not file._committed:
+            blob = Blob.objects.store(self.storage, file.file, file.name)
+            file.name = blob.name
+            file._committed = True
+        return file
+
+SEARCH_CONFIGS = ('russian', 'english')
+
+
 class BookManager(models.Manager):
-    def filter_by_author_name(self, author_name: str) -> None:
-        return self.get_queryset().filter(authors__full_name=author_name)
+    def filter_by_author_name(self, author_name: str) -> models.QuerySet:
+        # a semi-join keeps each book once however many of its authors match
+        authors = Author.objects.search(author_name).order_by().values('id')
+        return self.get_queryset().filter(
+            models.Exists(BookAuthor.objects.filter(book=models.OuterRef('pk'), author__in=authors)),
+        )
+
+    def search(self, query: str) -> models.QuerySet:
+        search_query = SearchQuery(query, config=SEARCH_CONFIGS[0], search_type='websearch')
+        for config in SEARCH_CONFIGS[1:]:
+            search_query |= SearchQuery(query, config=config, search_type='websearch')
+        # ts_rank is a real, casting keeps the rank exact when it round-trips through a page cursor
+        return self.get_queryset().filter(search_vector=search_query).annotate(
+            rank=Cast(SearchRank(models.F('search_vector'), search_query), models.FloatField()),
+        ).order_by('-rank')
     
     def create(self, **kwargs: Any) -> Any:
-        if 'year' in kwargs.keys():
-            validate_year(kwargs['year'])
-        if 'price' in kwargs.keys():
-            check_positive(kwargs['price'])
-        if 'volume' in kwargs.keys():
-            check_positive(kwargs['volume'])
-        if 'created' in kwargs.keys():
-            check_created(kwargs['created'])
-        if 'modified' in kwargs.keys():
-            check_modified(kwargs['modified'])
-        if 'type' in kwargs.keys():
-            if not any([option[0] == kwargs['type'] for option in book_types]):
-                raise ValidationError(f'type {kwargs["type"]} is unknown')
+        validate_book(kwargs)
         return super().create(**kwargs)
 
 
@@ -144,11 +258,14 @@ class Book(UUIDMixin, CreatedMixin, ModifiedMixin):
         default=0,
         validators=[check_positive]
     )
-    file = models.FileField(
+    file = ContentAddressedFileField(
         null=True, blank=True, 
-        storage=MinioBackend(bucket_name='static'),
+        # private: files go out through read/file/, which checks ownership first
+        storage=MinioBackend(bucket_name=BOOK_FILE_BUCKET),
         upload_to=iso_date_prefix,
     )
+    # maintained by the book_search_vector trigger from title and description
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
     objects = BookManager()
     genres = models.ManyToManyField(
         Genre, through='BookGenre',
@@ -159,6 +276,12 @@ class Book(UUIDMixin, CreatedMixin, ModifiedMixin):
         verbose_name=_('authors'),
     )
 
+    def save(self, *args, **kwargs) -> None:
+        # a deduplicated file's blob stays locked until the post_save signal has counted the reference,
+        # so collect_blobs cannot delete it in between
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
     @property
     def file_path(self):
         return str(self.file).split('/')[-1]
@@ -169,6 +292,11 @@ class Book(UUIDMixin, CreatedMixin, ModifiedMixin):
     class Meta:
         db_table = '"library"."book"'
         ordering = ['title', 'type', 'year']
+        indexes = [
+            models.Index(fields=['title', 'type', 'year', 'id'], name='book_keyset_idx'),
+            GinIndex(fields=['search_vector'], name='book_search_idx'),
+            GinIndex(fields=['title'], opclasses=['gin_trgm_ops'], name='book_title_trgm_idx'),
+        ]
         verbose_name = _('book')
         verbose_name_plural = _('books')
 
@@ -215,17 +343,92 @@ class BookAuthor(UUIDMixin, CreatedMixin):
         verbose_name = _('Relationship book author')
         verbose_name_plural = _('Relationships book author')
 
+def owned_books_cache_key(client_id) -> str:
+    return f'owned_books:{client_id}'
+
+def owned_books_cache_timeout() -> int:
+    return getattr(settings, 'OWNED_BOOKS_CACHE_TIMEOUT', 0)
+
+def forget_owned_books(client_ids) -> None:
+    if owned_books_cache_timeout():
+        keys = [owned_books_cache_key(client_id) for client_id in client_ids]
+        cache.delete_many(keys)
+        # a request between the change and its commit caches the old set again, forgotten on commit
+        if connection.in_atomic_block:
+            transaction.on_commit(partial(cache.delete_many, keys))
+
+
+class Ownership:
+    def __init__(self, client_id) -> None:
+        self.client_id = client_id
+        self._known: dict = {}
+        self._all: frozenset | None = None
+        if owned_books_cache_timeout():
+            self._all = cache.get(owned_books_cache_key(client_id))
+
+    def _query(self):
+        return BookClient.objects.filter(client_id=self.client_id)
+
+    def owns(self, book_id) -> bool:
+        if self._all is not None:
+            return book_id in self._all
+        if book_id not in self._known:
+            self._known[book_id] = self._query().filter(book_id=book_id).exists()
+        return self._known[book_id]
+
+    def owned_ids(self, book_ids=None) -> frozenset:
+        if book_ids is None:
+            if self._all is None:
+                self._all = frozenset(self._query().values_list('book_id', flat=True))
+                if owned_books_cache_timeout():
+                    cache.set(owned_books_cache_key(self.client_id), self._all, owned_books_cache_timeout())
+            return self._all
+        book_ids = list(book_ids)
+        if self._all is not None:
+            return self._all.intersection(book_ids)
+        unknown = [book_id for book_id in book_ids if book_id not in self._known]
+        if unknown:
+            owned = set(self._query().filter(book_id__in=unknown).values_list('book_id', flat=True))
+            self._known.update((book_id, book_id in owned) for book_id in unknown)
+        return frozenset(book_id for book_id in book_ids if self._known[book_id])
+
+    async def aowns(self, book_id) -> bool:
+        if self._all is not None:
+            return book_id in self._all
+        if book_id not in self._known:
+            self._known[book_id] = await self._query().filter(book_id=book_id).aexists()
+        return self._known[book_id]
+
+    async def aowned_ids(self, book_ids) -> frozenset:
+        book_ids = list(book_ids)
+        if self._all is not None:
+            return self._all.intersection(book_ids)
+        unknown = [book_id for book_id in book_ids if book_id not in self._known]
+        if unknown:
+            rows = self._query().filter(book_id__in=unknown).values_list('book_id', flat=True)
+            owned = {book_id async for book_id in rows}
+            self._known.update((book_id, book_id in owned) for book_id in unknown)
+        return frozenset(book_id for book_id in book_ids if self._known[book_id])
+
+
 class ClientManager(models.Manager):
     def create(self, **kwargs: Any) -> Any:
         if 'money' in kwargs.keys():
             check_positive(kwargs['money'])
-        return super().create(**kwargs)
+        client = super().create(**kwargs)
+        if client.money:
+            # money is the compacted ledger total, so the starting balance is an entry as well
+            LedgerEntry.objects.create(
+                client=client, kind=LedgerEntry.OPENING, amount=client.money, compacted=True,
+            )
+        return client
 
 class Client(CreatedMixin, ModifiedMixin):
     user = models.OneToOneField(
         AUTH_USER_MODEL,
         on_delete=models.CASCADE, primary_key=True,
     )
+    # the balance as of the last ledger compaction, see library_app.ledger
     money = models.DecimalField(
         verbose_name=_('money'),
         decimal_places=2,
@@ -238,6 +441,16 @@ class Client(CreatedMixin, ModifiedMixin):
 
     def __str__(self) -> str:
         return f'{self.user.username} ({self.user.first_name} {self.user.last_name})'
+
+    @cached_property
+    def ownership(self) -> Ownership:
+        return Ownership(self.pk)
+
+    def owns(self, book_id) -> bool:
+        return self.ownership.owns(book_id)
+
+    def owned_ids(self, book_ids=None) -> frozenset:
+        return self.ownership.owned_ids(book_ids)
     
     class Meta:
         db_table = '"library"."client"'
@@ -248,11 +461,157 @@ class Client(CreatedMixin, ModifiedMixin):
 class BookClient(UUIDMixin, CreatedMixin):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, verbose_name=_('book'))
     client = models.ForeignKey(Client, on_delete=models.CASCADE, verbose_name=_('client'))
+    price = models.DecimalField(
+        _('price'),
+        null=True, blank=True,
+        max_digits=11, decimal_places=2,
+    )
+    idempotency_key = models.TextField(_('idempotency key'), null=True, blank=True, max_length=NAMES_MAX_LENGTH)
 
     class Meta:
         db_table = '"library"."book_client"'
         unique_together = (
             ('book', 'client'),
         )
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'idempotency_key'], name='book_client_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['client', 'book'], name='book_client_owner_idx'),
+        ]
         verbose_name = _('relationship book client')
         verbose_name_plural = _('relationships book client')
+
+
+class Counter(models.Model):
+    name = models.TextField(_('name'), primary_key=True)
+    value = models.BigIntegerField(_('value'), default=0)
+
+    def __str__(self) -> str:
+        return f'{self.name}: {self.value}'
+
+    class Meta:
+        db_table = '"library"."counter"'
+        verbose_name = _('counter')
+        verbose_name_plural = _('counters')
+
+
+class LedgerEntry(CreatedMixin):
+    OPENING = 'opening'
+    TOP_UP = 'top_up'
+    PURCHASE = 'purchase'
+    REFUND = 'refund'
+    kinds = (
+        (OPENING, _('opening')),
+        (TOP_UP, _('top up')),
+        (PURCHASE, _('purchase')),
+        (REFUND, _('refund')),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    client = models.ForeignKey(
+        Client, on_delete=models.CASCADE, related_name='ledger_entries', verbose_name=_('client'),
+    )
+    kind = models.TextField(_('kind'), choices=kinds)
+    # signed, purchases are negative
+    amount = models.DecimalField(_('amount'), decimal_places=2, max_digits=11)
+    book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True, blank=True, verbose_name=_('book'))
+    # already folded into Client.money
+    compacted = models.BooleanField(_('compacted'), default=False)
+
+    def __str__(self) -> str:
+        return f'{self.client_id} {self.kind} {self.amount}'
+
+    class Meta:
+        db_table = '"library"."ledger_entry"'
+        indexes = [
+            models.Index(fields=['client'], condition=models.Q(compacted=False), name='ledger_entry_pending_idx'),
+        ]
+        verbose_name = _('ledger entry')
+        verbose_name_plural = _('ledger entries')
+
+
+class BookUpload(UUIDMixin, CreatedMixin, ModifiedMixin):
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, verbose_name=_('book'))
+    name = models.TextField(_('object name'))
+    sha256 = models.TextField(_('sha256'))
+    upload_id = models.TextField(_('upload id'))
+
+    def __str__(self) -> str:
+        return f'{self.book} - {self.name}'
+
+    class Meta:
+        db_table = '"library"."book_upload"'
+        indexes = [
+            models.Index(fields=['modified'], name='book_upload_modified_idx'),
+        ]
+        verbose_name = _('book upload')
+        verbose_name_plural = _('book uploads')
+
+
+class BookUploadPart(UUIDMixin, CreatedMixin):
+    upload = models.ForeignKey(BookUpload, on_delete=models.CASCADE, related_name='parts', verbose_name=_('upload'))
+    number = models.PositiveIntegerField(_('number'))
+    size = models.BigIntegerField(_('size'))
+    checksum = models.TextField(_('sha256'))
+    etag = models.TextField(_('etag'))
+
+    def __str__(self) -> str:
+        return f'{self.upload} #{self.number}'
+
+    class Meta:
+        db_table = '"library"."book_upload_part"'
+        ordering = ['number']
+        unique_together = (
+            ('upload', 'number'),
+        )
+        verbose_name = _('book upload part')
+        verbose_name_plural = _('book upload parts')
+
+
+class BlobManager(models.Manager):
+    def store(self, storage, content, filename: str) -> 'Blob':
+        content.seek(0)
+        sha256, size = hash_chunks(content.chunks(BLOB_CHUNK_SIZE))
+        blob = self.lock(sha256=sha256)
+        if blob is not None:
+            return blob
+        name = blob_name(sha256, filename)
+        if not storage.exists(name):
+            content.seek(0)
+            storage.save(name, content)
+        return self.select_for_update().get_or_create(sha256=sha256, defaults={'name': name, 'size': size})[0]
+
+    def lock(self, **lookup) -> 'Blob | None':
+        # held until the caller's transaction ends, a blob locked before it is referred to is not collected
+        return self.select_for_update().filter(**lookup).first()
+
+    def _add_references(self, name: str, delta: int) -> None:
+        if name:
+            self.filter(name=name).update(references=models.F('references') + delta, modified=get_datetime())
+
+    def retain(self, name: str) -> None:
+        self._add_references(name, 1)
+
+    def release(self, name: str) -> None:
+        self._add_references(name, -1)
+
+
+class Blob(CreatedMixin, ModifiedMixin):
+    sha256 = models.TextField(_('sha256'), primary_key=True)
+    name = models.TextField(_('object name'), unique=True)
+    size = models.BigIntegerField(_('size'))
+    # books whose file is this blob, kept by the Book signals
+    references = models.BigIntegerField(_('references'), default=0)
+    objects = BlobManager()
+
+    def __str__(self) -> str:
+        return f'{self.name} ({self.references})'
+
+    class Meta:
+        db_table = '"library"."blob"'
+        indexes = [
+            models.Index(fields=['references', 'modified'], name='blob_unreferenced_idx'),
+        ]
+        verbose_name = _('blob')
+        verbose_name_plural = _('blobs')
@@ -0,0 +1,266 @@
+import asyncio
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Model, Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+CURSOR_PARAM = 'cursor'
+COUNT_PARAM = 'count'
+FALSE_VALUES = ('0', 'false', 'no', 'off')
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+async def _alist(queryset: QuerySet) -> list:
+    return [row async for row in queryset]
+
+
+def count_requested(query_params) -> bool:
+    return query_params.get(COUNT_PARAM, '').lower() not in FALSE_VALUES
+
+
+def encode_cursor(values: Iterable, reverse: bool) -> str:
+    payload = json.dumps({'v': list(values), 'r': reverse}, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> tuple[list, bool]:
+    try:
+        payload = json.loads(urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return list(payload['v']), bool(payload['r'])
+    except (ValueError, TypeError, KeyError, Base64Error) as error:
+        raise InvalidCursor(token) from error
+
+
+class KeysetField:
+    def __init__(self, queryset: QuerySet, ordering: str) -> None:
+        self.descending = ordering.startswith('-')
+        self.name = ordering.lstrip('-')
+        if self.name in queryset.query.annotations:
+            # annotations used for ordering, such as a search rank, are expected to be non-null
+            self.attname = self.name
+            self.nullable = False
+            return
+        meta = queryset.model._meta
+        field = meta.pk if self.name == 'pk' else meta.get_field(self.name)
+        self.attname = field.attname
+        self.nullable = field.null
+
+    def order_by(self, reverse: bool) -> str:
+        return f'-{self.name}' if self.descending != reverse else self.name
+
+    def equal(self, value: Any) -> Q:
+        return Q(**{f'{self.name}__isnull': True}) if value is None else Q(**{self.name: value})
+
+    def after(self, value: Any, reverse: bool) -> Q:
+        # postgres puts NULLs last in ascending and first in descending order
+        descending = self.descending != reverse
+        if descending:
+            if value is None:
+                return Q(**{f'{self.name}__isnull': False})
+            return Q(**{f'{self.name}__lt': value})
+        if value is None:
+            return Q(pk__in=[])
+        after = Q(**{f'{self.name}__gt': value})
+        return after | Q(**{f'{self.name}__isnull': True}) if self.nullable else after
+
+    def bound(self, value: Any, reverse: bool) -> Q | None:
+        # a plain range on the leading column lets the planner start the index scan at the cursor
+        if value is None or self.nullable:
+            return None
+        lookup = 'lte' if self.descending != reverse else 'gte'
+        return Q(**{f'{self.name}__{lookup}': value})
+
+
+class KeysetPage:
+    is_keyset = True
+
+    def __init__(self, object_list: list, fields: list[KeysetField], has_next: bool,
+                 has_previous: bool, count: int | None) -> None:
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.count = count
+        self._fields = fields
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_other_pages(self) -> bool:
+        return self.has_next or self.has_previous
+
+    def _position(self, row) -> list:
+        # rows are model instances, or dicts keyed by attname for .values() querysets
+        if isinstance(row, dict):
+            return [row[field.attname] for field in self._fields]
+        return [getattr(row, field.attname) for field in self._fields]
+
+    @property
+    def next_cursor(self) -> str | None:
+        if not self.has_next or not self.object_list:
+            return None
+        return encode_cursor(self._position(self.object_list[-1]), reverse=False)
+
+    @property
+    def previous_cursor(self) -> str | None:
+        if not self.has_previous or not self.object_list:
+            return None
+        return encode_cursor(self._position(self.object_list[0]), reverse=True)
+
+
+def keyset_ordering(queryset: QuerySet, ordering: Iterable[str] | None = None) -> list[str]:
+    model = queryset.model
+    ordering = list(ordering or queryset.query.order_by or model._meta.ordering)
+    if not {'pk', model._meta.pk.name} & {name.lstrip('-') for name in ordering}:
+        ordering.append('pk')
+    return ordering
+
+
+def keyset_columns(queryset: QuerySet) -> list[str]:
+    # what a .values() queryset has to select for its page cursors
+    return [KeysetField(queryset, name).attname for name in keyset_ordering(queryset)]
+
+
+class KeysetPaginator:
+    def __init__(self, queryset: QuerySet, per_page: int, ordering: Iterable[str] | None = None,
+                 count: bool = True) -> None:
+        self.queryset = queryset
+        self.per_page = per_page
+        self.fields = [KeysetField(queryset, name) for name in keyset_ordering(queryset, ordering)]
+        self.count = count
+
+    def _seek(self, values: list, reverse: bool) -> Q:
+        if len(values) != len(self.fields):
+            raise InvalidCursor(values)
+        condition = Q(pk__in=[])
+        for position, field in enumerate(self.fields):
+            clause = field.after(values[position], reverse)
+            for previous, value in zip(self.fields[:position], values):
+                clause &= previous.equal(value)
+            condition |= clause
+        bound = self.fields[0].bound(values[0], reverse)
+        return condition & bound if bound is not None else condition
+
+    def _seek_queryset(self, cursor: str | None) -> tuple[QuerySet, list | None, bool]:
+        values, reverse = decode_cursor(cursor) if cursor else (None, False)
+        queryset = self.queryset.order_by(*[field.order_by(reverse) for field in self.fields])
+        if values is not None:
+            try:
+                queryset = queryset.filter(self._seek(values, reverse))
+            except (ValidationError, ValueError, TypeError) as error:
+                raise InvalidCursor(cursor) from error
+        return queryset[:self.per_page + 1], values, reverse
+
+    def _page(self, rows: list, values: list | None, reverse: bool, count: int | None) -> KeysetPage:
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+        return KeysetPage(
+            rows, self.fields,
+            has_next=True if reverse else has_more,
+            has_previous=has_more if reverse else values is not None,
+            count=count,
+        )
+
+    def get_page(self, cursor: str | None) -> KeysetPage:
+        queryset, values, reverse = self._seek_queryset(cursor)
+        return self._page(list(queryset), values, reverse, self.queryset.count() if self.count else None)
+
+    async def aget_page(self, cursor: str | None) -> KeysetPage:
+        queryset, values, reverse = self._seek_queryset(cursor)
+        # the rows and the total are independent queries, so they are awaited together
+        queries = [_alist(queryset)]
+        if self.count:
+            queries.append(self.queryset.acount())
+        rows, *count = await asyncio.gather(*queries)
+        return self._page(rows, values, reverse, count[0] if count else None)
+
+
+class KeysetPagination(pagination.BasePagination):
+    page_size = api_settings.PAGE_SIZE or 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = KeysetPaginator(
+            queryset, self.get_page_size(request), count=count_requested(request.query_params),
+        )
+        try:
+            self.page = paginator.get_page(request.query_params.get(CURSOR_PARAM))
+        except InvalidCursor:
+            raise NotFound('Invalid cursor')
+        return list(self.page)
+
+    def _link(self, cursor: str | None) -> str | None:
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), CURSOR_PARAM, cursor)
+
+    def get_paginated_response(self, data) -> Response:
+        return Response({
+            'count': self.page.count,
+            'next': self._link(self.page.next_cursor),
+            'previous': self._link(self.page.previous_cursor),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer', 'nullable': True},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+def estimated_count(model: type[Model], using: str = 'default') -> int | None:
+    # planner statistics kept by (auto)analyze, None for a table that has never been analyzed
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self) -> int:
+        # only an unfiltered queryset is the whole table, filtered ones are still counted
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
@@ -0,0 +1,174 @@
+from collections import deque
+from functools import partial
+from threading import BoundedSemaphore, Lock
+from time import monotonic
+
+from django.db import DatabaseError
+from django.db.backends.postgresql import base, creation
+from psycopg2 import extensions, extras
+
+_pools = {}
+_pools_lock = Lock()
+
+
+class PoolTimeout(DatabaseError):
+    pass
+
+
+class ConnectionPool:
+    # at most max_size connections are handed out, the rest wait up to timeout for one;
+    # idle connections past max_idle, beyond min_size, and any past max_lifetime are closed;
+    # one idle for check_idle seconds or more is pinged before it is handed out
+    def __init__(
+        self, connect, min_size=1, max_size=10, timeout=10, max_idle=600, max_lifetime=3600, check_idle=0,
+    ) -> None:
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_idle = check_idle
+        self._slots = BoundedSemaphore(max_size)
+        self._idle = deque()
+        self._created = {}
+        self._lock = Lock()
+
+    def _open(self):
+        connection = self.connect()
+        self._created[id(connection)] = monotonic()
+        return connection
+
+    def _discard(self, connection) -> None:
+        self._created.pop(id(connection), None)
+        if not connection.closed:
+            connection.close()
+
+    def _expired(self, connection, now: float) -> bool:
+        return connection.closed or now - self._created.get(id(connection), now) >= self.max_lifetime
+
+    def _alive(self, connection) -> bool:
+        # a restarted server or an idle timeout ends the backend without the client noticing,
+        # closed only turns true once a query fails
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except base.Database.Error:
+            return False
+        return True
+
+    def fill(self) -> None:
+        # opened up front, so the first requests after a start do not pay for connecting
+        connections = [self._open() for _ in range(self.min_size)]
+        with self._lock:
+            self._idle.extend((connection, monotonic()) for connection in connections)
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f'no connection was released within {self.timeout} seconds')
+        try:
+            now = monotonic()
+            while True:
+                with self._lock:
+                    # the most recently returned one, the others can age out
+                    connection, released = self._idle.pop() if self._idle else (None, None)
+                if connection is None:
+                    return self._open()
+                if not self._expired(connection, now) and (
+                    now - released < self.check_idle or self._alive(connection)
+                ):
+                    return connection
+                self._discard(connection)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, connection) -> None:
+        try:
+            if not connection.closed and connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            now = monotonic()
+            if self._expired(connection, now):
+                self._discard(connection)
+                return
+            with self._lock:
+                self._idle.append((connection, now))
+                stale = [
+                    item for item in list(self._idle)[:-self.min_size or None] if now - item[1] >= self.max_idle
+                ]
+                for item in stale:
+                    self._idle.remove(item)
+            for stale_connection, _ in stale:
+                self._discard(stale_connection)
+        except base.Database.Error:
+            self._discard(connection)
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for connection, _ in idle:
+            self._discard(connection)
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+
+def connect(conn_params: dict, isolation_level):
+    # what the postgresql backend does on connecting, without touching any wrapper
+    connection = base.Database.connect(**conn_params)
+    if isolation_level is not None and isolation_level != connection.isolation_level:
+        connection.set_session(isolation_level=isolation_level)
+    extras.register_default_jsonb(conn_or_curs=connection, loads=lambda value: value)
+    return connection
+
+
+def get_pool(wrapper, conn_params: dict) -> ConnectionPool:
+    # one pool per set of connection parameters, which the test database changes
+    key = (wrapper.alias, tuple(sorted((name, str(value)) for name, value in conn_params.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(
+                partial(connect, conn_params, wrapper.settings_dict['OPTIONS'].get('isolation_level')),
+                **wrapper.settings_dict.get('POOL', {}),
+            )
+            pool.fill()
+        return pool
+
+
+def close_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # idle pooled connections would keep the test database from being dropped
+        close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    # the postgresql backend with connections borrowed from a pool: connecting takes one,
+    # closing, at the end of every request with CONN_MAX_AGE = 0, gives it back
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(self, conn_params)
+        connection = self.pool.acquire()
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get('isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.release(self.connection)
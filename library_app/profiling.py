@@ -0,0 +1,263 @@
+import cProfile
+import logging
+import re
+import sys
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from random import random
+from threading import Event, Thread, get_ident
+from time import perf_counter
+from uuid import uuid4
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+CPROFILE = 'cprofile'
+SAMPLING = 'sampling'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+PROFILE_SUFFIXES = {CPROFILE: '.prof', SAMPLING: '.folded'}
+PROFILE_NAME_RE = re.compile(r'^[\w-]+\.(prof|folded)$')
+
+# a context variable rather than a connection wrapper, it follows the request into the
+# threads sync_to_async runs the queries of async views in
+_profiles: ContextVar[tuple] = ContextVar('query_profiles', default=())
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r'%s(?:\s*,\s*%s)+')
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint(sql: str) -> str:
+    # statements differing only in their values or the length of an IN list are the same statement
+    sql = _PLACEHOLDER_LISTS.sub('%s', _LITERALS.sub('%s', sql))
+    return _SPACES.sub(' ', sql).strip()
+
+
+class QueryProfile:
+    def __init__(self) -> None:
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def add(self, sql: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.statements[sql] += 1
+
+    @property
+    def duration_ms(self) -> float:
+        return self.duration * 1000
+
+    def repeated(self, threshold: int) -> dict[str, int]:
+        # fingerprinted once per distinct statement, not once per query
+        fingerprints = Counter()
+        for sql, count in self.statements.items():
+            fingerprints[fingerprint(sql)] += count
+        return {sql: count for sql, count in fingerprints.most_common() if count >= threshold}
+
+
+def record(execute, sql, params, many, context):
+    profiles = _profiles.get()
+    if not profiles:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = perf_counter() - start
+        for profile in profiles:
+            profile.add(sql, duration)
+
+
+def install(sender, connection, **kwargs):
+    # first, so that execute_wrapper contexts still pop their own wrapper off the end
+    if record not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record)
+
+
+@contextmanager
+def profile_queries():
+    profile = QueryProfile()
+    token = _profiles.set((*_profiles.get(), profile))
+    try:
+        yield profile
+    finally:
+        _profiles.reset(token)
+
+
+def server_timing(profile: QueryProfile, repeated: dict[str, int]) -> str:
+    metrics = [f'db;dur={profile.duration_ms:.1f};desc="{profile.count} queries"']
+    if repeated:
+        metrics.append(f'db-repeated;desc="{len(repeated)} statements, {sum(repeated.values())} queries"')
+    return ', '.join(metrics)
+
+
+def report(request, response, profile: QueryProfile) -> None:
+    repeated = profile.repeated(settings.SQL_PROFILE_REPEATED)
+    if settings.SQL_PROFILE_HEADERS:
+        timing = server_timing(profile, repeated)
+        response['Server-Timing'] = f'{response["Server-Timing"]}, {timing}' if response.has_header(
+            'Server-Timing',
+        ) else timing
+    if profile.count > settings.SQL_PROFILE_MAX_QUERIES or profile.duration_ms > settings.SQL_PROFILE_MAX_DURATION_MS:
+        logger.warning(
+            '%s %s ran %d queries in %.1f ms', request.method, request.path, profile.count, profile.duration_ms,
+        )
+    for sql, count in repeated.items():
+        logger.warning('%s %s ran the same statement %d times: %s', request.method, request.path, count, sql)
+
+
+class QueryProfileMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with profile_queries() as profile:
+            response = self.get_response(request)
+        report(request, response, profile)
+        return response
+
+    async def __acall__(self, request):
+        with profile_queries() as profile:
+            response = await self.get_response(request)
+        report(request, response, profile)
+        return response
+
+
+class StackSampler:
+    # samples the stack of one thread from another, the profiled code runs untouched;
+    # the result is in the folded format of flamegraph.pl and speedscope
+    def __init__(self, thread_id: int, interval: float) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f'{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if frames:
+                self.stacks[';'.join(reversed(frames))] += 1
+
+    def enable(self) -> None:
+        self._thread.start()
+
+    def disable(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def dump_stats(self, path: Path) -> None:
+        path.write_text(''.join(f'{stack} {count}\n' for stack, count in self.stacks.items()))
+
+
+def profile_requested(request) -> bool:
+    # a header lookup and, when sampling is configured, one random number: nothing else runs untriggered
+    token = request.META.get(PROFILE_HEADER)
+    if token is not None:
+        if settings.REQUEST_PROFILE_TOKEN and constant_time_compare(token, settings.REQUEST_PROFILE_TOKEN):
+            return True
+        user = getattr(request, 'user', None)
+        return bool(user and user.is_staff)
+    rate = settings.REQUEST_PROFILE_SAMPLE_RATE
+    return rate > 0 and random() < rate
+
+
+def profile_directory() -> Path:
+    directory = Path(settings.REQUEST_PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def stored_profiles() -> list[Path]:
+    # newest first
+    return sorted(
+        (path for path in profile_directory().iterdir() if PROFILE_NAME_RE.match(path.name)),
+        key=lambda path: path.name, reverse=True,
+    )
+
+
+def profile_path(name: str) -> Path | None:
+    if not PROFILE_NAME_RE.match(name):
+        return None
+    path = profile_directory() / name
+    return path if path.is_file() else None
+
+
+def start_profiler():
+    profiler = StackSampler(get_ident(), settings.REQUEST_PROFILE_INTERVAL) if (
+        settings.REQUEST_PROFILER == SAMPLING
+    ) else cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # python 3.12 allows a single cProfile at a time, a concurrent request goes unprofiled
+        return None
+    return profiler
+
+
+def store_profile(request, response, profiler) -> None:
+    profiler.disable()
+    name = f'{timezone.now():%Y%m%d-%H%M%S}-{uuid4().hex[:8]}{PROFILE_SUFFIXES[settings.REQUEST_PROFILER]}'
+    profiler.dump_stats(profile_directory() / name)
+    response[PROFILE_ID_HEADER] = name
+    logger.info('%s %s profiled into %s', request.method, request.path, name)
+    for stale in stored_profiles()[settings.REQUEST_PROFILE_KEEP:]:
+        stale.unlink(missing_ok=True)
+
+
+class RequestProfilerMiddleware:
+    # under asgi an async view is profiled on the event loop thread, so other requests served
+    # meanwhile show up as well and the queries sync_to_async runs elsewhere do not
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profiler = start_profiler() if profile_requested(request) else None
+        if profiler is None:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            profiler.disable()
+            raise
+        store_profile(request, response, profiler)
+        return response
+
+    async def __acall__(self, request):
+        profiler = start_profiler() if profile_requested(request) else None
+        if profiler is None:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            profiler.disable()
+            raise
+        store_profile(request, response, profiler)
+        return response
@@ -0,0 +1,95 @@
+from decimal import Decimal
+from typing import NamedTuple
+from uuid import uuid4
+
+from django.db import connection, transaction
+
+from . import counters, ledger
+from .models import Book, BookClient, LedgerEntry, forget_owned_books
+
+PURCHASED = 'purchased'
+ALREADY_OWNED = 'already_owned'
+INSUFFICIENT_FUNDS = 'insufficient_funds'
+KEY_REUSED = 'idempotency_key_reused'
+UNKNOWN_BOOK = 'unknown_book'
+
+BOOK_CLIENT_TABLE = BookClient._meta.db_table
+BOOK_TABLE = Book._meta.db_table
+
+# ON CONFLICT covers both the (book, client) and the (client, idempotency_key) constraints
+INSERT_OWNERSHIP = f'''
+    INSERT INTO {BOOK_CLIENT_TABLE} (id, book_id, client_id, created, price, idempotency_key)
+    SELECT %s, book.id, %s, now(), book.price, %s FROM {BOOK_TABLE} book WHERE book.id = %s
+    ON CONFLICT DO NOTHING
+    RETURNING price
+'''
+
+# rows from before prices were recorded, or added through client.books and the admin, have none;
+# the book's current price is refunded for them
+# an owned book without a price was granted, not bought, and gives nothing back
+RETURN_OWNERSHIP = f'''
+    DELETE FROM {BOOK_CLIENT_TABLE} WHERE client_id = %s AND book_id = %s
+    RETURNING coalesce(price, 0)
+'''
+
+
+class PurchaseResult(NamedTuple):
+    status: str
+    balance: Decimal | None = None
+    replayed: bool = False
+
+    @property
+    def owned(self) -> bool:
+        return self.status in (PURCHASED, ALREADY_OWNED)
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+def _existing(client_id, book_id, idempotency_key) -> PurchaseResult:
+    if idempotency_key is not None:
+        previous = BookClient.objects.filter(client_id=client_id, idempotency_key=idempotency_key).first()
+        if previous is not None:
+            if previous.book_id != book_id:
+                return PurchaseResult(KEY_REUSED)
+            return PurchaseResult(PURCHASED, replayed=True)
+    if BookClient.objects.filter(client_id=client_id, book_id=book_id).exists():
+        return PurchaseResult(ALREADY_OWNED)
+    return PurchaseResult(UNKNOWN_BOOK)
+
+
+def purchase(client_id, book_id, idempotency_key: str | None = None) -> PurchaseResult:
+    # the ownership row is inserted first: its unique index serialises concurrent attempts
+    # on the same book, and the charge can never run twice for one row
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(INSERT_OWNERSHIP, [uuid4(), client_id, idempotency_key, book_id])
+            inserted = cursor.fetchone()
+            if inserted is None:
+                return _existing(client_id, book_id, idempotency_key)
+            price = inserted[0]
+            balance = ledger.charge(client_id, price, book_id)
+            if balance is None:
+                raise InsufficientFunds(client_id)
+            # sharded by client: purchases of different clients do not wait for one counter row
+            counters.increment_sharded(BookClient, client_id)
+    except InsufficientFunds:
+        return PurchaseResult(INSUFFICIENT_FUNDS)
+    forget_owned_books([client_id])
+    return PurchaseResult(PURCHASED, balance=balance)
+
+
+def refund(client_id, book_id) -> Decimal | None:
+    # the price paid, None when the client does not own the book
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(RETURN_OWNERSHIP, [client_id, book_id])
+        returned = cursor.fetchone()
+        if returned is None:
+            return None
+        price = returned[0]
+        if price:
+            LedgerEntry.objects.create(client_id=client_id, kind=LedgerEntry.REFUND, amount=price, book_id=book_id)
+        counters.increment_sharded(BookClient, client_id, -1)
+    forget_owned_books([client_id])
+    return price
@@ -0,0 +1,149 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import cycle
+from time import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .models import Author, Book, BookAuthor, BookGenre, Counter, Genre
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# set on the client after a write, its requests read from the primary until the replicas catch up
+PRIMARY_COOKIE = 'read_primary'
+# reads that may lag behind the primary by DATABASE_REPLICA_LAG seconds
+CATALOG_MODELS = frozenset((Book, Author, Genre, BookAuthor, BookGenre, Counter))
+
+
+class ReadState:
+    def __init__(self, pinned: bool) -> None:
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+
+# replicas are only read inside a request, scripts and commands stay on the primary
+_state: ContextVar[ReadState | None] = ContextVar('read_state', default=None)
+_orders = {}
+
+
+def weighted_order(weights: dict[str, int]) -> list[str]:
+    # smooth weighted round robin: 2:1 gives a, b, a rather than a, a, b
+    current = dict.fromkeys(weights, 0)
+    total = sum(weights.values())
+    order = []
+    for _ in range(total):
+        for alias, weight in weights.items():
+            current[alias] += weight
+        chosen = max(current, key=current.get)
+        current[chosen] -= total
+        order.append(chosen)
+    return order
+
+
+def next_replica() -> str:
+    key = tuple(settings.DATABASE_REPLICAS.items())
+    order = _orders.get(key)
+    if order is None:
+        order = _orders[key] = cycle(weighted_order(settings.DATABASE_REPLICAS))
+    return next(order)
+
+
+@contextmanager
+def request_scope(pinned: bool = False):
+    state = ReadState(pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    state = _state.get()
+    if state is None or state.pinned:
+        yield
+        return
+    state.pinned = True
+    try:
+        yield
+    finally:
+        state.pinned = False
+
+
+def is_recent(timestamp: float) -> bool:
+    # timestamps are rounded to the millisecond and may lie just ahead, no lag trusts them regardless
+    lag = settings.DATABASE_REPLICA_LAG
+    return bool(settings.DATABASE_REPLICAS) and lag > 0 and time() - timestamp < lag
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS:
+            return None
+        state = _state.get()
+        if (
+            state is None or state.pinned or state.wrote or model not in CATALOG_MODELS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        # one replica for the whole request, so its pages are consistent with each other
+        if state.replica is None:
+            state.replica = next_replica()
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def pinned(request) -> bool:
+    return request.method not in SAFE_METHODS or PRIMARY_COOKIE in request.COOKIES
+
+
+def remember_write(state: ReadState, response) -> None:
+    if state.wrote:
+        response.set_cookie(
+            PRIMARY_COOKIE, '1', max_age=settings.DATABASE_REPLICA_LAG, httponly=True, samesite='Lax',
+        )
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        with request_scope(pinned(request)) as state:
+            response = self.get_response(request)
+        remember_write(state, response)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        with request_scope(pinned(request)) as state:
+            response = await self.get_response(request)
+        remember_write(state, response)
+        return response
@@ -1,16 +1,70 @@
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Book, Genre, Author
+from .models import Book, BookUpload, BookUploadPart, Genre, Author
 
-class BookSerializer(serializers.HyperlinkedModelSerializer):
-    class Meta:
-        model = Book
-        fields = [
-            'id', 'title', 'description',
-            'volume', 'type', 'year',
-            'created', 'modified',
-        ]
+FIELDS_CONTEXT = 'fields'
+
+class SparseFieldsMixin:
+    # drops the fields left out of a ?fields= request, None keeps them all
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get(FIELDS_CONTEXT)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+def datetime_formatter(tz):
+    # what serializers.DateTimeField renders by default
+    def format_datetime(value):
+        if value is None:
+            return None
+        value = value.astimezone(tz).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return format_datetime
 
-class GenreSerializer(serializers.HyperlinkedModelSerializer):
+def uuid_formatter(tz):
+    return lambda value: None if value is None else str(value)
+
+# fields whose representation a renderer reproduces from the raw column value
+VALUE_FIELDS = (
+    serializers.UUIDField, serializers.CharField, serializers.IntegerField, serializers.ChoiceField,
+    serializers.DateTimeField,
+)
+
+class ValuesSerializer:
+    # list rows built straight from .values(), without a DRF field per value
+    def __init__(self, columns: list[str], converters: dict) -> None:
+        self.columns = columns
+        self.converters = converters
+
+    @classmethod
+    def for_serializer(cls, serializer) -> 'ValuesSerializer | None':
+        # None unless every field is a plain column, such as an expanded relation
+        model = serializer.Meta.model
+        columns, converters = [], {}
+        for name, field in serializer.fields.items():
+            if type(field) not in VALUE_FIELDS or field.source != name or name not in model._meta._forward_fields_map:
+                return None
+            columns.append(name)
+            if isinstance(field, serializers.DateTimeField):
+                converters[name] = datetime_formatter
+            elif isinstance(field, serializers.UUIDField):
+                converters[name] = uuid_formatter
+        return cls(columns, converters)
+
+    def to_representation(self, rows) -> list[dict]:
+        # the time zone is looked up once per page, DateTimeField does it per value
+        tz = timezone.get_current_timezone()
+        converters = [(name, make(tz)) for name, make in self.converters.items()]
+        items = []
+        for row in rows:
+            item = {name: row[name] for name in self.columns}
+            for name, convert in converters:
+                item[name] = convert(item[name])
+            items.append(item)
+        return items
+
+class GenreSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Genre
         fields = [
@@ -18,10 +72,55 @@ class GenreSerializer(serializers.HyperlinkedModelSerializer):
             'created', 'modified',
         ]
 
-class AuthorSerializer(serializers.HyperlinkedModelSerializer):
+class AuthorSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Author
         fields = [
             'id', 'full_name',
             'created', 'modified',
-        ]
\ No newline at end of file
+        ]
+
+EXPAND_CONTEXT = 'expand'
+
+class BookSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
+    authors = serializers.SerializerMethodField()
+    genres = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Book
+        fields = [
+            'id', 'title', 'description',
+            'volume', 'type', 'year',
+            'created', 'modified',
+            'authors', 'genres',
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = self.context.get(EXPAND_CONTEXT, ())
+        for name in ('authors', 'genres'):
+            if name not in expand:
+                self.fields.pop(name, None)
+
+    # both read the prefetched through rows, see BOOK_EXPANSIONS in views
+    def get_authors(self, book):
+        return AuthorSerializer([link.author for link in book.bookauthor_set.all()], many=True).data
+
+    def get_genres(self, book):
+        return GenreSerializer([link.genre for link in book.bookgenre_set.all()], many=True).data
+
+
+class BookUploadPartSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BookUploadPart
+        fields = ['number', 'size', 'checksum', 'created']
+
+class BookUploadSerializer(serializers.ModelSerializer):
+    filename = serializers.CharField(write_only=True, max_length=255)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$')
+    parts = BookUploadPartSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = BookUpload
+        fields = ['id', 'book', 'filename', 'sha256', 'name', 'parts', 'created', 'modified']
+        read_only_fields = ['name']
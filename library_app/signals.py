@@ -0,0 +1,127 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import catalog_cache, counters, profiling
+from .models import (
+    Author, Blob, Book, BookAuthor, BookClient, BookGenre, Client, Genre, forget_owned_books, touch_books,
+)
+
+
+def count_created(sender, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.increment(sender)
+
+
+def count_deleted(sender, **kwargs):
+    counters.decrement(sender)
+
+
+for counted_model in counters.COUNTED_MODELS:
+    post_save.connect(count_created, sender=counted_model, dispatch_uid=f'count_created_{counted_model.__name__}')
+    post_delete.connect(count_deleted, sender=counted_model, dispatch_uid=f'count_deleted_{counted_model.__name__}')
+
+
+@receiver(m2m_changed, sender=BookAuthor)
+@receiver(m2m_changed, sender=BookGenre)
+@receiver(m2m_changed, sender=BookClient)
+def count_added_relations(sender, action, pk_set, **kwargs):
+    # related managers insert through rows with bulk_create, which skips post_save;
+    # removal goes through QuerySet.delete, which sends post_delete per row
+    if action == 'post_add' and pk_set:
+        counters.increment(sender, len(pk_set))
+
+
+@receiver(post_save, sender=BookClient)
+@receiver(post_delete, sender=BookClient)
+def forget_client_books(sender, instance, **kwargs):
+    forget_owned_books([instance.client_id])
+
+
+@receiver(m2m_changed, sender=BookClient)
+def forget_added_client_books(sender, instance, action, pk_set, **kwargs):
+    if action != 'post_add':
+        return
+    if isinstance(instance, Client):
+        instance.__dict__.pop('ownership', None)
+        forget_owned_books([instance.pk])
+    elif pk_set:
+        forget_owned_books(pk_set)
+
+
+@receiver(post_save, sender=BookAuthor)
+@receiver(post_delete, sender=BookAuthor)
+@receiver(post_save, sender=BookGenre)
+@receiver(post_delete, sender=BookGenre)
+def touch_linked_book(sender, instance, raw=False, **kwargs):
+    # a book's authors and genres are part of its representation, so linking them modifies it
+    if not raw:
+        touch_books([instance.book_id])
+
+
+@receiver(m2m_changed, sender=BookAuthor)
+@receiver(m2m_changed, sender=BookGenre)
+def touch_added_books(sender, instance, action, pk_set, **kwargs):
+    if action != 'post_add':
+        return
+    if isinstance(instance, Book):
+        touch_books([instance.pk])
+    elif pk_set:
+        touch_books(pk_set)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def forget_cached_entity(sender, instance, **kwargs):
+    catalog_cache.bump_instances(sender._meta.model_name, [instance.pk])
+
+
+LINKED_NAMES = {BookAuthor: 'author', BookGenre: 'genre'}
+
+
+@receiver(post_save, sender=BookAuthor)
+@receiver(post_delete, sender=BookAuthor)
+@receiver(post_save, sender=BookGenre)
+@receiver(post_delete, sender=BookGenre)
+def forget_cached_link(sender, instance, **kwargs):
+    name = LINKED_NAMES[sender]
+    catalog_cache.bump_instances('book', [instance.book_id])
+    catalog_cache.bump_instances(name, [getattr(instance, f'{name}_id')])
+
+
+@receiver(m2m_changed, sender=BookAuthor)
+@receiver(m2m_changed, sender=BookGenre)
+def forget_cached_links(sender, instance, action, model, pk_set, **kwargs):
+    if action == 'post_add' and pk_set:
+        catalog_cache.bump_instances(instance._meta.model_name, [instance.pk])
+        catalog_cache.bump_instances(model._meta.model_name, pk_set)
+
+
+@receiver(post_init, sender=Book)
+def remember_stored_file(sender, instance, **kwargs):
+    # the raw column value, None when the field was deferred
+    instance._stored_file = str(instance.__dict__['file'] or '') if 'file' in instance.__dict__ else None
+
+
+@receiver(post_save, sender=Book)
+def count_blob_references(sender, instance, created, raw=False, **kwargs):
+    previous = '' if created else instance._stored_file
+    current = instance.file.name or ''
+    if raw or previous is None or previous == current:
+        return
+    Blob.objects.retain(current)
+    Blob.objects.release(previous)
+    instance._stored_file = current
+
+
+@receiver(post_delete, sender=Book)
+def release_blob(sender, instance, **kwargs):
+    stored = instance._stored_file
+    Blob.objects.release(instance.file.name if stored is None else stored)
+
+
+connection_created.connect(profiling.install, dispatch_uid='profile_queries')
@@ -0,0 +1,260 @@
+import hashlib
+import mimetypes
+from datetime import timedelta
+from tempfile import SpooledTemporaryFile
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.base import File
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django_minio_backend import MinioBackend
+from minio.commonconfig import CopySource
+from minio.datatypes import Part
+from minio.error import S3Error
+
+from . import delivery, metrics
+from .models import (
+    LEGACY_BOOK_FILE_BUCKET, Blob, Book, BookUpload, BookUploadPart, blob_name, get_datetime, hash_chunks,
+)
+
+CHUNK_SIZE = 64 * 1024
+MAX_PART_NUMBER = 10000
+# parts are spooled to disk past this size while they are hashed
+SPOOL_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+class ChecksumMismatch(UploadError):
+    pass
+
+
+def book_storage():
+    return Book._meta.get_field('file').storage
+
+
+class MultipartBackend:
+    # maps uploads onto S3 multipart uploads, minio only exposes them through its private api
+    def __init__(self, storage: MinioBackend) -> None:
+        self.storage = storage
+        self.client = storage.client
+
+    def create(self, name: str) -> str:
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        return self.client._create_multipart_upload(self.storage.bucket, name, {'Content-Type': content_type})
+
+    def put_part(self, upload: BookUpload, number: int, file, size: int) -> str:
+        # the client signs the payload, so one part is held in memory, never the whole file
+        return self.client._upload_part(
+            self.storage.bucket, upload.name, file.read(size), None, upload.upload_id, number,
+        )
+
+    def complete(self, upload: BookUpload, parts: list[BookUploadPart]) -> str:
+        try:
+            self.client._complete_multipart_upload(
+                self.storage.bucket, upload.name, upload.upload_id,
+                [Part(part.number, part.etag) for part in parts],
+            )
+        except S3Error as error:
+            # such as parts below the 5 MiB minimum, the upload stays open for another try
+            raise UploadError(error.message) from error
+        return upload.name
+
+    def abort(self, upload: BookUpload, parts: list[BookUploadPart]) -> None:
+        self.client._abort_multipart_upload(self.storage.bucket, upload.name, upload.upload_id)
+
+
+class PartsFile(File):
+    # reads the stored parts one after another, so assembling never loads more than a chunk
+    def __init__(self, storage, names: list[str], name: str) -> None:
+        super().__init__(None, name)
+        self.storage = storage
+        self.names = names
+
+    def chunks(self, chunk_size=None):
+        for name in self.names:
+            with self.storage.open(name, 'rb') as part:
+                yield from part.chunks(chunk_size or CHUNK_SIZE)
+
+
+class StoragePartsBackend:
+    # any django storage: parts are kept as separate objects and concatenated on completion
+    def __init__(self, storage) -> None:
+        self.storage = storage
+
+    def create(self, name: str) -> str:
+        return uuid4().hex
+
+    @staticmethod
+    def part_name(upload: BookUpload, number: int) -> str:
+        return f'uploads/{upload.upload_id}/{number:05}'
+
+    def put_part(self, upload: BookUpload, number: int, file, size: int) -> str:
+        name = self.part_name(upload, number)
+        if self.storage.exists(name):
+            self.storage.delete(name)
+        self.storage.save(name, File(file, name))
+        return name
+
+    def complete(self, upload: BookUpload, parts: list[BookUploadPart]) -> str:
+        names = [self.part_name(upload, part.number) for part in parts]
+        # the name is a content address, a leftover object under it is replaced rather than renamed
+        if self.storage.exists(upload.name):
+            self.storage.delete(upload.name)
+        name = self.storage.save(upload.name, PartsFile(self.storage, names, upload.name))
+        self.abort(upload, parts)
+        return name
+
+    def abort(self, upload: BookUpload, parts: list[BookUploadPart]) -> None:
+        for part in parts:
+            self.storage.delete(self.part_name(upload, part.number))
+
+
+def get_backend(storage=None):
+    storage = storage or book_storage()
+    if isinstance(storage, MinioBackend):
+        return MultipartBackend(storage)
+    return StoragePartsBackend(storage)
+
+
+def attach(book: Book, blob: Blob) -> Book:
+    book.file = blob.name
+    book.save(update_fields=['file'])
+    return book
+
+
+def initiate(book: Book, filename: str, sha256: str) -> BookUpload | None:
+    # None when the content is already stored, the book is then attached without any upload
+    sha256 = sha256.lower()
+    with transaction.atomic():
+        blob = Blob.objects.lock(sha256=sha256)
+        if blob is not None:
+            attach(book, blob)
+            return None
+    name = blob_name(sha256, filename)
+    return BookUpload.objects.create(book=book, name=name, sha256=sha256, upload_id=get_backend().create(name))
+
+
+def spool(stream, limit: int) -> tuple[SpooledTemporaryFile, int, str]:
+    file = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := stream.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > limit:
+            file.close()
+            raise UploadError(f'part is larger than {limit} bytes')
+        digest.update(chunk)
+        file.write(chunk)
+    file.seek(0)
+    return file, size, digest.hexdigest()
+
+
+def put_part(upload: BookUpload, number: int, stream, checksum: str) -> BookUploadPart:
+    if not 1 <= number <= MAX_PART_NUMBER:
+        raise UploadError(f'part number must be between 1 and {MAX_PART_NUMBER}')
+    file, size, digest = spool(stream, settings.BOOK_UPLOAD_MAX_PART_SIZE)
+    with file:
+        if digest != checksum.lower():
+            raise ChecksumMismatch(f'sha256 of part {number} is {digest}')
+        with metrics.timed(metrics.STORAGE_SECONDS, operation='put_part'):
+            etag = get_backend().put_part(upload, number, file, size)
+    part, _ = BookUploadPart.objects.update_or_create(
+        upload=upload, number=number,
+        defaults={'size': size, 'checksum': digest, 'etag': etag},
+    )
+    # keeps the upload from being collected as abandoned while parts still arrive
+    upload.save(update_fields=['modified'])
+    return part
+
+
+def complete(upload: BookUpload) -> Book:
+    parts = list(upload.parts.all())
+    if not parts or [part.number for part in parts] != list(range(1, len(parts) + 1)):
+        raise UploadError('parts must be numbered from 1 without gaps')
+    backend = get_backend()
+    # the blob is locked from the lookup until the book refers to it
+    with transaction.atomic():
+        blob = Blob.objects.lock(sha256=upload.sha256)
+        if blob is not None:
+            # the same content was completed by another upload in the meantime
+            with metrics.timed(metrics.STORAGE_SECONDS, operation='abort'):
+                backend.abort(upload, parts)
+            book = attach(upload.book, blob)
+            upload.delete()
+            return book
+    with metrics.timed(metrics.STORAGE_SECONDS, operation='complete'):
+        name = backend.complete(upload, parts)
+    storage = book_storage()
+    sha256, size = hash_chunks(delivery.read_chunks(storage, name, 0, storage.size(name)))
+    if sha256 != upload.sha256:
+        storage.delete(name)
+        upload.delete()
+        raise ChecksumMismatch(f'sha256 of the file is {sha256}')
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().get_or_create(sha256=sha256, defaults={'name': name, 'size': size})[0]
+        book = attach(upload.book, blob)
+        upload.delete()
+    return book
+
+
+def abort(upload: BookUpload) -> None:
+    parts = list(upload.parts.all())
+    with metrics.timed(metrics.STORAGE_SECONDS, operation='abort'):
+        get_backend().abort(upload, parts)
+    upload.delete()
+
+
+def cleanup(older_than: timedelta) -> int:
+    abandoned = BookUpload.objects.filter(modified__lt=get_datetime() - older_than)
+    count = 0
+    for upload in abandoned.iterator():
+        abort(upload)
+        count += 1
+    return count
+
+
+def collect_blobs(older_than: timedelta) -> int:
+    # the anti-join guards against reference counts missed by queryset updates
+    unreferenced = Blob.objects.filter(
+        references__lte=0, modified__lt=get_datetime() - older_than,
+    ).exclude(Exists(Book.objects.filter(file=OuterRef('name'))))
+    storage = book_storage()
+    count = 0
+    for blob in unreferenced.iterator():
+        with transaction.atomic():
+            # waits for whoever is attaching the blob, then rechecks both the count and the books,
+            # in a statement of its own so that its snapshot includes the book they committed
+            locked = Blob.objects.lock(pk=blob.pk, references__lte=0)
+            if locked is None or Book.objects.filter(file=locked.name).exists():
+                continue
+            locked.delete()
+            storage.delete(locked.name)
+            count += 1
+    return count
+
+
+def move_book_files(source: str = LEGACY_BOOK_FILE_BUCKET, delete: bool = False) -> int:
+    # copies the files books and blobs refer to out of the bucket they were stored in before
+    storage = book_storage()
+    if not isinstance(storage, MinioBackend):
+        raise UploadError('book files are not stored in minio')
+    names = set(Blob.objects.values_list('name', flat=True))
+    names.update(Book.objects.exclude(file='').exclude(file=None).values_list('file', flat=True))
+    moved = 0
+    for name in sorted(names):
+        try:
+            storage.client.stat_object(source, name)
+        except S3Error as error:
+            if error.code == 'NoSuchKey':
+                continue
+            raise
+        if not storage.exists(name):
+            storage.client.copy_object(storage.bucket, name, CopySource(source, name))
+            moved += 1
+        if delete:
+            storage.client.remove_object(source, name)
+    return moved
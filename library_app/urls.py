@@ -6,6 +6,7 @@ router = routers.DefaultRouter()
 router.register(r'books', views.BookViewSet)
 router.register(r'genres', views.GenreViewSet)
 router.register(r'authors', views.AuthorViewSet)
+router.register(r'uploads', views.BookUploadViewSet)
 
 urlpatterns = [
     path('', views.home_page, name='homepage'),
@@ -22,4 +23,8 @@ urlpatterns = [
     path('profile/', views.profile, name='profile'),
     path('buy/', views.buy, name='buy'),
     path('read/', views.read, name='read'),
+    path('read/file/', views.read_file, name='read_file'),
+    path('metrics', views.export_metrics, name='metrics'),
+    path('profiles/', views.list_profiles, name='profiles'),
+    path('profiles/<str:name>', views.download_profile, name='profile_download'),
 ]
\ No newline at end of file
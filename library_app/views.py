@@ -1,70 +1,194 @@
+import asyncio
+from functools import partial, wraps
+from io import BytesIO
 from typing import Any
+from uuid import uuid4
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, JsonResponse
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from django.views.generic import ListView
-from django.core import paginator as django_paginator, exceptions
-from rest_framework import viewsets, permissions, authentication
-from django.contrib.auth import decorators, mixins
+from django.core import exceptions
+from asgiref.sync import sync_to_async
+from django.db.models import Exists, OuterRef, Prefetch
+from rest_framework import viewsets, permissions, authentication, status
+from rest_framework import exceptions as rest_exceptions, mixins as rest_mixins
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from django.contrib.auth import decorators, get_user
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.views import redirect_to_login
 
-from .serializers import BookSerializer, AuthorSerializer, GenreSerializer
-from .models import Book, Genre, Author, Client
+from . import bulk, catalog_cache, conditional, counters, delivery, ledger, metrics, profiling, purchases, uploads
+from .serializers import (
+    EXPAND_CONTEXT, FIELDS_CONTEXT, ValuesSerializer, BookSerializer, AuthorSerializer, GenreSerializer, BookUploadSerializer, BookUploadPartSerializer,
+)
+from .models import Book, BookAuthor, BookClient, BookGenre, BookUpload, Genre, Author, Client, Ownership
 from .forms import RegistrationForm, AddFundsForm
+from .pagination import (
+    CURSOR_PARAM, InvalidCursor, KeysetPaginator, KeysetPagination, count_requested, keyset_columns,
+)
 
-def home_page(request):
+async def resolve_user(request):
+    # request.user is lazy and would hit the session and user tables from the event loop
+    request.user = await sync_to_async(get_user)(request)
+    return request.user
+
+def async_login_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not (await resolve_user(request)).is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+async def home_page(request):
+    await resolve_user(request)
+    counts = await counters.aget_counts(Book, Author, Genre)
     return render(
         request,
         'index.html',
         {
-            'books': Book.objects.count(),
-            'authors': Author.objects.count(),
-            'genres': Genre.objects.count(),
+            'books': counts['book'],
+            'authors': counts['author'],
+            'genres': counts['genre'],
         }
     )
 
-def create_listview(model_class, plural_name, template):
-    class CustomListView(mixins.LoginRequiredMixin, ListView):
+SEARCH_PARAM = 'q'
+
+def search(model_class, queryset, query_params):
+    query = query_params.get(SEARCH_PARAM, '').strip()
+    if query and hasattr(model_class.objects, 'search'):
+        return model_class.objects.search(query)
+    return queryset
+
+def only_columns(queryset, names):
+    # the ordering is loaded as well, keyset cursors are built from it
+    meta = queryset.model._meta
+    columns = []
+    for name in [*names, *(name.lstrip('-') for name in queryset.query.order_by or meta.ordering)]:
+        try:
+            field = meta.get_field(name)
+        except exceptions.FieldDoesNotExist:
+            continue
+        if field.concrete and not field.many_to_many:
+            columns.append(name)
+    return queryset.only(*columns)
+
+def create_listview(model_class, plural_name, template, columns):
+    class CustomListView(ListView):
         model = model_class
         template_name = template
         paginate_by = 10
         context_object_name = plural_name
 
+        async def get(self, request, *args, **kwargs):
+            if not (await resolve_user(request)).is_authenticated:
+                return redirect_to_login(request.get_full_path())
+            self.object_list = self.get_queryset()
+            if self.page_kwarg in request.GET:
+                # numbered pages go through Paginator, which has no async counterpart
+                self.pagination = await sync_to_async(self.get_numbered_page)(self.object_list)
+            else:
+                self.pagination = await self.get_keyset_page(self.object_list)
+            context = self.get_context_data()
+            if model_class == Book:
+                ownership = Ownership(request.user.pk)
+                context['owned_books'] = await ownership.aowned_ids(book.id for book in context['page_obj'])
+            return self.render_to_response(context)
+
+        def get_queryset(self):
+            # only what the template shows, descriptions and file paths stay in the database
+            return only_columns(search(model_class, super().get_queryset(), self.request.GET), columns)
+
+        def paginate_queryset(self, queryset, page_size):
+            return self.pagination
+
+        def get_numbered_page(self, queryset):
+            paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, self.paginate_by)
+            # the rows are fetched here, templates render outside of this thread
+            page.object_list = list(object_list)
+            return paginator, page, page.object_list, is_paginated
+
+        async def get_keyset_page(self, queryset):
+            paginator = KeysetPaginator(queryset, self.paginate_by, count=count_requested(self.request.GET))
+            # the page is shared between users, per user bits such as owned_books are added in get
+            page = await catalog_cache.acached(
+                (model_class._meta.model_name, 'list', self.paginate_by, self.request.GET.urlencode()),
+                [(model_class._meta.model_name,)],
+                partial(self.aget_keyset_page, paginator),
+            )
+            return paginator, page, page.object_list, page.has_other_pages()
+
+        async def aget_keyset_page(self, paginator):
+            try:
+                return await paginator.aget_page(self.request.GET.get(CURSOR_PARAM))
+            except InvalidCursor:
+                return await paginator.aget_page(None)
+
         def get_context_data(self, **kwargs: Any) -> dict[str, Any]:
             context = super().get_context_data(**kwargs)
-            instances = model_class.objects.all()
-            paginator = django_paginator.Paginator(instances, 10)
-            page = self.request.GET.get('page')
-            page_obj = paginator.get_page(page)
-            context[f'{plural_name}_list'] = page_obj
+            context[f'{plural_name}_list'] = context['page_obj']
+            params = self.request.GET.copy()
+            params.pop(CURSOR_PARAM, None)
+            params.pop(self.page_kwarg, None)
+            context['pagination_query'] = f'&{params.urlencode()}' if params else ''
+            context[SEARCH_PARAM] = self.request.GET.get(SEARCH_PARAM, '')
             return context
     return CustomListView
 
-def create_view(model_class, context_name, template, redirect_page):
-    @decorators.login_required
-    def view(request):
+def create_view(model_class, context_name, template, details_template, redirect_page):
+    name = model_class._meta.model_name
+
+    @async_login_required
+    async def view(request):
         id_ = request.GET.get('id', None)
         if not id_:
             return redirect(redirect_page)
+        annotations = {}
+        if model_class == Book:
+            annotations['owned'] = Exists(BookClient.objects.filter(client_id=request.user.pk, book=OuterRef('pk')))
         try:
-            target = model_class.objects.get(id=id_) if id_ else None
+            id_ = model_class._meta.pk.to_python(id_)
+            state = await conditional.aentity_state(model_class.objects, id_, **annotations)
         except exceptions.ValidationError:
             return redirect(redirect_page)
-        context = {context_name: target}
-        if model_class == Book:
-            client = Client.objects.get(user=request.user)
-            context['client_has_book'] = target in client.books.all()
-        return render(
-            request,
-            template,
-            context,
-        )
+
+        async def render_page():
+            scopes = [(name, id_)]
+            target = await catalog_cache.acached(
+                (name, 'object', id_), scopes, partial(model_class.objects.aget, id=id_),
+            )
+            details = await catalog_cache.acached(
+                (name, 'details', id_), scopes,
+                partial(sync_to_async(render_to_string), details_template, {context_name: target}),
+            )
+            context = {context_name: target, 'details': mark_safe(details)}
+            if model_class == Book:
+                context['client_has_book'] = state[1]
+            return render(
+                request,
+                template,
+                context,
+            )
+
+        if state is None:
+            return await render_page()
+        etag = conditional.make_etag(model_class.__name__, id_, request.user.pk, *state)
+        # a purchase or a refund changes the book page but not the book's modified, only the etag,
+        # which covers ownership, validates it
+        return await conditional.arespond(request, etag, state[0], render_page, check_modified=model_class != Book)
     return view
 
-view_book = create_view(Book, 'book', 'entities/book.html', 'books')
-view_author = create_view(Author, 'author', 'entities/author.html', 'authors')
-view_genre = create_view(Genre, 'genre', 'entities/genre.html', 'genres')
+view_book = create_view(Book, 'book', 'entities/book.html', 'entities/book_details.html', 'books')
+view_author = create_view(Author, 'author', 'entities/author.html', 'entities/author_details.html', 'authors')
+view_genre = create_view(Genre, 'genre', 'entities/genre.html', 'entities/genre_details.html', 'genres')
 
-BookListView = create_listview(Book, 'books', 'catalog/books.html')
-AuthorListView = create_listview(Author, 'authors', 'catalog/authors.html')
-GenreListView = create_listview(Genre, 'genres', 'catalog/genres.html')
+BookListView = create_listview(Book, 'books', 'catalog/books.html', ('title', 'type', 'year'))
+AuthorListView = create_listview(Author, 'authors', 'catalog/authors.html', ('full_name',))
+GenreListView = create_listview(Genre, 'genres', 'catalog/genres.html', ('name', 'description'))
 
 def register(request):
     if request.method == 'POST':
@@ -89,31 +213,213 @@ class MyPermission(permissions.BasePermission):
             return bool(request.user and request.user.is_superuser)
         return False
 
-def create_viewset(model_class, serializer):
+EXPAND_PARAM = 'expand'
+
+def expanded(query_params, expansions) -> list[str]:
+    requested = {name.strip() for name in query_params.get(EXPAND_PARAM, '').split(',')}
+    return [name for name in expansions if name in requested]
+
+FIELDS_PARAM = 'fields'
+
+def requested_fields(request, serializer) -> list[str] | None:
+    # sparse fieldsets only shape what is read, writes always see every field
+    if FIELDS_PARAM not in request.query_params or request.method not in conditional.SAFE_METHODS:
+        return None
+    fields = [name.strip() for name in request.query_params[FIELDS_PARAM].split(',') if name.strip()]
+    unknown = [name for name in fields if name not in serializer.Meta.fields]
+    if unknown:
+        raise rest_exceptions.ValidationError({FIELDS_PARAM: f'unknown fields: {", ".join(unknown)}'})
+    return list(dict.fromkeys(fields))
+
+IDS_PARAM = 'ids'
+
+def requested_ids(query_params, model_class) -> list:
+    values = [value.strip() for value in query_params.get(IDS_PARAM, '').split(',') if value.strip()]
+    # dict keeps the requested order while dropping repeated ids
+    values = list(dict.fromkeys(values))
+    if len(values) > settings.REST_MAX_IDS:
+        raise exceptions.ValidationError(f'at most {settings.REST_MAX_IDS} ids per request')
+    invalid = []
+    ids = []
+    for value in values:
+        try:
+            ids.append(model_class._meta.pk.to_python(value))
+        except exceptions.ValidationError:
+            invalid.append(value)
+    if invalid:
+        raise exceptions.ValidationError(f'invalid ids: {", ".join(invalid)}')
+    return ids
+
+def create_viewset(model_class, serializer, expansions=None):
+    expansions = expansions or {}
+
     class ViewSet(viewsets.ModelViewSet):
         queryset = model_class.objects.all()
         serializer_class = serializer
+        pagination_class = KeysetPagination
         authentication_classes = [authentication.TokenAuthentication]
         permission_classes = [MyPermission]
 
+        def get_queryset(self):
+            queryset = super().get_queryset()
+            if self.action == 'list':
+                queryset = search(model_class, queryset, self.request.query_params)
+            # one query per expanded relation, however many rows the page holds
+            prefetches = [expansions[name] for name in expanded(self.request.query_params, expansions)]
+            if prefetches:
+                queryset = queryset.prefetch_related(*prefetches)
+            fields = requested_fields(self.request, serializer)
+            return queryset if fields is None else only_columns(queryset, fields)
+
+        def list(self, request, *args, **kwargs):
+            if IDS_PARAM in request.query_params:
+                return self.list_ids(request)
+            related = expanded(request.query_params, expansions)
+            tokens, last_modified = conditional.collection_state(self.filter_queryset(self.get_queryset()), related)
+            etag = conditional.make_etag(
+                model_class.__name__, request.get_full_path(), request.accepted_renderer.format, self.fields_tag(),
+                *tokens,
+            )
+            # Last-Modified has a resolution of a second, a version can change within one,
+            # so only the etag validates a list
+            return conditional.respond(
+                request, etag, last_modified, partial(self.list_page, request, *args, **kwargs),
+                check_modified=False,
+            )
+
+        def list_page(self, request, *args, **kwargs):
+            values = ValuesSerializer.for_serializer(self.get_serializer())
+            if values is None:
+                return super().list(request, *args, **kwargs)
+            queryset = self.filter_queryset(self.get_queryset())
+            columns = dict.fromkeys([*values.columns, *keyset_columns(queryset)])
+            page = self.paginate_queryset(queryset.values(*columns))
+            return self.get_paginated_response(values.to_representation(page))
+
+        def list_ids(self, request):
+            # one query for the whole shelf, answered in the requested order
+            try:
+                ids = requested_ids(request.query_params, model_class)
+            except exceptions.ValidationError as error:
+                return Response({'detail': error.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+            found = {obj.pk: obj for obj in self.get_queryset().filter(pk__any=ids).order_by()} if ids else {}
+            return Response({
+                'results': self.get_serializer([found[id_] for id_ in ids if id_ in found], many=True).data,
+                'missing': [id_ for id_ in ids if id_ not in found],
+            })
+
+        def retrieve(self, request, *args, **kwargs):
+            pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+            try:
+                queryset = self.get_queryset().filter(pk=pk)
+                state = conditional.list_state(queryset, expanded(request.query_params, expansions))
+            except exceptions.ValidationError:
+                state = {'count': 0}
+            if not state['count']:
+                return super().retrieve(request, *args, **kwargs)
+            etag = conditional.make_etag(
+                model_class.__name__, pk, request.accepted_renderer.format, self.fields_tag(), *state.values(),
+            )
+            return conditional.respond(
+                request, etag, state['modified'], partial(super().retrieve, request, *args, **kwargs),
+            )
+
+        def get_serializer_context(self):
+            context = super().get_serializer_context()
+            context[EXPAND_CONTEXT] = expanded(self.request.query_params, expansions)
+            context[FIELDS_CONTEXT] = requested_fields(self.request, serializer)
+            return context
+
+        def fields_tag(self) -> str:
+            return ','.join(requested_fields(self.request, serializer) or ['*'])
+
+        @action(detail=False, methods=['post', 'put', 'delete'], url_path='bulk')
+        def bulk_write(self, request):
+            # POST creates, PUT updates objects carrying their id, DELETE takes a list of ids
+            context = {**self.get_serializer_context(), EXPAND_CONTEXT: ()}
+            try:
+                if request.method == 'POST':
+                    results = bulk.create(serializer, request.data, context)
+                elif request.method == 'PUT':
+                    results = bulk.update(serializer, request.data, context)
+                else:
+                    results = bulk.delete(serializer, request.data)
+            except bulk.BatchError as error:
+                return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'results': results})
+
     return ViewSet
 
-BookViewSet = create_viewset(Book, BookSerializer)
+BOOK_EXPANSIONS = {
+    'authors': Prefetch(
+        'bookauthor_set',
+        queryset=BookAuthor.objects.select_related('author').order_by('author__full_name', 'author_id'),
+    ),
+    'genres': Prefetch(
+        'bookgenre_set',
+        queryset=BookGenre.objects.select_related('genre').order_by('genre__name', 'genre_id'),
+    ),
+}
+
+BookViewSet = create_viewset(Book, BookSerializer, BOOK_EXPANSIONS)
 AuthorViewSet = create_viewset(Author, AuthorSerializer)
 GenreViewSet = create_viewset(Genre, GenreSerializer)
 
+class SuperuserPermission(permissions.BasePermission):
+    def has_permission(self, request, _):
+        return bool(request.user and request.user.is_superuser)
+
+CHECKSUM_HEADER = 'X-Checksum-SHA256'
+
+class BookUploadViewSet(rest_mixins.CreateModelMixin, rest_mixins.RetrieveModelMixin,
+                        rest_mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    queryset = BookUpload.objects.select_related('book').prefetch_related('parts')
+    serializer_class = BookUploadSerializer
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [SuperuserPermission]
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        upload = uploads.initiate(data['book'], data['filename'], data['sha256'])
+        if upload is None:
+            # the content is stored already, nothing has to be uploaded
+            return Response({'deduplicated': True, 'book': BookSerializer(data['book']).data})
+        return Response(self.get_serializer(upload).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['put'], url_path=r'parts/(?P<number>\d+)')
+    def part(self, request, pk=None, number=None):
+        checksum = request.headers.get(CHECKSUM_HEADER)
+        if not checksum:
+            return Response({'detail': f'{CHECKSUM_HEADER} header is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            part = uploads.put_part(self.get_object(), int(number), request.stream or BytesIO(), checksum)
+        except uploads.UploadError as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(BookUploadPartSerializer(part).data)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        try:
+            book = uploads.complete(self.get_object())
+        except uploads.UploadError as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(BookSerializer(book, context=self.get_serializer_context()).data)
+
+    def perform_destroy(self, instance):
+        uploads.abort(instance)
+
 @decorators.login_required
 def profile(request):
     form_errors = ''
-    client = Client.objects.get(user=request.user)
     if request.method == 'POST':
         form = AddFundsForm(request.POST)
         if form.is_valid():
-            money = form.cleaned_data.get('money')
-            client.money += money
-            client.save()
+            ledger.top_up(request.user.pk, form.cleaned_data.get('money'))
     else:
         form = AddFundsForm()
+    client = ledger.with_balance(Client.objects.select_related('user')).get(user=request.user)
 
     return render(
         request,
@@ -121,7 +427,7 @@ def profile(request):
         {
             'form': form,
             'form_errors': form_errors,
-            'client_data': {'username': client.user.username, 'money': client.money},
+            'client_data': {'username': client.user.username, 'money': client.balance},
             'client_books': client.books.all(),
         }
     )
@@ -138,42 +444,87 @@ def buy(request):
     if not book:
         return redirect('books')
     
-    client = Client.objects.get(user=request.user)
+    client = ledger.with_balance(Client.objects).get(user=request.user)
 
-    if request.method == 'POST' and client.money >= book.price and book not in client.books.all():
-            client.books.add(book)
-            client.money -= book.price
-            client.save()
+    client_has_book = client.owns(book.id)
+
+    if request.method == 'POST':
+        if client_has_book:
+            result = purchases.PurchaseResult(purchases.ALREADY_OWNED)
+        else:
+            result = purchases.purchase(client.pk, book.id, request.POST.get('idempotency_key') or None)
+        metrics.PURCHASES.inc(status=result.status)
+        client_has_book = result.owned
+        if result.balance is not None:
+            client.balance = result.balance
 
     return render(
         request,
         'pages/buy.html',
         {
-            'client_has_book': book in client.books.all(),
-            'money': client.money,
+            'client_has_book': client_has_book,
+            'money': client.balance,
             'book': book,
+            'idempotency_key': uuid4(),
         }
     )
 
-@decorators.login_required
-def read(request):
+@async_login_required
+async def read(request):
     book_id = request.GET.get('id', None)
     if not book_id:
         return redirect('books')
     try:
-        book = Book.objects.get(id=book_id) if book_id else None
+        book_id = Book._meta.pk.to_python(book_id)
     except exceptions.ValidationError:
         return redirect('books')
+    # the book and the ownership check do not depend on each other
+    book, user_has_access = await asyncio.gather(
+        Book.objects.filter(id=book_id).afirst(),
+        Ownership(request.user.pk).aowns(book_id),
+    )
     if not book:
         return redirect('books')
-    
-    client = Client.objects.get(user=request.user)
 
     return render(
         request,
         'pages/read.html',
         {
-            'user_has_access': book in client.books.all(),
+            'user_has_access': user_has_access,
             'book': book,
         },
     )
+
+@decorators.login_required
+def read_file(request):
+    try:
+        book = Book.objects.filter(id=request.GET.get('id')).first()
+    except exceptions.ValidationError:
+        book = None
+    if not book or not book.file:
+        raise Http404
+    if not Ownership(request.user.pk).owns(book.id):
+        return HttpResponseForbidden()
+    return delivery.file_response(request, book.file)
+
+
+def export_metrics(request):
+    # METRICS_TOKEN keeps the endpoint to scrapers presenting it as a bearer token
+    if settings.METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {settings.METRICS_TOKEN}':
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.exposition(), content_type=metrics.CONTENT_TYPE)
+
+
+@staff_member_required
+def list_profiles(request):
+    return JsonResponse({
+        'profiles': [{'name': path.name, 'size': path.stat().st_size} for path in profiling.stored_profiles()],
+    })
+
+
+@staff_member_required
+def download_profile(request, name: str):
+    path = profiling.profile_path(name)
+    if path is None:
+        raise Http404
+    return FileResponse(path.open('rb'), as_attachment=True, filename=name)
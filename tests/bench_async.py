@@ -0,0 +1,114 @@
+import socket
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from importlib.util import find_spec
+from os import environ, getenv
+from time import perf_counter, sleep
+from unittest import skipUnless
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.client import Client as TestClient
+from tests.runner import LibraryTransactionTestCase
+
+from library_app.models import Author, Book, Client, Genre
+
+REQUESTS = int(getenv('BENCH_REQUESTS', 2000))
+CONCURRENCY = int(getenv('BENCH_CONCURRENCY', 32))
+WORKERS = getenv('BENCH_WORKERS', '1')
+THREADS = getenv('BENCH_THREADS', '16')
+BOOKS = int(getenv('BENCH_BOOKS', 200))
+STARTUP_TIMEOUT = 30
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wsgi_command(port: int) -> list[str]:
+    return [
+        sys.executable, '-m', 'gunicorn', 'library.wsgi', '--bind', f'127.0.0.1:{port}',
+        '--workers', WORKERS, '--threads', THREADS, '--log-level', 'warning',
+    ]
+
+
+def asgi_command(port: int) -> list[str]:
+    return [
+        sys.executable, '-m', 'uvicorn', 'library.asgi:application', '--host', '127.0.0.1', '--port', str(port),
+        '--workers', WORKERS, '--log-level', 'warning',
+    ]
+
+
+def wait_for(port: int) -> None:
+    for _ in range(STARTUP_TIMEOUT * 10):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            sleep(0.1)
+    raise TimeoutError(f'nothing listens on port {port}')
+
+
+# run with ./tests/test.sh tests.bench_async, both servers run against the test database
+@skipUnless(find_spec('gunicorn') and find_spec('uvicorn'), 'gunicorn and uvicorn are required')
+class ServerBenchmark(LibraryTransactionTestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='reader', password='reader')
+        Client.objects.create(user=user, money=10)
+        books = Book.objects.bulk_create(Book(title=f'Book {number}', volume=1, price=1) for number in range(BOOKS))
+        Author.objects.create(full_name='Author')
+        Genre.objects.create(name='Genre')
+        user.client.books.add(*books[::2])
+        client = TestClient()
+        client.force_login(user)
+        self.cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        # the home page, a list page and the entity and reading pages of a few books
+        self.paths = ['/', '/books/', '/authors/']
+        for book in books[:10]:
+            self.paths += [f'/book/?id={book.id}', f'/read/?id={book.id}']
+
+    def fetch(self, base: str, path: str) -> int:
+        try:
+            with urlopen(Request(base + path, headers={'Cookie': self.cookie}), timeout=30) as response:
+                response.read()
+                return response.status
+        except HTTPError as error:
+            return error.code
+
+    def run_server(self, command) -> float:
+        port = free_port()
+        env = {**environ, 'PG_DBNAME': connection.settings_dict['NAME']}
+        server = subprocess.Popen(command(port), env=env)
+        try:
+            wait_for(port)
+            base = f'http://127.0.0.1:{port}'
+            paths = [self.paths[number % len(self.paths)] for number in range(REQUESTS)]
+            # one round warms the caches and the connections
+            for path in self.paths:
+                self.fetch(base, path)
+            started = perf_counter()
+            with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+                statuses = list(executor.map(partial(self.fetch, base), paths))
+            elapsed = perf_counter() - started
+        finally:
+            server.terminate()
+            server.wait()
+        self.assertEqual(set(statuses), {200})
+        return REQUESTS / elapsed
+
+    def test_throughput(self):
+        results = {
+            f'wsgi (gunicorn, {WORKERS} workers x {THREADS} threads)': self.run_server(wsgi_command),
+            f'asgi (uvicorn, {WORKERS} workers)': self.run_server(asgi_command),
+        }
+        print(f'\n{REQUESTS} requests, {CONCURRENCY} concurrent')
+        for name, rate in results.items():
+            print(f'{name}: {rate:.0f} requests/s')
+
@@ -0,0 +1,64 @@
+from os import getenv
+from time import perf_counter
+
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from tests.runner import LibraryTransactionTestCase
+
+from library_app.models import Book
+
+ITEMS = int(getenv('BENCH_ITEMS', 1000))
+BATCH = int(getenv('BENCH_BATCH', 500))
+
+
+# run with ./tests/test.sh tests.bench_bulk
+class BulkBenchmark(LibraryTransactionTestCase):
+    def setUp(self):
+        superuser = User.objects.create_user(username='superuser', password='superuser', is_superuser=True)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=superuser).key}')
+        self.items = [{'title': f'Book {number}', 'volume': 1, 'year': 2000} for number in range(ITEMS)]
+
+    def timed(self, send) -> float:
+        started = perf_counter()
+        send()
+        return perf_counter() - started
+
+    def single(self, method, url, items):
+        for item in items:
+            getattr(self.client, method)(url(item), item, format='json')
+
+    def batched(self, method, items):
+        for start in range(0, len(items), BATCH):
+            getattr(self.client, method)('/rest/books/bulk/', items[start:start + BATCH], format='json')
+
+    def test_speedup(self):
+        results = {}
+        results['create'] = (
+            self.timed(lambda: self.single('post', lambda _: '/rest/books/', self.items)),
+            self.timed(lambda: self.batched('post', self.items)),
+        )
+        self.assertEqual(Book.objects.count(), 2 * ITEMS)
+
+        books = list(Book.objects.values_list('id', flat=True))
+        first, second = books[:ITEMS], books[ITEMS:]
+        updates = [{'id': str(id_), 'title': 'Renamed', 'volume': 2} for id_ in books]
+        results['update'] = (
+            self.timed(lambda: self.single('put', lambda item: f'/rest/books/{item["id"]}/', updates[:ITEMS])),
+            self.timed(lambda: self.batched('put', updates[ITEMS:])),
+        )
+        self.assertEqual(Book.objects.filter(title='Renamed').count(), 2 * ITEMS)
+
+        results['delete'] = (
+            self.timed(lambda: [self.client.delete(f'/rest/books/{id_}/') for id_ in first]),
+            self.timed(lambda: self.batched('delete', [str(id_) for id_ in second])),
+        )
+        self.assertFalse(Book.objects.exists())
+
+        print(f'\n{ITEMS} books, batches of {BATCH}')
+        for operation, (single, batched) in results.items():
+            print(
+                f'{operation}: {ITEMS / single:.0f}/s one by one, {ITEMS / batched:.0f}/s in batches, '
+                f'{single / batched:.1f}x'
+            )
@@ -0,0 +1,80 @@
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from importlib.util import find_spec
+from os import environ, getenv
+from statistics import mean, quantiles
+from time import perf_counter
+from unittest import skipUnless
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.client import Client as TestClient
+from tests.bench_async import asgi_command, free_port, wait_for, wsgi_command
+from tests.runner import LibraryTransactionTestCase
+
+from library_app.models import Book, Client
+
+REQUESTS = int(getenv('BENCH_REQUESTS', 1000))
+CONCURRENCY = int(getenv('BENCH_CONCURRENCY', 8))
+
+CONFIGURATIONS = {
+    'new connection per request': {'PG_CONN_MAX_AGE': '0', 'PG_POOL': 'false'},
+    'persistent connections': {'PG_CONN_MAX_AGE': '60', 'PG_POOL': 'false'},
+    'pool': {'PG_POOL': 'true'},
+}
+
+
+# run with ./tests/test.sh tests.bench_pool, the servers run against the test database
+@skipUnless(find_spec('gunicorn') and find_spec('uvicorn'), 'gunicorn and uvicorn are required')
+class ConnectionBenchmark(LibraryTransactionTestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='reader', password='reader')
+        Client.objects.create(user=user, money=10)
+        book = Book.objects.create(title='Book', volume=1, price=1)
+        client = TestClient()
+        client.force_login(user)
+        self.cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        # a cheap page, so that connecting is a visible part of it
+        self.path = f'/read/?id={book.id}'
+
+    def fetch(self, base: str, _) -> float:
+        started = perf_counter()
+        try:
+            with urlopen(Request(base + self.path, headers={'Cookie': self.cookie}), timeout=30) as response:
+                response.read()
+                status = response.status
+        except HTTPError as error:
+            status = error.code
+        self.assertEqual(status, 200)
+        return perf_counter() - started
+
+    def latencies(self, command, env: dict) -> list[float]:
+        port = free_port()
+        server = subprocess.Popen(
+            command(port), env={**environ, 'PG_DBNAME': connection.settings_dict['NAME'], **env},
+        )
+        try:
+            wait_for(port)
+            base = f'http://127.0.0.1:{port}'
+            for _ in range(CONCURRENCY):
+                self.fetch(base, None)
+            with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+                return list(executor.map(partial(self.fetch, base), range(REQUESTS)))
+        finally:
+            server.terminate()
+            server.wait()
+
+    def test_latency(self):
+        print(f'\n{REQUESTS} requests, {CONCURRENCY} concurrent, latency in ms')
+        for server, command in (('gunicorn', wsgi_command), ('uvicorn', asgi_command)):
+            for name, env in CONFIGURATIONS.items():
+                latencies = self.latencies(command, env)
+                percentiles = quantiles(latencies, n=100)
+                print(
+                    f'{server}, {name}: mean {mean(latencies) * 1000:.2f}, '
+                    f'p50 {percentiles[49] * 1000:.2f}, p99 {percentiles[98] * 1000:.2f}',
+                )
@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from os import getenv
+from time import perf_counter
+
+from django.contrib.auth.models import User
+from django.db import connection
+from tests.runner import LibraryTransactionTestCase
+
+from library_app import counters, ledger, purchases
+from library_app.models import Book, BookClient, Client
+
+CLIENTS = int(getenv('BENCH_CLIENTS', 20))
+BOOKS = int(getenv('BENCH_BOOKS', 50))
+THREADS = int(getenv('BENCH_THREADS', 16))
+PRICE = Decimal(2)
+
+
+# run with ./tests/test.sh tests.bench_purchase
+class PurchaseBenchmark(LibraryTransactionTestCase):
+    def test_stress(self):
+        books = Book.objects.bulk_create(Book(title=str(number), volume=1, price=PRICE) for number in range(BOOKS))
+        # every client can afford only half of the catalog
+        budget = PRICE * (BOOKS // 2)
+        clients = [
+            Client.objects.create(user=User.objects.create(username=f'user{number}'), money=budget)
+            for number in range(CLIENTS)
+        ]
+        # each (client, book) pair is attempted twice to provoke duplicate purchases
+        attempts = [(client.pk, book.id) for book in books for client in clients] * 2
+
+        def worker(chunk):
+            try:
+                return [purchases.purchase(*arguments) for arguments in chunk]
+            finally:
+                connection.close()
+
+        started = perf_counter()
+        with ThreadPoolExecutor(max_workers=THREADS) as executor:
+            chunks = executor.map(worker, [attempts[number::THREADS] for number in range(THREADS)])
+            results = [result for chunk in chunks for result in chunk]
+        elapsed = perf_counter() - started
+
+        purchased = [result for result in results if result.status == purchases.PURCHASED]
+        self.assertEqual(len(purchased), CLIENTS * (BOOKS // 2))
+        self.assertEqual(BookClient.objects.count(), len(purchased))
+        self.assertEqual(counters.get_counts(BookClient)['bookclient'], len(purchased))
+        for client in ledger.with_balance(Client.objects.all()):
+            self.assertEqual(client.balance, budget - PRICE * client.books.count())
+            self.assertGreaterEqual(client.balance, 0)
+        self.assertEqual(ledger.compact(), CLIENTS)
+        self.assertEqual(ledger.reconcile(), [])
+
+        print(
+            f'\n{len(attempts)} attempts, {len(purchased)} purchases with {THREADS} threads in {elapsed:.2f}s: '
+            f'{len(attempts) / elapsed:.0f} attempts/s, {len(purchased) / elapsed:.0f} purchases/s'
+        )
@@ -0,0 +1,50 @@
+from os import getenv
+from time import perf_counter
+
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+
+from library_app import renderers
+from library_app.models import Book
+from library_app.serializers import BookSerializer, ValuesSerializer
+
+ITEMS = int(getenv('BENCH_ITEMS', 2000))
+ROUNDS = int(getenv('BENCH_ROUNDS', 5))
+
+
+# run with ./tests/test.sh tests.bench_serializers
+class SerializerBenchmark(TestCase):
+    def setUp(self):
+        Book.objects.bulk_create(
+            Book(title=f'Book {number}', description='description ' * 20, volume=number + 1, year=2000, type='book')
+            for number in range(ITEMS)
+        )
+        self.instances = list(Book.objects.all())
+        self.values = ValuesSerializer.for_serializer(BookSerializer(context={}))
+        self.rows = list(Book.objects.values(*self.values.columns))
+
+    def per_item(self, render) -> float:
+        # the best of several rounds, in microseconds per item
+        timings = []
+        for _ in range(ROUNDS):
+            started = perf_counter()
+            render()
+            timings.append(perf_counter() - started)
+        return min(timings) / ITEMS * 1e6
+
+    def test_per_item_cost(self):
+        stock, fast = JSONRenderer(), renderers.FastJSONRenderer()
+        cases = {
+            'serializer + json': lambda: stock.render(BookSerializer(self.instances, many=True, context={}).data),
+            'serializer + orjson': lambda: fast.render(BookSerializer(self.instances, many=True, context={}).data),
+            'values + json': lambda: stock.render(self.values.to_representation(self.rows)),
+            'values + orjson': lambda: fast.render(self.values.to_representation(self.rows)),
+        }
+        if renderers.msgpack:
+            msgpack = renderers.MessagePackRenderer()
+            cases['values + msgpack'] = lambda: msgpack.render(self.values.to_representation(self.rows))
+        results = {name: self.per_item(render) for name, render in cases.items()}
+        self.assertLess(results['values + orjson'], results['serializer + json'])
+        print(f'\n{ITEMS} books, best of {ROUNDS} rounds')
+        for name, cost in results.items():
+            print(f'{name}: {cost:.1f} us/item')
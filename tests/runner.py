@@ -1,17 +1,67 @@
+from contextlib import contextmanager
 from typing import Any
+from django.apps import apps
+from django.core.cache import caches
+from django.conf import settings
+from django.core.management import call_command
 from django.db.backends.base.base import BaseDatabaseWrapper
+from django.test import TransactionTestCase
 from django.test.runner import DiscoverRunner
 from django.db import connections
 from types import MethodType
+from unittest import TextTestResult
+
+from library_app.profiling import profile_queries
 
 
 def prepare_db(self):
     self.connect()
     self.connection.cursor().execute('CREATE SCHEMA IF NOT EXISTS library;')
 
+class CacheClearingResult(TextTestResult):
+    # database changes are rolled back after each test, cached pages built from them must go too
+    def startTest(self, test):
+        for cache in caches.all():
+            cache.clear()
+        super().startTest(test)
+
 class PostgresSchemaRunner(DiscoverRunner):
+    def get_resultclass(self):
+        resultclass = super().get_resultclass() or TextTestResult
+        return type('LibraryTestResult', (CacheClearingResult, resultclass), {})
+
     def setup_databases(self, **kwargs: Any) -> list[tuple[BaseDatabaseWrapper, str, bool]]:
         for conn_name in connections:
             connection = connections[conn_name]
             connection.prepare_database = MethodType(prepare_db, connection)
         return super().setup_databases(**kwargs)
+
+
+class LibraryTransactionTestCase(TransactionTestCase):
+    # flush only sees tables on the search path, so the library schema is truncated by hand
+    # and the rest is flushed with CASCADE to get past the foreign keys into it
+    def _fixture_teardown(self):
+        counter = apps.get_model('library_app', 'Counter')
+        tables = [
+            model._meta.db_table for model in apps.get_app_config('library_app').get_models()
+            if model is not counter
+        ]
+        for db_name in self._databases_names(include_mirrors=False):
+            with connections[db_name].cursor() as cursor:
+                cursor.execute(f'TRUNCATE {", ".join(tables)} CASCADE')
+            counter.objects.using(db_name).update(value=0)
+            call_command('flush', verbosity=0, interactive=False, database=db_name, allow_cascade=True)
+
+
+class QueryBudgetMixin:
+    # fails a test when the code under it runs more queries than declared, or repeats a statement
+    @contextmanager
+    def assertQueryBudget(self, queries: int, repeated: int | None = None):
+        repeated = settings.SQL_PROFILE_REPEATED if repeated is None else repeated
+        with profile_queries() as profile:
+            yield profile
+        statements = '\n'.join(profile.statements)
+        self.assertLessEqual(
+            profile.count, queries, f'{profile.count} queries over a budget of {queries}:\n{statements}',
+        )
+        self.assertFalse(profile.repeated(repeated), f'statements repeated {repeated} times or more')
@@ -1,6 +1,7 @@
 from django.test import TestCase, client as test_client
 from django.contrib.auth.models import User
 
+from library_app import ledger
 from library_app.models import Client
 
 class TestAddFunds(TestCase):
@@ -14,10 +15,10 @@ class TestAddFunds(TestCase):
 
     def test_negative_funds(self):
         self.test_client.post(self._url, {'money': -1})
-        self.assertEqual(self.library_client.money, 0)
+        self.assertEqual(ledger.balance(self.library_client.pk), 0)
 
     def test_add_funds(self):
-        self.test_client.post(self._url, {'money': 1})
-        self.library_client.refresh_from_db()
+        response = self.test_client.post(self._url, {'money': 1})
 
-        self.assertEqual(self.library_client.money, 1)
+        self.assertEqual(ledger.balance(self.library_client.pk), 1)
+        self.assertEqual(response.context['client_data']['money'], 1)
@@ -0,0 +1,127 @@
+from unittest import mock
+from uuid import uuid4
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.client import Client as TestClient
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from library_app.models import Author, Book, BookAuthor, BookGenre, Client, Genre
+from library_app.pagination import estimated_count
+
+
+def create_books(number):
+    return [Book.objects.create(title=f'Book {index}', volume=1) for index in range(number)]
+
+
+def create_authors(number):
+    return [Author.objects.create(full_name=f'Author {index}') for index in range(number)]
+
+
+def create_genres(number):
+    return [Genre.objects.create(name=f'Genre {index}') for index in range(number)]
+
+
+def create_book_authors(number):
+    return [
+        BookAuthor.objects.create(book=book, author=author)
+        for book, author in zip(create_books(number), create_authors(number))
+    ]
+
+
+def create_book_genres(number):
+    return [
+        BookGenre.objects.create(book=book, genre=genre)
+        for book, genre in zip(create_books(number), create_genres(number))
+    ]
+
+
+def create_clients(number):
+    return [
+        Client.objects.create(user=User.objects.create_user(username=uuid4().hex, password='client'))
+        for _ in range(number)
+    ]
+
+
+class AdminTestMixin:
+    def setUp(self):
+        self.client = TestClient()
+        self.client.force_login(User.objects.create_superuser(username='admin', password='admin'))
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [query['sql'] for query in context.captured_queries]
+
+
+def create_changelist_test(url, create):
+    class ChangelistTest(AdminTestMixin, TestCase):
+        def test_queries_independent_of_rows(self):
+            create(2)
+            few = self.count_queries(url)
+            create(5)
+            self.assertEqual(len(self.count_queries(url)), len(few))
+
+        def test_estimated_count(self):
+            create(2)
+            with mock.patch('library_app.pagination.estimated_count', return_value=5000000):
+                queries = self.count_queries(url)
+                response = self.client.get(url)
+            self.assertFalse([sql for sql in queries if 'COUNT(*)' in sql])
+            self.assertEqual(response.context['cl'].result_count, 5000000)
+    return ChangelistTest
+
+
+BookChangelistTest = create_changelist_test('/admin/library_app/book/', create_books)
+AuthorChangelistTest = create_changelist_test('/admin/library_app/author/', create_authors)
+GenreChangelistTest = create_changelist_test('/admin/library_app/genre/', create_genres)
+BookAuthorChangelistTest = create_changelist_test('/admin/library_app/bookauthor/', create_book_authors)
+BookGenreChangelistTest = create_changelist_test('/admin/library_app/bookgenre/', create_book_genres)
+ClientChangelistTest = create_changelist_test('/admin/library_app/client/', create_clients)
+
+
+class BookAdminTest(AdminTestMixin, TestCase):
+    def test_filtered_counted(self):
+        create_books(2)
+        with mock.patch('library_app.pagination.estimated_count', return_value=5000000):
+            # filtered changelists are counted exactly
+            response = self.client.get('/admin/library_app/book/?q=Book+1')
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000)
+    def test_small_tables_counted(self):
+        create_books(2)
+        with mock.patch('library_app.pagination.estimated_count', return_value=10):
+            response = self.client.get('/admin/library_app/book/')
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_genre_filter(self):
+        genre, other = create_genres(2)
+        first, second = create_books(2)
+        first.genres.add(genre, other)
+        second.genres.add(other)
+        response = self.client.get(f'/admin/library_app/book/?genre={genre.id}')
+        self.assertEqual(list(response.context['cl'].result_list), [first])
+        response = self.client.get(f'/admin/library_app/book/?genre={other.id}')
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_search(self):
+        create_books(12)
+        response = self.client.get('/admin/library_app/book/?q=book 1')
+        self.assertEqual({book.title for book in response.context['cl'].result_list}, {'Book 1', 'Book 10', 'Book 11'})
+
+    def test_widgets_do_not_list_rows(self):
+        create_books(3)
+        for url in ('/admin/library_app/bookauthor/add/', '/admin/library_app/author/add/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotContains(response, 'Book 1')
+
+    def test_estimated_count_statistics(self):
+        create_books(2)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Book._meta.db_table}')
+        self.assertIsInstance(estimated_count(Book), int)
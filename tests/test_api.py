@@ -1,4 +1,8 @@
-from django.test import TestCase
+from uuid import uuid4
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from django.contrib.auth.models import User
@@ -67,4 +71,138 @@ def create_viewset_test(model_class, url, creation_attrs):
 
 BookViewSetTest = create_viewset_test(Book, '/rest/books/', {'title': 'A', 'volume': 100})
 GenreViewSetTest = create_viewset_test(Genre, '/rest/genres/', {'name': 'A'})
-AuthorViewSetTest = create_viewset_test(Author, '/rest/authors/', {'full_name': 'A'})
\ No newline at end of file
+AuthorViewSetTest = create_viewset_test(Author, '/rest/authors/', {'full_name': 'A'})
+
+class BookExpandTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=User.objects.create_user(username='user', password='user'))
+        authors = [Author.objects.create(full_name=f'author {number}') for number in range(3)]
+        genres = [Genre.objects.create(name=f'genre {number}') for number in range(2)]
+        for number in range(12):
+            book = Book.objects.create(title=f'book {number:02}', volume=1)
+            book.authors.add(*authors[:number % 3 + 1])
+            book.genres.add(genres[number % 2])
+
+    def test_scalar_by_default(self):
+        response = self.client.get('/rest/books/')
+        self.assertNotIn('authors', response.data['results'][0])
+        self.assertNotIn('genres', response.data['results'][0])
+
+    def test_expand(self):
+        response = self.client.get('/rest/books/', {'expand': 'authors,genres', 'page_size': 3})
+        book = response.data['results'][2]
+        self.assertEqual(book['title'], 'book 02')
+        self.assertEqual([author['full_name'] for author in book['authors']], ['author 0', 'author 1', 'author 2'])
+        self.assertEqual([genre['name'] for genre in book['genres']], ['genre 0'])
+
+        response = self.client.get('/rest/books/', {'expand': 'genres'})
+        self.assertNotIn('authors', response.data['results'][0])
+        self.assertIn('genres', response.data['results'][0])
+
+    def test_retrieve(self):
+        book = Book.objects.get(title='book 01')
+        response = self.client.get(f'/rest/books/{book.id}/', {'expand': 'authors'})
+        self.assertEqual(len(response.data['authors']), 2)
+
+    def test_query_count_constant(self):
+        # etag state, page, count and one prefetch per expanded relation
+        for page_size in (2, 12):
+            with self.assertNumQueries(5):
+                response = self.client.get('/rest/books/', {'expand': 'authors,genres', 'page_size': page_size})
+            self.assertEqual(len(response.data['results']), page_size)
+
+def create_ids_test(model_class, url, creation_attrs):
+    class IdsTest(TestCase):
+        def setUp(self):
+            self.client = APIClient()
+            self.client.force_authenticate(user=User.objects.create_user(username='user', password='user'))
+            self.objects = [model_class.objects.create(**creation_attrs) for _ in range(5)]
+
+        def test_requested_order(self):
+            ids = [str(obj.id) for obj in reversed(self.objects[1:])]
+            missing = str(uuid4())
+            with self.assertNumQueries(1):
+                response = self.client.get(url, {'ids': ','.join([ids[0], missing, *ids, ids[1]])})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([str(item['id']) for item in response.data['results']], ids)
+            self.assertEqual([str(id_) for id_ in response.data['missing']], [missing])
+
+        def test_invalid(self):
+            response = self.client.get(url, {'ids': f'{self.objects[0].id},123'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('123', response.data['detail'])
+
+        @override_settings(REST_MAX_IDS=3)
+        def test_cap(self):
+            response = self.client.get(url, {'ids': ','.join(str(obj.id) for obj in self.objects)})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        def test_empty(self):
+            response = self.client.get(url, {'ids': ''})
+            self.assertEqual(response.data, {'results': [], 'missing': []})
+    return IdsTest
+
+BookIdsTest = create_ids_test(Book, '/rest/books/', {'title': 'A', 'volume': 1})
+GenreIdsTest = create_ids_test(Genre, '/rest/genres/', {'name': 'A'})
+AuthorIdsTest = create_ids_test(Author, '/rest/authors/', {'full_name': 'A'})
+
+class BookIdsExpandTest(TestCase):
+    def test_expand(self):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='user', password='user'))
+        book = Book.objects.create(title='A', volume=1)
+        book.authors.add(Author.objects.create(full_name='author'))
+        with self.assertNumQueries(2):
+            response = client.get('/rest/books/', {'ids': str(book.id), 'expand': 'authors'})
+        self.assertEqual(response.data['results'][0]['authors'][0]['full_name'], 'author')
+
+class SparseFieldsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=User.objects.create_user(username='user', password='user'))
+        self.book = Book.objects.create(title='A', volume=1, description='long ' * 100)
+        self.book.authors.add(Author.objects.create(full_name='author'))
+
+    def page_query(self, params) -> tuple[dict, str]:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/rest/books/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        page = [query['sql'] for query in context.captured_queries if 'LIMIT' in query['sql']][0]
+        return response.data['results'][0], page
+
+    def test_only_requested_columns(self):
+        book, sql = self.page_query({'fields': 'id,title'})
+        self.assertEqual(set(book), {'id', 'title'})
+        self.assertNotIn('description', sql)
+        self.assertNotIn('"file"', sql)
+        _, sql = self.page_query({})
+        self.assertIn('description', sql)
+
+    def test_expanded(self):
+        book, _ = self.page_query({'fields': 'title,authors', 'expand': 'authors'})
+        self.assertEqual(book['authors'][0]['full_name'], 'author')
+        self.assertEqual(set(book), {'title', 'authors'})
+
+    def test_retrieve_and_ids(self):
+        response = self.client.get(f'/rest/books/{self.book.id}/', {'fields': 'year'})
+        self.assertEqual(response.data, {'year': None})
+        response = self.client.get('/rest/books/', {'ids': str(self.book.id), 'fields': 'title'})
+        self.assertEqual(response.data['results'], [{'title': 'A'}])
+
+    def test_unknown(self):
+        response = self.client.get('/rest/books/', {'fields': 'title,file'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_etag(self):
+        etag = self.client.get('/rest/books/', {'fields': 'title'}).headers['ETag']
+        self.assertNotEqual(self.client.get('/rest/books/').headers['ETag'], etag)
+        response = self.client.get('/rest/books/', {'fields': 'title'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_writes_see_every_field(self):
+        superuser = User.objects.create_user(username='superuser', password='superuser', is_superuser=True)
+        self.client.force_authenticate(user=superuser)
+        response = self.client.post('/rest/books/?fields=title', {'title': 'B', 'volume': 2})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Book.objects.get(title='B').volume, 2)
@@ -0,0 +1,59 @@
+import asyncio
+
+from django.contrib.auth.models import User
+from django.test import AsyncClient, TestCase
+from rest_framework import status
+
+from library_app import views
+from library_app.models import Book, Client
+
+
+class AsyncViewTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='user')
+        Client.objects.create(user=self.user, money=10)
+        self.owned = Book.objects.create(title='Owned', volume=1, price=1)
+        self.other = Book.objects.create(title='Other', volume=1, price=1)
+        self.user.client.books.add(self.owned)
+        self.async_client.force_login(self.user)
+
+    def test_views_are_async(self):
+        for view in (views.home_page, views.view_book, views.view_author, views.view_genre, views.read):
+            self.assertTrue(asyncio.iscoroutinefunction(view))
+        for view_class in (views.BookListView, views.AuthorListView, views.GenreListView):
+            self.assertTrue(view_class.view_is_async)
+
+    async def test_home_page(self):
+        response = await self.async_client.get('/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.context['books'], 2)
+        self.assertContains(response, 'Hello')
+
+    async def test_book_list(self):
+        for params in ('', '?page=1'):
+            response = await self.async_client.get(f'/books/{params}')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual({book.title for book in response.context['books_list']}, {'Owned', 'Other'})
+            self.assertEqual(response.context['owned_books'], {self.owned.id})
+
+    async def test_book_page(self):
+        url = f'/book/?id={self.owned.id}'
+        response = await self.async_client.get(url)
+        self.assertTrue(response.context['client_has_book'])
+        response = await self.async_client.get(url, **{'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_read(self):
+        response = await self.async_client.get(f'/read/?id={self.owned.id}')
+        self.assertTrue(response.context['user_has_access'])
+        response = await self.async_client.get(f'/read/?id={self.other.id}')
+        self.assertFalse(response.context['user_has_access'])
+        self.assertEqual((await self.async_client.get('/read/?id=123')).status_code, status.HTTP_302_FOUND)
+
+    async def test_login_required(self):
+        client = AsyncClient()
+        for url in ('/books/', f'/book/?id={self.owned.id}', f'/read/?id={self.owned.id}'):
+            response = await client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+            self.assertTrue(response.url.startswith('/accounts/login/'))
+        self.assertEqual((await client.get('/')).status_code, status.HTTP_200_OK)
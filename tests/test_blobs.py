@@ -0,0 +1,132 @@
+import hashlib
+from datetime import timedelta
+from io import StringIO
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+from tests.runner import LibraryTransactionTestCase
+
+from library_app import uploads
+from library_app.models import Blob, Book, BookUpload, get_datetime
+
+DATA = b'%PDF scanned pages' * 1000
+
+
+class BlobStorageMixin:
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.storage = FileSystemStorage(location=self.directory.name)
+        patcher = mock.patch.object(Book._meta.get_field('file'), 'storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+        self.sha256 = hashlib.sha256(DATA).hexdigest()
+
+    def create_book(self, title: str, data: bytes = DATA) -> Book:
+        return Book.objects.create(title=title, volume=1, file=ContentFile(data, name='scan.PDF'))
+
+
+class BlobTest(BlobStorageMixin, TestCase):
+
+    def test_stored_once(self):
+        first = self.create_book('First edition')
+        with mock.patch.object(self.storage, 'save', wraps=self.storage.save) as save:
+            second = self.create_book('Reprint')
+        save.assert_not_called()
+        self.assertEqual(first.file.name, f'blobs/{self.sha256[:2]}/{self.sha256}.pdf')
+        self.assertEqual(second.file.name, first.file.name)
+        blob = Blob.objects.get()
+        self.assertEqual((blob.sha256, blob.size, blob.references), (self.sha256, len(DATA), 2))
+        with second.file.open('rb') as file:
+            self.assertEqual(file.read(), DATA)
+
+    def test_references(self):
+        first, second = self.create_book('First'), self.create_book('Second')
+        first.delete()
+        self.assertEqual(Blob.objects.get().references, 1)
+        second.file = ContentFile(b'other', name='other.pdf')
+        second.save()
+        self.assertEqual(dict(Blob.objects.values_list('sha256', 'references')), {
+            self.sha256: 0, hashlib.sha256(b'other').hexdigest(): 1,
+        })
+        # loaded rather than fresh instances track their stored file as well
+        loaded = Book.objects.get(pk=second.pk)
+        loaded.file = None
+        loaded.save()
+        self.assertFalse(Blob.objects.filter(references__gt=0).exists())
+
+    def test_collect(self):
+        kept, dropped = self.create_book('Kept'), self.create_book('Dropped', b'dropped')
+        dropped_name = dropped.file.name
+        dropped.delete()
+        stdout = StringIO()
+        call_command('collect_blobs', stdout=stdout)
+        self.assertIn('0 unreferenced', stdout.getvalue())
+        Blob.objects.update(modified=get_datetime() - timedelta(days=2))
+        call_command('collect_blobs', stdout=stdout)
+        self.assertIn('1 unreferenced', stdout.getvalue())
+        self.assertEqual(list(Blob.objects.values_list('name', flat=True)), [kept.file.name])
+        self.assertFalse(self.storage.exists(dropped_name))
+        self.assertTrue(self.storage.exists(kept.file.name))
+
+    def test_collect_skips_miscounted(self):
+        book = self.create_book('A')
+        Blob.objects.update(references=0, modified=get_datetime() - timedelta(days=2))
+        call_command('collect_blobs', stdout=StringIO())
+        self.assertTrue(self.storage.exists(book.file.name))
+
+    def test_upload_skipped(self):
+        self.create_book('First edition')
+        reprint = Book.objects.create(title='Reprint', volume=1)
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='admin', password='admin', is_superuser=True))
+        response = client.post('/rest/uploads/', {'book': reprint.id, 'filename': 'scan.pdf', 'sha256': self.sha256})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['deduplicated'])
+        self.assertFalse(BookUpload.objects.exists())
+        reprint.refresh_from_db()
+        self.assertEqual(reprint.file.name, f'blobs/{self.sha256[:2]}/{self.sha256}.pdf')
+        self.assertEqual(Blob.objects.get().references, 2)
+
+
+class ConcurrentCollectTest(BlobStorageMixin, LibraryTransactionTestCase):
+    def test_attached_while_collecting(self):
+        self.create_book('First edition').delete()
+        Blob.objects.update(modified=get_datetime() - timedelta(days=2))
+        reprint = Book.objects.create(title='Reprint', volume=1)
+        looked_up, collected = Event(), Event()
+        attach = uploads.attach
+
+        def attach_after_collection(book, blob):
+            # the blob is found, collect_blobs runs before the book refers to it
+            looked_up.set()
+            collected.wait(1)
+            return attach(book, blob)
+
+        def initiate():
+            try:
+                uploads.initiate(reprint, 'scan.pdf', self.sha256)
+            finally:
+                connection.close()
+
+        with mock.patch('library_app.uploads.attach', attach_after_collection):
+            thread = Thread(target=initiate)
+            thread.start()
+            try:
+                self.assertTrue(looked_up.wait(10))
+                self.assertEqual(uploads.collect_blobs(timedelta(days=1)), 0)
+            finally:
+                collected.set()
+                thread.join()
+        reprint.refresh_from_db()
+        self.assertEqual(Blob.objects.get().references, 1)
+        self.assertTrue(self.storage.exists(reprint.file.name))
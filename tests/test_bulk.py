@@ -0,0 +1,92 @@
+from uuid import uuid4
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from library_app import bulk, counters
+from library_app.models import Author, Book, Genre
+
+
+def create_bulk_test(model_class, url, valid, invalid, changes):
+    class BulkTest(TestCase):
+        def setUp(self):
+            self.client = APIClient()
+            superuser = User.objects.create_user(username='superuser', password='superuser', is_superuser=True)
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=superuser).key}')
+
+        def request(self, method, data):
+            return getattr(self.client, method)(f'{url}bulk/', data, format='json')
+
+        def test_create(self):
+            response = self.request('post', [valid, invalid, valid])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            results = response.data['results']
+            self.assertEqual([result['status'] for result in results], [bulk.CREATED, bulk.INVALID, bulk.CREATED])
+            self.assertTrue(results[1]['errors'])
+            self.assertEqual(set(model_class.objects.values_list('id', flat=True)), {results[0]['id'], results[2]['id']})
+            self.assertEqual(counters.get_counts(model_class)[counters.counter_name(model_class)], 2)
+
+        def test_create_queries(self):
+            self.request('post', [valid])
+            with self.assertNumQueries(5):
+                # token, savepoint, insert, counter, release
+                self.request('post', [valid] * 20)
+
+        def test_update(self):
+            first, second = (model_class.objects.create(**valid) for _ in range(2))
+            missing = uuid4()
+            response = self.request('put', [
+                {**valid, **changes, 'id': str(first.id)},
+                {**invalid, 'id': str(second.id)},
+                {**valid, 'id': str(missing)},
+                {**valid, 'id': 'not an id'},
+            ])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                [result['status'] for result in response.data['results']],
+                [bulk.UPDATED, bulk.INVALID, bulk.NOT_FOUND, bulk.INVALID],
+            )
+            first_modified, second_modified = first.modified, second.modified
+            first.refresh_from_db()
+            second.refresh_from_db()
+            for name, value in changes.items():
+                self.assertEqual(getattr(first, name), value)
+            self.assertGreater(first.modified, first_modified)
+            self.assertEqual(second.modified, second_modified)
+
+        def test_delete(self):
+            kept, deleted = (model_class.objects.create(**valid) for _ in range(2))
+            counters.rebuild([model_class])
+            missing = uuid4()
+            response = self.request('delete', [str(deleted.id), str(missing), 'not an id'])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                [result['status'] for result in response.data['results']],
+                [bulk.DELETED, bulk.NOT_FOUND, bulk.INVALID],
+            )
+            self.assertEqual(list(model_class.objects.values_list('id', flat=True)), [kept.id])
+            self.assertEqual(counters.get_counts(model_class)[counters.counter_name(model_class)], 1)
+
+        @override_settings(REST_BULK_MAX_ITEMS=2)
+        def test_batch_limits(self):
+            self.assertEqual(self.request('post', [valid] * 3).status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(self.request('post', valid).status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertFalse(model_class.objects.exists())
+
+        def test_superuser_only(self):
+            user = User.objects.create_user(username='user', password='user')
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+            for method in ('post', 'put', 'delete'):
+                self.assertEqual(self.request(method, []).status_code, status.HTTP_403_FORBIDDEN)
+    return BulkTest
+
+
+BookBulkTest = create_bulk_test(
+    Book, '/rest/books/', {'title': 'A', 'volume': 1}, {'title': 'A', 'volume': 1, 'year': 1000000},
+    {'title': 'B', 'year': 2000},
+)
+AuthorBulkTest = create_bulk_test(Author, '/rest/authors/', {'full_name': 'A'}, {'full_name': ''}, {'full_name': 'B'})
+GenreBulkTest = create_bulk_test(Genre, '/rest/genres/', {'name': 'A'}, {'name': ''}, {'name': 'B'})
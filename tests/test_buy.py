@@ -2,6 +2,7 @@ from django.test import TestCase, client as test_client
 from django.contrib.auth.models import User
 from decimal import Decimal
 
+from library_app import ledger
 from library_app.models import Client, Book
 
 class TestPurchase(TestCase):
@@ -18,26 +19,23 @@ class TestPurchase(TestCase):
 
     def test_insufficient_funds(self):
         self.test_client.post(self.page_url, {})
-        self.assertEqual(self.library_client.money, 0)
+        self.assertEqual(ledger.balance(self.library_client.pk), 0)
         self.assertNotIn(self.book, self.library_client.books.all())
 
     def test_purchase(self):
-        self.library_client.money = 1
-        self.library_client.save()
+        ledger.top_up(self.library_client.pk, 1)
 
-        self.test_client.post(self.page_url, {})
-        self.library_client.refresh_from_db()
+        response = self.test_client.post(self.page_url, {})
 
-        self.assertEqual(self.library_client.money, 0)
+        self.assertEqual(ledger.balance(self.library_client.pk), 0)
+        self.assertEqual(response.context['money'], 0)
         self.assertIn(self.book, self.library_client.books.all())
 
     def test_repeated_purchase(self):
-        self.library_client.money = 2
-        self.library_client.save()
+        ledger.top_up(self.library_client.pk, 2)
         self.test_client.post(self.page_url, {})
         self.test_client.post(self.page_url, {})
 
-        self.library_client.refresh_from_db()
-        self.assertEqual(self.library_client.money, Decimal(1))
+        self.assertEqual(ledger.balance(self.library_client.pk), Decimal(1))
         client_books = self.library_client.books.filter(id=self.book.id)
         self.assertEqual(len(client_books), 1)
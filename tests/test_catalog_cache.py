@@ -0,0 +1,118 @@
+from threading import Event, Thread
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.client import Client as TestClient
+
+from library_app import catalog_cache, purchases
+from library_app.catalog_import import CatalogImporter
+from library_app.models import Author, Book, Client, Genre
+from tests.runner import LibraryTransactionTestCase
+
+
+class VersionTest(TestCase):
+    def test_cached_until_bumped(self):
+        built = []
+        build = lambda: built.append(1) or len(built)
+        self.assertEqual(catalog_cache.cached(('key',), [('book',), ('book', 1)], build), 1)
+        self.assertEqual(catalog_cache.cached(('key',), [('book',), ('book', 1)], build), 1)
+        catalog_cache.bump_instances('book', [2])
+        self.assertEqual(catalog_cache.cached(('key',), [('book', 1)], build), 2)
+        self.assertEqual(catalog_cache.cached(('key',), [('book', 1)], build), 2)
+        catalog_cache.bump_instances('book', [1])
+        self.assertEqual(catalog_cache.cached(('key',), [('book', 1)], build), 3)
+
+
+class UncommittedWriteTest(LibraryTransactionTestCase):
+    def test_bumped_again_on_commit(self):
+        book = Book.objects.create(title='Old', volume=1)
+        build = lambda: Book.objects.get(pk=book.pk).title
+        renamed, commit = Event(), Event()
+
+        def rename():
+            try:
+                with transaction.atomic():
+                    # as the admin and the bulk endpoints write, the signal bumps before the commit
+                    uncommitted = Book.objects.get(pk=book.pk)
+                    uncommitted.title = 'New'
+                    uncommitted.save()
+                    renamed.set()
+                    commit.wait(10)
+            finally:
+                connection.close()
+
+        thread = Thread(target=rename)
+        thread.start()
+        self.assertTrue(renamed.wait(10))
+        # read between the bump and the commit, stored under the new version
+        self.assertEqual(catalog_cache.cached(('title',), [('book', book.pk)], build), 'Old')
+        commit.set()
+        thread.join()
+        self.assertEqual(catalog_cache.cached(('title',), [('book', book.pk)], build), 'New')
+
+
+def create_page_cache_test(model_class, page_url, list_url, attrs, field):
+    class PageCacheTest(TestCase):
+        def setUp(self):
+            self.user = User.objects.create_user(username='user', password='user')
+            Client.objects.create(user=self.user, money=10)
+            self.client = TestClient()
+            self.client.force_login(self.user)
+            self.target = model_class.objects.create(**attrs)
+
+        def test_entity(self):
+            url = f'{page_url}?id={self.target.id}'
+            self.assertContains(self.client.get(url), 'old')
+            # a queryset update sends no signals, the cached page is served
+            model_class.objects.filter(pk=self.target.pk).update(**{field: 'new'})
+            self.assertContains(self.client.get(url), 'old')
+            setattr(self.target, field, 'newer')
+            self.target.save()
+            self.assertContains(self.client.get(url), 'newer')
+
+        def test_list(self):
+            self.assertContains(self.client.get(list_url), 'old')
+            model_class.objects.filter(pk=self.target.pk).update(**{field: 'new'})
+            self.assertContains(self.client.get(list_url), 'old')
+            model_class.objects.create(**{**attrs, field: 'added'})
+            response = self.client.get(list_url)
+            self.assertContains(response, 'added')
+            self.assertContains(response, 'new')
+            self.target.delete()
+            self.assertNotContains(self.client.get(list_url), 'new')
+
+    return PageCacheTest
+
+
+BookPageCacheTest = create_page_cache_test(Book, '/book/', '/books/', {'title': 'old', 'volume': 1}, 'title')
+AuthorPageCacheTest = create_page_cache_test(Author, '/author/', '/authors/', {'full_name': 'old'}, 'full_name')
+GenrePageCacheTest = create_page_cache_test(Genre, '/genre/', '/genres/', {'name': 'old'}, 'name')
+
+
+class LayeredCacheTest(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='A', volume=1, price=1)
+        self.clients = []
+        for name in ('first', 'second'):
+            user = User.objects.create_user(username=name, password=name)
+            Client.objects.create(user=user, money=10)
+            client = TestClient()
+            client.force_login(user)
+            self.clients.append(client)
+        purchases.purchase(User.objects.get(username='first').pk, self.book.id)
+
+    def test_owned_marker(self):
+        self.assertContains(self.clients[0].get('/books/'), 'owned')
+        self.assertNotContains(self.clients[1].get('/books/'), 'owned')
+
+    def test_client_has_book(self):
+        url = f'/book/?id={self.book.id}'
+        self.assertTrue(self.clients[0].get(url).context['client_has_book'])
+        self.assertFalse(self.clients[1].get(url).context['client_has_book'])
+
+    def test_import(self):
+        self.assertContains(self.clients[0].get('/books/'), 'A')
+        CatalogImporter().run([{'title': 'Imported', 'volume': 1, 'authors': 'Ann'}])
+        self.assertContains(self.clients[0].get('/books/'), 'Imported')
+        self.assertContains(self.clients[0].get('/authors/'), 'Ann')
@@ -0,0 +1,170 @@
+from tempfile import TemporaryDirectory
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.test.client import Client as TestClient
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from library_app import purchases
+from library_app.models import Author, Book, Client, Genre
+
+
+class ModifiedTest(TestCase):
+    def test_bumped_on_save(self):
+        book = Book.objects.create(title='A', volume=1)
+        created = book.modified
+        book.title = 'B'
+        book.save(update_fields=['title'])
+        book.refresh_from_db()
+        self.assertGreater(book.modified, created)
+
+    def test_bumped_on_links(self):
+        book = Book.objects.create(title='A', volume=1)
+        author = Author.objects.create(full_name='Ann')
+        created = Book.objects.get(pk=book.pk).modified
+        author.books.add(book)
+        added = Book.objects.get(pk=book.pk).modified
+        self.assertGreater(added, created)
+        book.authors.remove(author)
+        self.assertGreater(Book.objects.get(pk=book.pk).modified, added)
+
+
+def create_conditional_test(model_class, url, creation_attrs):
+    class ConditionalTest(TestCase):
+        def setUp(self):
+            self.client = APIClient()
+            self.client.force_authenticate(user=User.objects.create_user(username='user', password='user'))
+            self.target = model_class.objects.create(**creation_attrs)
+
+        def assertRevalidated(self, path, change, queries=1, **params):
+            response = self.client.get(path, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            etag = response.headers['ETag']
+            self.assertIn('Last-Modified', response.headers)
+            with self.assertNumQueries(queries):
+                response = self.client.get(path, params, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response.headers['ETag'], etag)
+            change()
+            response = self.client.get(path, params, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(response.headers['ETag'], etag)
+
+        def rename(self):
+            self.target.save()
+
+        def test_retrieve(self):
+            self.assertRevalidated(f'{url}{self.target.id}/', self.rename)
+
+        def test_list(self):
+            self.assertRevalidated(url, self.rename)
+
+        def test_list_deletion(self):
+            model_class.objects.create(**creation_attrs)
+            self.assertRevalidated(url, self.target.delete)
+
+        def test_list_without_count(self):
+            self.assertRevalidated(url, self.rename, count=0)
+
+        def test_if_modified_since(self):
+            response = self.client.get(f'{url}{self.target.id}/')
+            response = self.client.get(
+                f'{url}{self.target.id}/', HTTP_IF_MODIFIED_SINCE=response.headers['Last-Modified'],
+            )
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        def test_missing(self):
+            self.assertEqual(self.client.get(f'{url}123/').status_code, status.HTTP_404_NOT_FOUND)
+
+    return ConditionalTest
+
+
+BookConditionalTest = create_conditional_test(Book, '/rest/books/', {'title': 'A', 'volume': 1})
+AuthorConditionalTest = create_conditional_test(Author, '/rest/authors/', {'full_name': 'A'})
+GenreConditionalTest = create_conditional_test(Genre, '/rest/genres/', {'name': 'A'})
+
+
+class SharedCacheConditionalTest(BookConditionalTest):
+    # with a cache shared by the workers, lists are validated by the catalog versions, without a query
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        caches = {**settings.CACHES, 'catalog': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                                 'LOCATION': directory.name}}
+        override = override_settings(CACHES=caches)
+        override.enable()
+        self.addCleanup(override.disable)
+        super().setUp()
+
+    def test_list(self):
+        self.assertRevalidated('/rest/books/', self.rename, queries=0)
+
+    def test_list_deletion(self):
+        Book.objects.create(title='A', volume=1)
+        self.assertRevalidated('/rest/books/', self.target.delete, queries=0)
+
+    def test_list_without_count(self):
+        self.assertRevalidated('/rest/books/', self.rename, queries=0, count=0)
+
+    def test_list_expanded(self):
+        author = Author.objects.create(full_name='Ann')
+        self.target.authors.add(author)
+        self.assertRevalidated('/rest/books/', author.save, queries=0, expand='authors')
+
+
+class ExpandedConditionalTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=User.objects.create_user(username='user', password='user'))
+        self.book = Book.objects.create(title='A', volume=1)
+        self.author = Author.objects.create(full_name='Ann')
+        self.book.authors.add(self.author)
+
+    def test_author_renamed(self):
+        response = self.client.get('/rest/books/', {'expand': 'authors'})
+        self.author.full_name = 'Anna'
+        self.author.save()
+        response = self.client.get(
+            '/rest/books/', {'expand': 'authors'}, HTTP_IF_NONE_MATCH=response.headers['ETag'],
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['authors'][0]['full_name'], 'Anna')
+
+
+class PageConditionalTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='user')
+        Client.objects.create(user=self.user, money=10)
+        self.client = TestClient()
+        self.client.force_login(self.user)
+        self.book = Book.objects.create(title='A', volume=1, price=1)
+
+    def test_book_page(self):
+        url = f'/book/?id={self.book.id}'
+        etag = self.client.get(url).headers['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        purchases.purchase(self.user.pk, self.book.id)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.context['client_has_book'])
+
+    def test_book_page_if_modified_since(self):
+        url = f'/book/?id={self.book.id}'
+        last_modified = self.client.get(url).headers['Last-Modified']
+        purchases.purchase(self.user.pk, self.book.id)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.context['client_has_book'])
+
+    def test_genre_page(self):
+        genre = Genre.objects.create(name='A')
+        url = f'/genre/?id={genre.id}'
+        etag = self.client.get(url).headers['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        genre.description = 'B'
+        genre.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
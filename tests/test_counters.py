@@ -0,0 +1,84 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.client import Client as TestClient
+from django.test.utils import CaptureQueriesContext
+
+from library_app import counters
+from library_app.models import Author, Book, BookAuthor, BookClient, BookGenre, Client, Counter, Genre
+
+
+def counted(model):
+    return counters.get_counts(model)[counters.counter_name(model)]
+
+
+class CountersTest(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='A', volume=1)
+        self.author = Author.objects.create(full_name='A')
+        self.genre = Genre.objects.create(name='A')
+
+    def assertCountersExact(self):
+        for model in counters.COUNTED_MODELS:
+            self.assertEqual(counted(model), model.objects.count(), model.__name__)
+
+    def test_save_and_delete(self):
+        self.assertCountersExact()
+        Book.objects.create(title='B', volume=1)
+        self.author.save()
+        self.assertCountersExact()
+        self.genre.delete()
+        Author.objects.all().delete()
+        self.assertCountersExact()
+
+    def test_relations(self):
+        user = User.objects.create(username='user')
+        client = Client.objects.create(user=user)
+        self.book.authors.add(self.author)
+        self.book.authors.add(self.author)
+        self.genre.books.add(self.book)
+        client.books.add(self.book)
+        BookAuthor.objects.create(book=Book.objects.create(title='B', volume=1), author=self.author)
+        self.assertCountersExact()
+        self.book.authors.remove(self.author)
+        self.genre.books.clear()
+        self.assertCountersExact()
+        self.book.delete()
+        self.assertCountersExact()
+
+    def test_bulk_create(self):
+        counters.bulk_create(Genre, [Genre(name=str(number)) for number in range(5)], batch_size=2)
+        counters.bulk_create(BookGenre, [BookGenre(book=self.book, genre=genre) for genre in Genre.objects.all()])
+        self.assertCountersExact()
+
+    def test_rebuild_command(self):
+        Counter.objects.update(value=-1)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertCountersExact()
+
+    def test_sharded(self):
+        for key in range(40):
+            counters.increment_sharded(BookClient, key)
+        counters.increment_sharded(BookClient, 0, -39)
+        self.assertEqual(counted(BookClient), 1)
+        self.assertGreater(Counter.objects.filter(name__startswith='bookclient:').count(), 1)
+        # the shards alone are no count
+        Counter.objects.filter(name='bookclient').delete()
+        self.assertEqual(counted(BookClient), 0)
+        self.assertFalse(Counter.objects.filter(name__startswith='bookclient:').exists())
+
+    def test_missing_counter(self):
+        Counter.objects.filter(name='book').delete()
+        self.assertEqual(counters.get_counts(Book)['book'], 1)
+        self.assertCountersExact()
+
+    def test_home_page_without_aggregates(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = TestClient().get('/')
+        self.assertEqual(response.context['books'], 1)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT(', queries[0]['sql'].upper())
+        self.assertEqual(BookClient.objects.count(), counted(BookClient))
@@ -0,0 +1,107 @@
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase, override_settings
+from django.test.client import Client as TestClient
+from rest_framework import status
+
+from library_app import delivery
+from library_app.models import Book, Client
+
+DATA = bytes(range(256)) * (delivery.CHUNK_SIZE // 128 + 1)
+
+
+class ParseRangeTest(TestCase):
+    def test_ranges(self):
+        self.assertEqual(delivery.parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(delivery.parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(delivery.parse_range('bytes=90-200', 100), (90, 99))
+        self.assertEqual(delivery.parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(delivery.parse_range('bytes=-200', 100), (0, 99))
+
+    def test_ignored(self):
+        for header in (None, '', 'bytes=0-1,5-6', 'items=0-1', 'bytes=-', 'bytes=9-1'):
+            self.assertIsNone(delivery.parse_range(header, 100))
+
+    def test_not_satisfiable(self):
+        for header in ('bytes=100-', 'bytes=-0'):
+            with self.assertRaises(delivery.RangeNotSatisfiable):
+                delivery.parse_range(header, 100)
+
+
+class ReadFileTest(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.storage = FileSystemStorage(location=self.directory.name)
+        patcher = mock.patch.object(Book._meta.get_field('file'), 'storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+
+        name = self.storage.save('2024-1-1/book.pdf', ContentFile(DATA))
+        self.book = Book.objects.create(title='A', volume=1, price=1, file=name)
+        self.url = f'/read/file/?id={self.book.id}'
+        self.user = User.objects.create_user(username='user', password='user')
+        Client.objects.create(user=self.user, money=10)
+        self.user.client.books.add(self.book)
+        self.client = TestClient()
+        self.client.force_login(self.user)
+
+    def test_whole_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Length'], str(len(DATA)))
+        chunks = list(response.streaming_content)
+        self.assertTrue(all(len(chunk) <= delivery.CHUNK_SIZE for chunk in chunks))
+        self.assertEqual(b''.join(chunks), DATA)
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(DATA)}')
+        self.assertEqual(b''.join(response.streaming_content), DATA[10:20])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), DATA[-5:])
+
+    def test_not_satisfiable(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(DATA)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(DATA)}')
+
+    def test_head(self):
+        response = self.client.head(self.url)
+        self.assertEqual(response['Content-Length'], str(len(DATA)))
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+    def test_access(self):
+        other = User.objects.create_user(username='other', password='other')
+        Client.objects.create(user=other)
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_302_FOUND)
+
+    def test_missing(self):
+        no_file = Book.objects.create(title='B', volume=1)
+        self.assertEqual(self.client.get(f'/read/file/?id={no_file.id}').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/read/file/?id=123').status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(BOOK_FILE_DELIVERY=delivery.ACCEL)
+    def test_accel(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.book.file.name}')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(BOOK_FILE_DELIVERY=delivery.PRESIGNED)
+    def test_presigned_falls_back_to_streaming(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-0')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+
+    def test_read_page(self):
+        self.assertContains(self.client.get(f'/read/?id={self.book.id}'), self.url)
@@ -0,0 +1,84 @@
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from library_app import counters
+from library_app.catalog_import import BULK, COPY
+from library_app.models import Author, Book, BookAuthor, BookGenre, Counter, Genre
+
+CSV_DATA = '''title,description,volume,type,year,price,authors,genres
+First,"multi
+line, with tab\there",100,book,2001,9.99,Ann;Bob,Poetry
+Second,,50,magazine,,,Bob,Poetry;Prose
+Broken,,-1,book,,,Ann,
+Third,,10,,1999,1,Ann;Ann;Carl,
+'''
+
+JSONL_DATA = '''{"title": "First", "volume": 100, "type": "book", "authors": ["Ann", "Bob"], "genres": ["Poetry"]}
+{"title": "Second", "volume": "50", "authors": "Bob", "genres": "Poetry;Prose"}
+not json
+{"title": "Unknown type", "volume": 1, "type": "scroll"}
+'''
+
+
+def create_import_test(method):
+    class ImportTest(TestCase):
+        def setUp(self):
+            self.directory = TemporaryDirectory()
+            self.existing = Author.objects.create(full_name='Ann')
+
+        def tearDown(self):
+            self.directory.cleanup()
+
+        def run_import(self, name, data, *args):
+            path = Path(self.directory.name) / name
+            path.write_text(data, encoding='utf-8')
+            stdout, stderr = StringIO(), StringIO()
+            call_command('import_catalog', str(path), '--method', method, '--batch-size', '2', *args,
+                         stdout=stdout, stderr=stderr)
+            return stdout.getvalue(), stderr.getvalue()
+
+        def assertCountersExact(self):
+            for model in counters.COUNTED_MODELS:
+                self.assertEqual(
+                    Counter.objects.get(name=counters.counter_name(model)).value, model.objects.count(),
+                )
+
+        def test_csv(self):
+            stdout, stderr = self.run_import('books.csv', CSV_DATA)
+            self.assertIn('record 3', stderr)
+            self.assertIn('4 rows, 3 books', stdout)
+            first = Book.objects.get(title='First')
+            self.assertEqual(first.description, 'multi\nline, with tab\there')
+            self.assertEqual(first.price, Decimal('9.99'))
+            self.assertIsNone(Book.objects.get(title='Second').year)
+            self.assertEqual(Author.objects.count(), 3)
+            self.assertEqual(set(first.authors.all()), {self.existing, Author.objects.get(full_name='Bob')})
+            self.assertEqual(BookAuthor.objects.count(), 5)
+            self.assertEqual(Genre.objects.count(), 2)
+            self.assertEqual(BookGenre.objects.count(), 3)
+            self.assertCountersExact()
+
+        def test_jsonl(self):
+            _, stderr = self.run_import('books.jsonl', JSONL_DATA)
+            self.assertIn('malformed record', stderr)
+            self.assertIn('type scroll is unknown', stderr)
+            self.assertEqual(Book.objects.count(), 2)
+            self.assertEqual(Book.objects.get(title='Second').genres.count(), 2)
+            self.assertCountersExact()
+
+        def test_strict(self):
+            with self.assertRaises(CommandError):
+                self.run_import('books.csv', CSV_DATA, '--strict')
+            self.assertEqual(Book.objects.count(), 2)
+            self.assertCountersExact()
+
+    return ImportTest
+
+
+CopyImportTest = create_import_test(COPY)
+BulkImportTest = create_import_test(BULK)
@@ -0,0 +1,142 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from threading import Event, Thread
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase
+from tests.runner import LibraryTransactionTestCase
+from tests.test_purchases import run_concurrently
+
+from library_app import counters, ledger, purchases
+from library_app.models import Book, BookClient, Client, LedgerEntry
+
+
+class LedgerTest(TestCase):
+    def setUp(self):
+        self.client_ = Client.objects.create(user=User.objects.create(username='user'), money=5)
+        self.book = Book.objects.create(title='A', volume=1, price=3)
+
+    def test_opening_entry(self):
+        entry = LedgerEntry.objects.get(client=self.client_)
+        self.assertEqual((entry.kind, entry.amount, entry.compacted), (LedgerEntry.OPENING, Decimal(5), True))
+        self.assertEqual(ledger.reconcile(), [])
+
+    def test_balance(self):
+        ledger.top_up(self.client_.pk, Decimal(2))
+        purchases.purchase(self.client_.pk, self.book.id)
+        self.assertEqual(ledger.balance(self.client_.pk), Decimal(4))
+        # nothing is folded into money until the compaction
+        self.client_.refresh_from_db()
+        self.assertEqual(self.client_.money, Decimal(5))
+        with self.assertRaises(ValidationError):
+            ledger.top_up(self.client_.pk, Decimal(-1))
+
+    def test_compact(self):
+        ledger.top_up(self.client_.pk, Decimal(2))
+        purchases.purchase(self.client_.pk, self.book.id)
+        self.assertEqual(ledger.compact(), 1)
+        self.assertEqual(ledger.compact(), 0)
+        self.client_.refresh_from_db()
+        self.assertEqual(self.client_.money, Decimal(4))
+        self.assertEqual(ledger.balance(self.client_.pk), Decimal(4))
+        self.assertFalse(LedgerEntry.objects.filter(compacted=False).exists())
+        self.assertEqual(ledger.reconcile(), [])
+
+    def test_refund(self):
+        purchases.purchase(self.client_.pk, self.book.id)
+        self.assertEqual(purchases.refund(self.client_.pk, self.book.id), Decimal(3))
+        self.assertIsNone(purchases.refund(self.client_.pk, self.book.id))
+        self.assertFalse(BookClient.objects.exists())
+        self.assertEqual(counters.get_counts(BookClient)['bookclient'], 0)
+        self.assertEqual(ledger.balance(self.client_.pk), Decimal(5))
+        kinds = LedgerEntry.objects.filter(book=self.book).values_list('kind', flat=True)
+        self.assertEqual(sorted(kinds), [LedgerEntry.PURCHASE, LedgerEntry.REFUND])
+
+    def test_refund_without_recorded_price(self):
+        self.client_.books.add(self.book)
+        self.assertIsNone(BookClient.objects.get(client=self.client_).price)
+        self.assertEqual(purchases.refund(self.client_.pk, self.book.id), Decimal(0))
+        self.assertEqual(ledger.balance(self.client_.pk), Decimal(5))
+        self.assertFalse(BookClient.objects.exists())
+        self.assertFalse(LedgerEntry.objects.filter(kind=LedgerEntry.REFUND).exists())
+
+    def test_backfill_prices(self):
+        backfill = import_module('library_app.migrations.0017_backfill_book_client_price').BACKFILL_PRICES
+        granted = Book.objects.create(title='B', volume=1, price=4)
+        self.client_.books.add(self.book, granted)
+        # bought through the buy view before prices were recorded
+        BookClient.objects.filter(book=self.book).update(created=datetime(2020, 1, 1, tzinfo=timezone.utc))
+        with connection.cursor() as cursor:
+            cursor.execute(backfill)
+        self.assertEqual(purchases.refund(self.client_.pk, self.book.id), Decimal(3))
+        self.assertEqual(purchases.refund(self.client_.pk, granted.id), Decimal(0))
+        self.assertEqual(ledger.balance(self.client_.pk), Decimal(8))
+
+    def test_reconcile(self):
+        Client.objects.filter(pk=self.client_.pk).update(money=7)
+        self.assertEqual(ledger.reconcile(), [ledger.Mismatch(self.client_.pk, Decimal(7), Decimal(5))])
+        with self.assertRaises(CommandError):
+            call_command('reconcile_ledger', stderr=StringIO())
+
+    def test_commands(self):
+        ledger.top_up(self.client_.pk, Decimal(2))
+        call_command('compact_ledger', stdout=StringIO())
+        call_command('reconcile_ledger', stdout=StringIO())
+        self.client_.refresh_from_db()
+        self.assertEqual(self.client_.money, Decimal(7))
+
+
+class ConcurrentLedgerTest(LibraryTransactionTestCase):
+    def setUp(self):
+        self.client_ = Client.objects.create(user=User.objects.create(username='user'), money=10)
+        self.book = Book.objects.create(title='A', volume=1, price=3)
+
+    def run_beside(self, held, function) -> None:
+        # runs function while another transaction, having run held, is still open
+        started, finish = Event(), Event()
+
+        def open_transaction():
+            try:
+                with transaction.atomic():
+                    held()
+                    started.set()
+                    finish.wait(10)
+            finally:
+                connection.close()
+
+        thread = Thread(target=open_transaction)
+        thread.start()
+        try:
+            self.assertTrue(started.wait(10))
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("SET LOCAL lock_timeout = '1s'")
+                function()
+        finally:
+            finish.set()
+            thread.join()
+
+    def test_appends_do_not_block(self):
+        top_up = lambda: ledger.top_up(self.client_.pk, Decimal(1))
+        self.run_beside(top_up, top_up)
+        # a purchase holds the client row, appending still goes through
+        self.run_beside(lambda: purchases.purchase(self.client_.pk, self.book.id), top_up)
+        self.run_beside(top_up, ledger.compact)
+        self.assertEqual(ledger.balance(self.client_.pk), Decimal(11))
+        self.assertEqual(ledger.reconcile(), [])
+
+    def test_concurrent(self):
+        books = [Book.objects.create(title=str(number), volume=1, price=3) for number in range(8)]
+        operations = [(ledger.top_up, self.client_.pk, Decimal(1))] * 8
+        operations += [(purchases.purchase, self.client_.pk, book.id) for book in books]
+        operations += [(ledger.compact,)] * 4
+        results = run_concurrently(lambda function, *arguments: function(*arguments), operations, workers=8)
+        bought = BookClient.objects.count()
+        self.assertEqual(bought, [getattr(result, 'status', None) for result in results].count(purchases.PURCHASED))
+        self.assertEqual(ledger.balance(self.client_.pk), Decimal(18 - 3 * bought))
+        self.assertGreaterEqual(ledger.balance(self.client_.pk), 0)
+        self.assertEqual(ledger.reconcile(), [])
@@ -0,0 +1,126 @@
+import shutil
+from tempfile import TemporaryDirectory
+from threading import Thread
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.test.client import Client as TestClient
+from rest_framework import status
+
+from library_app import metrics
+from library_app.models import Book, Client
+
+
+def value(metric, **labels):
+    return metrics.collect()[metric.name].get(metric._key(labels), 0)
+
+
+def requests(route: str, status_code: int = status.HTTP_200_OK) -> int:
+    observed = value(metrics.REQUEST_SECONDS, route=route, method='GET', status=status_code)
+    return observed[-1] if observed else 0
+
+
+class MetricTest(TestCase):
+    def metric(self, metric_class, *args, **kwargs):
+        metric = metric_class(*args, **kwargs)
+        self.addCleanup(metrics._registry.remove, metric)
+        return metric
+
+    def test_counter_across_threads(self):
+        counter = self.metric(metrics.Counter, 'test_threads_total', 'Test', ('kind',))
+        threads = [Thread(target=lambda: [counter.inc(kind='a') for _ in range(1000)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc(5, kind='b')
+        self.assertEqual(counter.collect(), {('a',): 4000, ('b',): 5})
+
+    def test_finished_threads_folded(self):
+        counter = self.metric(metrics.Counter, 'test_short_threads_total', 'Test')
+        for _ in range(100):
+            thread = Thread(target=counter.inc)
+            thread.start()
+            thread.join()
+        self.assertEqual(counter.collect(), {(): 100})
+        self.assertEqual(len(counter._shards), 0)
+
+    def test_histogram_exposition(self):
+        histogram = self.metric(metrics.Histogram, 'test_seconds', 'Test "seconds"', ('route',), buckets=(0.1, 1))
+        for duration in (0.05, 0.1, 0.5, 3):
+            histogram.observe(duration, route='a"b')
+        text = metrics.exposition()
+        self.assertIn('# TYPE test_seconds histogram\n', text)
+        self.assertIn(
+            'test_seconds_bucket{route="a\\"b",le="0.1"} 2\n'
+            'test_seconds_bucket{route="a\\"b",le="1"} 3\n'
+            'test_seconds_bucket{route="a\\"b",le="+Inf"} 4\n'
+            'test_seconds_sum{route="a\\"b"} 3.65\n'
+            'test_seconds_count{route="a\\"b"} 4\n',
+            text,
+        )
+
+    def test_timed_chunks(self):
+        histogram = self.metric(metrics.Histogram, 'test_read_seconds', 'Test', ('operation',))
+        chunks = metrics.timed_chunks([b'first', b'second'], histogram, operation='read')
+        self.assertEqual(b''.join(chunks), b'firstsecond')
+        self.assertEqual(histogram.collect()[('read',)][-1], 1)
+
+    def test_shared_directory(self):
+        counter = self.metric(metrics.Counter, 'test_processes_total', 'Test')
+        counter.inc(3)
+        with TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            metrics.process_file.flush(directory)
+            # another worker that flushed the same counts
+            shutil.copy(metrics.process_file.path, f'{directory}/other.json')
+            counter.inc()
+            self.assertIn('test_processes_total 7\n', metrics.exposition())
+
+
+class MetricsMiddlewareTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='user')
+        Client.objects.create(user=self.user, money=10)
+        self.book = Book.objects.create(title='A', volume=1, price=7)
+        self.client = TestClient()
+        self.client.force_login(self.user)
+
+    def test_requests(self):
+        count, queries = requests('books'), value(metrics.REQUEST_DB_QUERIES, route='books')
+        self.client.get('/books/')
+        self.client.get('/books/')
+        self.assertEqual(requests('books'), count + 2)
+        self.assertGreater(value(metrics.REQUEST_DB_QUERIES, route='books'), queries)
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn(
+            'http_request_duration_seconds_count{route="books",method="GET",status="200"}', response.content.decode(),
+        )
+
+    async def test_async_view(self):
+        count = requests('homepage')
+        await self.async_client.get('/')
+        self.assertEqual(requests('homepage'), count + 1)
+
+    def test_unresolved(self):
+        count = requests(metrics.UNRESOLVED, status.HTTP_404_NOT_FOUND)
+        self.client.get('/missing/')
+        self.assertEqual(requests(metrics.UNRESOLVED, status.HTTP_404_NOT_FOUND), count + 1)
+
+    def test_purchases(self):
+        purchased = value(metrics.PURCHASES, status='purchased')
+        owned = value(metrics.PURCHASES, status='already_owned')
+        insufficient = value(metrics.PURCHASES, status='insufficient_funds')
+        self.client.post(f'/buy/?id={self.book.id}')
+        self.client.post(f'/buy/?id={self.book.id}')
+        expensive = Book.objects.create(title='B', volume=1, price=100)
+        self.client.post(f'/buy/?id={expensive.id}')
+        self.assertEqual(value(metrics.PURCHASES, status='purchased'), purchased + 1)
+        self.assertEqual(value(metrics.PURCHASES, status='already_owned'), owned + 1)
+        self.assertEqual(value(metrics.PURCHASES, status='insufficient_funds'), insufficient + 1)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
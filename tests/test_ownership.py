@@ -0,0 +1,85 @@
+from threading import Event, Thread
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.client import Client as TestClient
+
+from library_app.models import Book, BookClient, Client, Ownership
+from tests.runner import LibraryTransactionTestCase
+
+
+class OwnershipTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user')
+        self.client_ = Client.objects.create(user=self.user)
+        self.books = [Book.objects.create(title=str(number), volume=1) for number in range(4)]
+        self.client_.books.add(*self.books[:2])
+
+    def test_owns(self):
+        ownership = Ownership(self.client_.pk)
+        with self.assertNumQueries(2):
+            self.assertTrue(ownership.owns(self.books[0].id))
+            self.assertFalse(ownership.owns(self.books[3].id))
+            self.assertTrue(ownership.owns(self.books[0].id))
+
+    def test_owned_ids(self):
+        ids = [book.id for book in self.books]
+        ownership = Ownership(self.client_.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(ownership.owned_ids(ids), {self.books[0].id, self.books[1].id})
+            self.assertFalse(ownership.owns(self.books[2].id))
+        self.assertEqual(self.client_.owned_ids(), {self.books[0].id, self.books[1].id})
+
+    def test_client_memo_reset_on_add(self):
+        self.assertFalse(self.client_.owns(self.books[2].id))
+        self.client_.books.add(self.books[2])
+        self.assertTrue(self.client_.owns(self.books[2].id))
+
+    @override_settings(OWNED_BOOKS_CACHE_TIMEOUT=60)
+    def test_cross_request_cache(self):
+        cache.clear()
+        Ownership(self.client_.pk).owned_ids()
+        with self.assertNumQueries(0):
+            self.assertTrue(Ownership(self.client_.pk).owns(self.books[1].id))
+        BookClient.objects.create(client=self.client_, book=self.books[3])
+        self.assertTrue(Ownership(self.client_.pk).owns(self.books[3].id))
+        BookClient.objects.filter(book=self.books[3]).delete()
+        Ownership(self.client_.pk).owned_ids()
+        self.books[2].client_set.add(self.client_)
+        self.assertTrue(Ownership(self.client_.pk).owns(self.books[2].id))
+
+    def test_books_page_marks_owned(self):
+        test_client = TestClient()
+        test_client.force_login(self.user)
+        response = test_client.get('/books/')
+        self.assertEqual(response.context['owned_books'], {self.books[0].id, self.books[1].id})
+
+
+@override_settings(OWNED_BOOKS_CACHE_TIMEOUT=60)
+class UncommittedOwnershipTest(LibraryTransactionTestCase):
+    def test_forgotten_on_commit(self):
+        client = Client.objects.create(user=User.objects.create(username='user'))
+        book = Book.objects.create(title='A', volume=1)
+        cache.clear()
+        added, commit = Event(), Event()
+
+        def add():
+            try:
+                with transaction.atomic():
+                    client.books.add(book)
+                    added.set()
+                    commit.wait(10)
+            finally:
+                connection.close()
+
+        thread = Thread(target=add)
+        thread.start()
+        self.assertTrue(added.wait(10))
+        # cached between the change and its commit
+        self.assertEqual(Ownership(client.pk).owned_ids(), frozenset())
+        commit.set()
+        thread.join()
+        self.assertTrue(Ownership(client.pk).owns(book.id))
+
@@ -0,0 +1,99 @@
+from django.test import TestCase
+from django.test.client import Client as TestClient
+from django.contrib.auth.models import User
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from library_app.models import Book, Client
+from library_app.pagination import KeysetPaginator, InvalidCursor, encode_cursor
+
+PAGE_SIZE = 4
+
+
+def create_books():
+    # duplicated titles and NULL type/year exercise every column of the keyset
+    for number in range(15):
+        attrs = {'title': f'title {number % 5}', 'volume': 1}
+        if number % 3:
+            attrs['type'] = 'book'
+        if number % 4:
+            attrs['year'] = 2000 + number % 2
+        Book.objects.create(**attrs)
+
+
+class KeysetPaginatorTest(TestCase):
+    def setUp(self):
+        create_books()
+        self.paginator = KeysetPaginator(Book.objects.all(), PAGE_SIZE)
+        self.expected = list(Book.objects.order_by('title', 'type', 'year', 'id'))
+
+    def test_forward(self):
+        collected, page = [], self.paginator.get_page(None)
+        self.assertFalse(page.has_previous)
+        while True:
+            collected.extend(page)
+            if not page.has_next:
+                break
+            page = self.paginator.get_page(page.next_cursor)
+        self.assertEqual(collected, self.expected)
+        self.assertEqual(page.count, len(self.expected))
+
+    def test_backward(self):
+        page = self.paginator.get_page(None)
+        while page.has_next:
+            page = self.paginator.get_page(page.next_cursor)
+        collected = list(page)
+        while page.has_previous:
+            page = self.paginator.get_page(page.previous_cursor)
+            collected = list(page) + collected
+        self.assertEqual(collected, self.expected)
+
+    def test_skip_count(self):
+        page = KeysetPaginator(Book.objects.all(), PAGE_SIZE, count=False).get_page(None)
+        self.assertIsNone(page.count)
+
+    def test_constant_queries(self):
+        paginator = KeysetPaginator(Book.objects.all(), PAGE_SIZE, count=False)
+        with self.assertNumQueries(1):
+            paginator.get_page(encode_cursor(['title 3', 'book', 2001, str(self.expected[-1].id)], False))
+
+    def test_invalid_cursor(self):
+        for cursor in ('???', encode_cursor(['a'], False), encode_cursor(['a', None, None, 'x'], False)):
+            with self.assertRaises(InvalidCursor):
+                self.paginator.get_page(cursor)
+
+
+class KeysetViewsTest(TestCase):
+    def setUp(self):
+        create_books()
+        self.user = User.objects.create_user(username='user', password='user')
+        Client.objects.create(user=self.user)
+
+    def test_list_view(self):
+        client = TestClient()
+        client.force_login(self.user)
+        response = client.get('/books/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        page = response.context['page_obj']
+        response = client.get(f'/books/?cursor={page.next_cursor}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.context['page_obj'].has_previous)
+        self.assertEqual(client.get('/books/?cursor=invalid').status_code, status.HTTP_200_OK)
+        self.assertEqual(client.get('/books/?page=2').status_code, status.HTTP_200_OK)
+
+    def test_rest(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user, token=Token.objects.create(user=self.user))
+        response = client.get('/rest/books/', {'page_size': PAGE_SIZE})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], Book.objects.count())
+        self.assertEqual(len(response.data['results']), PAGE_SIZE)
+        self.assertIsNone(response.data['previous'])
+
+        response = client.get(f"{response.data['next']}&count=0")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['count'])
+        self.assertIsNotNone(response.data['previous'])
+
+        self.assertEqual(client.get('/rest/books/?cursor=invalid').status_code, status.HTTP_404_NOT_FOUND)
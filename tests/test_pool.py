@@ -0,0 +1,142 @@
+from contextlib import contextmanager
+from threading import Thread
+from unittest import mock
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from psycopg2 import OperationalError, extensions
+
+from library_app.pooled_postgresql.base import ConnectionPool, DatabaseWrapper, PoolTimeout, close_pools
+
+
+class FakeConnection:
+    def __init__(self) -> None:
+        self.closed = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.rolled_back = False
+        self.terminated = False
+        self.pings = 0
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def execute(self, sql):
+        self.pings += 1
+        if self.terminated:
+            self.closed = 2
+            raise OperationalError('server closed the connection unexpectedly')
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rolled_back = True
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    def pool(self, **kwargs) -> ConnectionPool:
+        return ConnectionPool(FakeConnection, **{'min_size': 0, 'timeout': 0.01, **kwargs})
+
+    def test_reused(self):
+        pool = self.pool(min_size=1)
+        pool.fill()
+        first = pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+
+    def test_max_size(self):
+        pool = self.pool(max_size=2)
+        first, _ = pool.acquire(), pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        # a waiting request gets the connection released meanwhile
+        pool.timeout = 1
+        Thread(target=pool.release, args=(first,)).start()
+        self.assertIs(pool.acquire(), first)
+
+    def test_rolled_back(self):
+        pool = self.pool()
+        used = pool.acquire()
+        used.status = extensions.TRANSACTION_STATUS_INERROR
+        pool.release(used)
+        self.assertTrue(used.rolled_back)
+        self.assertIs(pool.acquire(), used)
+
+    def test_closed_discarded(self):
+        pool = self.pool()
+        broken = pool.acquire()
+        broken.close()
+        pool.release(broken)
+        self.assertEqual(pool.idle, 0)
+        self.assertIsNot(pool.acquire(), broken)
+
+    def test_terminated_discarded(self):
+        pool = self.pool(check_idle=10)
+        with mock.patch('library_app.pooled_postgresql.base.monotonic', return_value=0):
+            first = pool.acquire()
+            pool.release(first)
+        with mock.patch('library_app.pooled_postgresql.base.monotonic', return_value=5):
+            # recently used, handed out without a ping
+            self.assertIs(pool.acquire(), first)
+            pool.release(first)
+        self.assertEqual(first.pings, 0)
+        first.terminated = True
+        with mock.patch('library_app.pooled_postgresql.base.monotonic', return_value=20):
+            self.assertIsNot(pool.acquire(), first)
+        self.assertEqual(first.pings, 1)
+
+    def test_expiry(self):
+        pool = self.pool(min_size=1, max_idle=10, max_lifetime=100)
+        with mock.patch('library_app.pooled_postgresql.base.monotonic', return_value=0):
+            first, second = pool.acquire(), pool.acquire()
+            pool.release(first)
+        with mock.patch('library_app.pooled_postgresql.base.monotonic', return_value=20):
+            # the idle one beyond min_size goes once another returns
+            pool.release(second)
+        self.assertTrue(first.closed)
+        self.assertEqual(pool.idle, 1)
+        with mock.patch('library_app.pooled_postgresql.base.monotonic', return_value=200):
+            self.assertIsNot(pool.acquire(), second)
+        self.assertTrue(second.closed)
+
+
+class PooledBackendTest(TestCase):
+    def setUp(self):
+        self.wrapper = DatabaseWrapper({**connection.settings_dict, 'POOL': {'min_size': 1, 'max_size': 2}})
+        self.addCleanup(close_pools)
+        self.addCleanup(self.wrapper.close)
+
+    def backend_pid(self) -> int:
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid(), current_setting(%s)', ['search_path'])
+            pid, search_path = cursor.fetchone()
+        self.assertEqual(search_path, 'public,library')
+        return pid
+
+    def test_connection_reused(self):
+        pid = self.backend_pid()
+        self.wrapper.close()
+        self.assertIsNone(self.wrapper.connection)
+        self.assertEqual(self.backend_pid(), pid)
+
+    def test_terminated_backend_replaced(self):
+        pid = self.backend_pid()
+        self.wrapper.close()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s, 5000)', [pid])
+        self.assertNotEqual(self.backend_pid(), pid)
+
+    def test_transaction_rolled_back(self):
+        self.wrapper.set_autocommit(False)
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE pooled (id int)')
+        self.wrapper.close()
+        self.wrapper.connect()
+        with self.wrapper.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('pg_temp.pooled')")
+            self.assertIsNone(cursor.fetchone()[0])
@@ -0,0 +1,205 @@
+import pstats
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import get_ident
+from time import perf_counter
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.http import HttpResponse
+from django.test.client import Client as TestClient
+from django.urls import path
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from library_app.models import Author, Book, Client, Genre
+from library_app import profiling
+from library_app.profiling import fingerprint, profile_queries
+from tests.runner import QueryBudgetMixin
+
+BOOKS = 30
+
+
+def authors_per_book(request):
+    return HttpResponse(', '.join(str(book.authors.first()) for book in Book.objects.all()))
+
+
+urlpatterns = [
+    path('authors_per_book/', authors_per_book),
+]
+
+
+class FingerprintTest(TestCase):
+    def test_values_ignored(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE a = 'x''y' AND b IN (%s, %s,\n %s) LIMIT 21"),
+            'SELECT * FROM t WHERE a = %s AND b IN (%s) LIMIT %s',
+        )
+        self.assertEqual(fingerprint('SELECT "T3"."id" FROM "T3"'), 'SELECT "T3"."id" FROM "T3"')
+
+    def test_repeated(self):
+        books = [Book.objects.create(title=str(number), volume=1) for number in range(3)]
+        with profile_queries() as outer:
+            with profile_queries() as inner:
+                for book in books:
+                    Book.objects.get(pk=book.pk)
+            Book.objects.count()
+        self.assertEqual((inner.count, outer.count), (3, 4))
+        self.assertEqual(list(inner.repeated(3).values()), [3])
+        self.assertFalse(inner.repeated(4))
+
+
+class QueryProfileMiddlewareTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='user')
+        Client.objects.create(user=self.user, money=10)
+        Book.objects.create(title='A', volume=1)
+        self.client = TestClient()
+        self.client.force_login(self.user)
+
+    def test_server_timing(self):
+        response = self.client.get('/books/')
+        self.assertRegex(response.headers['Server-Timing'], r'^db;dur=\d+\.\d;desc="\d+ queries"$')
+
+    async def test_async_view(self):
+        # the queries of async views run in other threads and are counted all the same
+        response = await self.async_client.get('/')
+        self.assertRegex(response.headers['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+    @override_settings(SQL_PROFILE_HEADERS=False)
+    def test_headers_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get('/books/').headers)
+
+    @override_settings(SQL_PROFILE_MAX_QUERIES=1)
+    def test_too_many_queries(self):
+        with self.assertLogs('library_app.profiling', 'WARNING') as logs:
+            self.client.get('/books/')
+        self.assertRegex(logs.output[0], r'GET /books/ ran \d+ queries')
+
+    @override_settings(ROOT_URLCONF='tests.test_profiling')
+    def test_repeated_statement(self):
+        for number in range(4):
+            Book.objects.create(title=str(number), volume=1)
+        with self.assertLogs('library_app.profiling', 'WARNING') as logs:
+            response = self.client.get('/authors_per_book/')
+        self.assertIn('db-repeated;desc="1 statements, 5 queries"', response.headers['Server-Timing'])
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('ran the same statement 5 times: SELECT', logs.output[0])
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='user', is_staff=True, is_superuser=True)
+        Client.objects.create(user=self.user, money=10)
+        for number in range(BOOKS):
+            self.book = Book.objects.create(title=str(number), volume=1, price=1)
+            self.book.authors.add(Author.objects.create(full_name=str(number)))
+            self.book.genres.add(Genre.objects.create(name=str(number)))
+            self.user.client.books.add(self.book)
+        self.client = TestClient()
+        self.client.force_login(self.user)
+
+    def test_pages(self):
+        budgets = {
+            '/': 3,
+            '/books/': 5,
+            '/books/?page=2': 5,
+            f'/book/?id={self.book.id}': 4,
+            '/authors/': 4,
+            '/genres/': 4,
+            '/profile/': 4,
+            f'/read/?id={self.book.id}': 4,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url), self.assertQueryBudget(budget):
+                self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    def test_admin(self):
+        # the string of every row reads its relations, selected along with the rows
+        for model in ('book', 'bookgenre', 'bookauthor', 'client'):
+            with self.subTest(model), self.assertQueryBudget(6):
+                self.assertEqual(self.client.get(f'/admin/library_app/{model}/').status_code, status.HTTP_200_OK)
+
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user, token=Token.objects.create(user=self.user))
+        budgets = {'/rest/books/': 3, '/rest/books/?expand=authors,genres': 5, '/rest/authors/': 3, '/rest/genres/': 3}
+        for url, budget in budgets.items():
+            with self.subTest(url), self.assertQueryBudget(budget):
+                self.assertEqual(client.get(url).status_code, status.HTTP_200_OK)
+
+    def test_over_budget(self):
+        with self.assertRaises(AssertionError), self.assertQueryBudget(1):
+            Book.objects.count()
+            Book.objects.count()
+        with self.assertRaises(AssertionError), self.assertQueryBudget(BOOKS):
+            for book in Book.objects.all():
+                book.authors.first()
+
+
+def spin(seconds: float) -> None:
+    end = perf_counter() + seconds
+    while perf_counter() < end:
+        pass
+
+
+class RequestProfilerTest(TestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings = override_settings(REQUEST_PROFILE_DIR=directory.name, REQUEST_PROFILE_TOKEN='secret')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.staff = User.objects.create_user(username='staff', password='staff', is_staff=True)
+        self.user = User.objects.create_user(username='user', password='user')
+        for user in (self.staff, self.user):
+            Client.objects.create(user=user, money=10)
+        self.client = TestClient()
+        self.client.force_login(self.user)
+
+    def profiled(self, response) -> bool:
+        return profiling.PROFILE_ID_HEADER in response.headers
+
+    def test_untriggered(self):
+        self.assertFalse(self.profiled(self.client.get('/books/')))
+        self.assertFalse(self.profiled(self.client.get('/books/', HTTP_X_PROFILE='wrong')))
+        self.assertFalse(list(self.directory.iterdir()))
+
+    def test_token(self):
+        response = self.client.get('/books/', HTTP_X_PROFILE='secret')
+        stats = pstats.Stats(str(self.directory / response.headers[profiling.PROFILE_ID_HEADER]))
+        self.assertTrue(any(function == 'get' for _, _, function in stats.stats))
+
+    def test_staff_download(self):
+        self.client.force_login(self.staff)
+        name = self.client.get('/books/', HTTP_X_PROFILE='1').headers[profiling.PROFILE_ID_HEADER]
+        self.assertEqual(self.client.get('/profiles/').json()['profiles'][0]['name'], name)
+        response = self.client.get(f'/profiles/{name}')
+        self.assertEqual(b''.join(response.streaming_content), (self.directory / name).read_bytes())
+        self.assertEqual(self.client.get('/profiles/..%2Fsecret.prof').status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(f'/profiles/{name}').status_code, status.HTTP_302_FOUND)
+
+    @override_settings(REQUEST_PROFILE_SAMPLE_RATE=1, REQUEST_PROFILE_KEEP=2)
+    def test_sampled(self):
+        for _ in range(3):
+            self.assertTrue(self.profiled(self.client.get('/books/')))
+        self.assertEqual(len(list(self.directory.iterdir())), 2)
+
+    @override_settings(REQUEST_PROFILER=profiling.SAMPLING)
+    async def test_async_view(self):
+        response = await self.async_client.get('/', **{'X-Profile': 'secret'})
+        self.assertTrue(response.headers[profiling.PROFILE_ID_HEADER].endswith('.folded'))
+
+    def test_stack_sampler(self):
+        sampler = profiling.StackSampler(get_ident(), 0.001)
+        sampler.enable()
+        spin(0.05)
+        sampler.disable()
+        self.assertTrue(any(stack.endswith(f'spin ({Path(__file__).name}:{spin.__code__.co_firstlineno})')
+                            for stack in sampler.stacks))
+        sampler.dump_stats(self.directory / 'stacks.folded')
+        stack, count = (self.directory / 'stacks.folded').read_text().splitlines()[0].rsplit(' ', 1)
+        self.assertEqual(sampler.stacks[stack], int(count))
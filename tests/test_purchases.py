@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.client import Client as TestClient
+
+from library_app import counters, ledger, purchases
+from library_app.models import Book, BookClient, Client
+from tests.runner import LibraryTransactionTestCase
+
+
+class PurchaseTest(TestCase):
+    def setUp(self):
+        self.client_ = Client.objects.create(user=User.objects.create(username='user'), money=5)
+        self.book = Book.objects.create(title='A', volume=1, price=3)
+
+    def test_purchase(self):
+        result = purchases.purchase(self.client_.pk, self.book.id)
+        self.assertEqual(result, purchases.PurchaseResult(purchases.PURCHASED, Decimal(2)))
+        self.assertEqual(BookClient.objects.get(client=self.client_).price, Decimal(3))
+        self.assertEqual(counters.get_counts(BookClient)['bookclient'], 1)
+
+    def test_already_owned(self):
+        purchases.purchase(self.client_.pk, self.book.id)
+        self.assertEqual(purchases.purchase(self.client_.pk, self.book.id).status, purchases.ALREADY_OWNED)
+        self.assertEqual(ledger.balance(self.client_.pk), Decimal(2))
+
+    def test_insufficient_funds(self):
+        expensive = Book.objects.create(title='B', volume=1, price=6)
+        self.assertEqual(purchases.purchase(self.client_.pk, expensive.id).status, purchases.INSUFFICIENT_FUNDS)
+        self.assertFalse(BookClient.objects.exists())
+        self.assertEqual(ledger.balance(self.client_.pk), Decimal(5))
+
+    def test_idempotency_key(self):
+        other = Book.objects.create(title='B', volume=1, price=1)
+        purchases.purchase(self.client_.pk, self.book.id, 'key')
+        replay = purchases.purchase(self.client_.pk, self.book.id, 'key')
+        self.assertTrue(replay.replayed)
+        self.assertEqual(purchases.purchase(self.client_.pk, other.id, 'key').status, purchases.KEY_REUSED)
+        self.assertEqual(ledger.balance(self.client_.pk), Decimal(2))
+
+    def test_unknown_book(self):
+        self.assertEqual(purchases.purchase(self.client_.pk, self.client_.pk and 'a' * 32).status, purchases.UNKNOWN_BOOK)
+
+    def test_view_replay(self):
+        test_client = TestClient()
+        test_client.force_login(self.client_.user)
+        url = f'/buy/?id={self.book.id}'
+        for _ in range(2):
+            self.assertTrue(test_client.post(url, {'idempotency_key': 'key'}).context['client_has_book'])
+        self.assertEqual(ledger.balance(self.client_.pk), Decimal(2))
+
+
+def run_concurrently(function, arguments, workers):
+    def call(argument):
+        try:
+            return function(*argument)
+        finally:
+            connection.close()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(call, arguments))
+
+
+class ConcurrentPurchaseTest(LibraryTransactionTestCase):
+    def test_same_book(self):
+        client = Client.objects.create(user=User.objects.create(username='user'), money=10)
+        book = Book.objects.create(title='A', volume=1, price=3)
+        results = run_concurrently(purchases.purchase, [(client.pk, book.id)] * 16, workers=8)
+        self.assertEqual([result.status for result in results].count(purchases.PURCHASED), 1)
+        self.assertEqual(ledger.balance(client.pk), Decimal(7))
+
+    def test_overdraw(self):
+        client = Client.objects.create(user=User.objects.create(username='user'), money=10)
+        books = [Book.objects.create(title=str(number), volume=1, price=3) for number in range(12)]
+        results = run_concurrently(purchases.purchase, [(client.pk, book.id) for book in books], workers=8)
+        self.assertEqual([result.status for result in results].count(purchases.PURCHASED), 3)
+        self.assertEqual(ledger.balance(client.pk), Decimal(1))
+        self.assertEqual(BookClient.objects.count(), 3)
@@ -0,0 +1,91 @@
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest import skipUnless
+from uuid import uuid4
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from library_app import renderers
+from library_app.models import Author, Book, Genre
+from library_app.serializers import AuthorSerializer, BookSerializer, GenreSerializer, ValuesSerializer
+
+
+class RendererTest(TestCase):
+    data = {
+        'id': uuid4(),
+        'created': datetime(2024, 1, 2, 3, 4, 5, 6, tzinfo=timezone.utc),
+        'price': Decimal('1.50'),
+        'name': _('genre'),
+        'text': 'line separator, кириллица',
+        'items': [{'a': None, 'b': 1.5, 'c': True}],
+    }
+
+    @skipUnless(renderers.orjson, 'orjson is not installed')
+    def test_json_matches_stock(self):
+        self.assertEqual(
+            renderers.FastJSONRenderer().render(self.data), JSONRenderer().render(self.data),
+        )
+
+    def test_indent_uses_stock(self):
+        content = renderers.FastJSONRenderer().render(self.data, 'application/json; indent=2')
+        self.assertIn(b'\n  ', content)
+
+    @skipUnless(renderers.msgpack, 'msgpack is not installed')
+    def test_msgpack(self):
+        content = renderers.MessagePackRenderer().render(self.data)
+        self.assertEqual(renderers.msgpack.unpackb(content), json.loads(JSONRenderer().render(self.data)))
+
+
+def create_values_test(model_class, url, serializer_class, name, creation_attrs):
+    class ValuesTest(TestCase):
+        def setUp(self):
+            self.client = APIClient()
+            self.client.force_authenticate(user=User.objects.create_user(username='user', password='user'))
+            for number in range(5):
+                model_class.objects.create(**{name: f'{number}', **creation_attrs})
+
+        def test_same_as_serializer(self):
+            self.assertIsNotNone(ValuesSerializer.for_serializer(serializer_class(context={})))
+            response = self.client.get(url, {'page_size': 100})
+            expected = JSONRenderer().render(serializer_class(model_class.objects.all(), many=True).data)
+            self.assertEqual(json.loads(response.content)['results'], json.loads(expected))
+
+        def test_cursor_and_fields(self):
+            response = self.client.get(url, {'page_size': 2, 'fields': name})
+            seen = []
+            while True:
+                self.assertTrue(all(set(item) == {name} for item in response.data['results']))
+                seen += [item[name] for item in response.data['results']]
+                if not response.data['next']:
+                    break
+                response = self.client.get(response.data['next'])
+            self.assertEqual(seen, sorted(seen))
+            self.assertEqual(len(seen), 5)
+
+        @skipUnless(renderers.msgpack, 'msgpack is not installed')
+        def test_msgpack(self):
+            response = self.client.get(url, HTTP_ACCEPT=renderers.MSGPACK_MEDIA_TYPE)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response['Content-Type'], renderers.MSGPACK_MEDIA_TYPE)
+            self.assertEqual(
+                renderers.msgpack.unpackb(response.content), json.loads(self.client.get(url).content),
+            )
+    return ValuesTest
+
+
+BookValuesTest = create_values_test(
+    Book, '/rest/books/', BookSerializer, 'title', {'volume': 1, 'year': 2000, 'type': 'magazine'},
+)
+AuthorValuesTest = create_values_test(Author, '/rest/authors/', AuthorSerializer, 'full_name', {})
+GenreValuesTest = create_values_test(Genre, '/rest/genres/', GenreSerializer, 'name', {'description': 'A'})
+
+
+class ExpandedSerializerTest(TestCase):
+    def test_expanded_needs_serializer(self):
+        self.assertIsNone(ValuesSerializer.for_serializer(BookSerializer(context={'expand': ['authors']})))
@@ -0,0 +1,105 @@
+from collections import Counter as Tally
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import ConnectionRouter
+from django.test import SimpleTestCase, override_settings
+from django.test.client import Client as TestClient
+from django.test.utils import CaptureQueriesContext
+from tests.runner import LibraryTransactionTestCase
+
+from library_app import catalog_cache, replicas
+from library_app.models import Book, BookClient, Client, Genre
+
+REPLICAS = {'replica_a': 2, 'replica_b': 1}
+
+
+@override_settings(DATABASE_REPLICAS=REPLICAS)
+class ReplicaRouterTest(SimpleTestCase):
+    # the aliases are only chosen here, nothing is read from them; a TestCase would hold every
+    # test inside a transaction, which keeps reads on the primary
+    def setUp(self):
+        self.router = ConnectionRouter(['library_app.replicas.ReplicaRouter'])
+
+    def test_outside_requests(self):
+        self.assertEqual(self.router.db_for_read(Book), DEFAULT_DB_ALIAS)
+
+    def test_catalog_reads(self):
+        with replicas.request_scope():
+            replica = self.router.db_for_read(Book)
+            self.assertIn(replica, REPLICAS)
+            # the whole request reads one replica
+            self.assertEqual(self.router.db_for_read(Genre), replica)
+            self.assertEqual(self.router.db_for_read(BookClient), DEFAULT_DB_ALIAS)
+            self.assertEqual(self.router.db_for_read(User), DEFAULT_DB_ALIAS)
+
+    def test_weighted(self):
+        chosen = []
+        for _ in range(30):
+            with replicas.request_scope():
+                chosen.append(self.router.db_for_read(Book))
+        self.assertEqual(Tally(chosen), {'replica_a': 20, 'replica_b': 10})
+        self.assertEqual(replicas.weighted_order(REPLICAS), ['replica_a', 'replica_b', 'replica_a'])
+
+    def test_read_your_writes(self):
+        with replicas.request_scope(pinned=True):
+            self.assertEqual(self.router.db_for_read(Book), DEFAULT_DB_ALIAS)
+        with replicas.request_scope():
+            self.assertEqual(self.router.db_for_write(Book), DEFAULT_DB_ALIAS)
+            self.assertEqual(self.router.db_for_read(Book), DEFAULT_DB_ALIAS)
+        with replicas.request_scope(), mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(Book), DEFAULT_DB_ALIAS)
+
+    def test_fresh_versions_built_from_primary(self):
+        built_from = []
+        build = lambda: built_from.append(self.router.db_for_read(Book))
+        with replicas.request_scope():
+            catalog_cache.cached(('page',), [('book',)], build)
+            with override_settings(DATABASE_REPLICA_LAG=0):
+                catalog_cache.cached(('other page',), [('book',)], build)
+        self.assertEqual(built_from[0], DEFAULT_DB_ALIAS)
+        self.assertIn(built_from[1], REPLICAS)
+
+    def test_no_migrations(self):
+        self.assertFalse(self.router.allow_migrate('replica_a', 'library_app'))
+        self.assertTrue(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'library_app'))
+
+
+# run with PG_REPLICA_HOSTS set, the replicas are then test mirrors of the default database
+@skipUnless(settings.DATABASE_REPLICAS, 'PG_REPLICA_HOSTS is not set')
+class ReplicaRequestTest(LibraryTransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='user')
+        Client.objects.create(user=self.user, money=10)
+        self.book = Book.objects.create(title='A', volume=1, price=1)
+        self.client = TestClient()
+        self.client.force_login(self.user)
+
+    def queries(self, request) -> tuple[list[str], list[str]]:
+        replica = connections[next(iter(settings.DATABASE_REPLICAS))]
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as primary_queries, \
+                CaptureQueriesContext(replica) as replica_queries:
+            self.response = request()
+        return [query['sql'] for query in primary_queries], [query['sql'] for query in replica_queries]
+
+    # pages of versions younger than the lag would be built from the primary
+    @override_settings(DATABASE_REPLICAS={'replica_1': 1}, DATABASE_REPLICA_LAG=0)
+    def test_catalog_from_replica(self):
+        primary, replica = self.queries(lambda: self.client.get('/books/'))
+        self.assertTrue(any('"library"."book"' in sql for sql in replica))
+        self.assertFalse(any('"library"."book"' in sql for sql in primary))
+        self.assertNotIn(replicas.PRIMARY_COOKIE, self.response.cookies)
+
+    @override_settings(DATABASE_REPLICAS={'replica_1': 1})
+    def test_primary_after_purchase(self):
+        primary, replica = self.queries(lambda: self.client.post(f'/buy/?id={self.book.id}'))
+        self.assertFalse(replica)
+        self.assertTrue(BookClient.objects.filter(book=self.book).exists())
+        self.assertIn(replicas.PRIMARY_COOKIE, self.response.cookies)
+        # the client sees its purchase, its next requests read the primary
+        primary, replica = self.queries(lambda: self.client.get(f'/book/?id={self.book.id}'))
+        self.assertFalse(replica)
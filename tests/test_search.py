@@ -0,0 +1,103 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.client import Client as TestClient
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from library_app.models import Author, Book, Client, Genre
+
+
+class BookSearchTest(TestCase):
+    def setUp(self):
+        self.war = Book.objects.create(title='Война и мир', description='Роман о войне 1812 года', volume=1)
+        self.running = Book.objects.create(title='Running', description='About runners and books', volume=1)
+        self.described = Book.objects.create(title='Other', description='A long run in the mountains', volume=1)
+        self.unrelated = Book.objects.create(title='Cooking', volume=1)
+
+    def test_russian(self):
+        self.assertEqual(list(Book.objects.search('войны')), [self.war])
+
+    def test_english(self):
+        self.assertEqual(set(Book.objects.search('runs')), {self.running, self.described})
+
+    def test_rank_title_first(self):
+        self.assertEqual(list(Book.objects.search('run')), [self.running, self.described])
+
+    def test_updated_on_save(self):
+        self.unrelated.title = 'Cooking while running'
+        self.unrelated.save()
+        self.assertIn(self.unrelated, Book.objects.search('run'))
+
+    def test_index_used(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        self.assertIn('book_search_idx', Book.objects.search('run').explain())
+
+    def test_views(self):
+        user = User.objects.create_user(username='user', password='user')
+        Client.objects.create(user=user)
+        api_client = APIClient()
+        api_client.force_authenticate(user=user)
+        response = api_client.get('/rest/books/', {'q': 'run'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([book['title'] for book in response.data['results']], ['Running', 'Other'])
+
+        test_client = TestClient()
+        test_client.force_login(user)
+        response = test_client.get('/books/', {'q': 'мир'})
+        self.assertEqual(list(response.context['books_list']), [self.war])
+
+    def test_paginated_by_rank(self):
+        for number in range(5):
+            Book.objects.create(title=f'run {number}', description='run' if number % 2 else None, volume=1)
+        expected = list(Book.objects.search('run').order_by('-rank', 'pk'))
+        api_client = APIClient()
+        api_client.force_authenticate(user=User.objects.create_user(username='user', password='user'))
+        collected, url = [], '/rest/books/?q=run&page_size=2'
+        while url:
+            response = api_client.get(url)
+            collected += [book['id'] for book in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(collected, [str(book.id) for book in expected])
+
+
+class TrigramSearchTest(TestCase):
+    def setUp(self):
+        self.tolstoy = Author.objects.create(full_name='Leo Tolstoy')
+        self.dostoevsky = Author.objects.create(full_name='Fyodor Dostoevsky')
+        self.tolstaya = Author.objects.create(full_name='Tatyana Tolstaya')
+        self.novel = Genre.objects.create(name='Novel')
+        Genre.objects.create(name='Poetry')
+
+    def test_typo(self):
+        self.assertEqual(list(Author.objects.search('Tolstoi'))[0], self.tolstoy)
+        self.assertNotIn(self.dostoevsky, Author.objects.search('Tolstoi'))
+
+    def test_prefix(self):
+        self.assertEqual(list(Genre.objects.search('nov')), [self.novel])
+        self.assertEqual(list(Author.objects.search('fyo')), [self.dostoevsky])
+
+    def test_index_used(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        self.assertIn('author_full_name_trgm_idx', Author.objects.search('Tolstoi').explain())
+        self.assertIn('genre_name_trgm_idx', Genre.objects.search('nov').explain())
+
+    def test_books_by_author(self):
+        war = Book.objects.create(title='War and Peace', volume=1)
+        other = Book.objects.create(title='Other', volume=1)
+        war.authors.add(self.tolstoy, self.tolstaya)
+        other.authors.add(self.dostoevsky)
+        with self.assertNumQueries(1):
+            self.assertEqual(list(Book.objects.filter_by_author_name('Tolstoy')), [war])
+        self.assertEqual(list(Book.objects.filter_by_author_name('Fyodor Dostoevsky')), [other])
+
+    def test_viewsets(self):
+        api_client = APIClient()
+        api_client.force_authenticate(user=User.objects.create_user(username='user', password='user'))
+        response = api_client.get('/rest/authors/', {'q': 'tolstoy'})
+        self.assertEqual([author['full_name'] for author in response.data['results']][0], 'Leo Tolstoy')
+        self.assertNotIn('Fyodor Dostoevsky', [author['full_name'] for author in response.data['results']])
+        response = api_client.get('/rest/genres/', {'q': 'poetri'})
+        self.assertEqual([genre['name'] for genre in response.data['results']], ['Poetry'])
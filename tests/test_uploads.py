@@ -0,0 +1,254 @@
+import hashlib
+from datetime import timedelta
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django_minio_backend import MinioBackend
+from minio import Minio
+from minio.error import S3Error
+from rest_framework import status
+from rest_framework.test import APIClient
+from urllib3 import HTTPResponse, PoolManager
+
+from library_app import uploads
+from library_app.models import Blob, Book, BookUpload, get_datetime
+
+PARTS = [b'first part ' * 1000, b'second part ' * 1000, b'last']
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class UploadApiTest(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.storage = FileSystemStorage(location=self.directory.name)
+        patcher = mock.patch.object(Book._meta.get_field('file'), 'storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+
+        self.book = Book.objects.create(title='A', volume=1)
+        self.client = APIClient()
+        self.client.force_authenticate(
+            user=User.objects.create_user(username='admin', password='admin', is_superuser=True),
+        )
+
+    def initiate(self, content: bytes = b''.join(PARTS)) -> str:
+        response = self.client.post(
+            '/rest/uploads/', {'book': self.book.id, 'filename': 'scan.pdf', 'sha256': sha256(content)},
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def put(self, upload_id, number, data, checksum=None):
+        return self.client.put(
+            f'/rest/uploads/{upload_id}/parts/{number}/', data, content_type='application/octet-stream',
+            HTTP_X_CHECKSUM_SHA256=checksum or sha256(data),
+        )
+
+    def test_resumable_upload(self):
+        upload_id = self.initiate()
+        # parts may arrive in any order and be retried
+        self.assertEqual(self.put(upload_id, 2, PARTS[1]).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.put(upload_id, 1, b'broken').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.put(upload_id, 1, PARTS[0]).status_code, status.HTTP_200_OK)
+
+        response = self.client.get(f'/rest/uploads/{upload_id}/')
+        self.assertEqual([part['number'] for part in response.data['parts']], [1, 2])
+        self.assertEqual(response.data['parts'][0]['size'], len(PARTS[0]))
+
+        self.put(upload_id, 3, PARTS[2])
+        response = self.client.post(f'/rest/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.book.refresh_from_db()
+        with self.book.file.open('rb') as file:
+            self.assertEqual(file.read(), b''.join(PARTS))
+        self.assertEqual(self.book.file.name, f'blobs/{sha256(b"".join(PARTS))[:2]}/{sha256(b"".join(PARTS))}.pdf')
+        self.assertFalse(BookUpload.objects.exists())
+        self.assertEqual(self.storage.listdir('uploads/')[1], [])
+
+    def test_checksum_mismatch(self):
+        upload_id = self.initiate()
+        response = self.put(upload_id, 1, PARTS[0], checksum=sha256(b'other'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(
+            f'/rest/uploads/{upload_id}/parts/1/', PARTS[0], content_type='application/octet-stream',
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(BookUpload.objects.get(pk=upload_id).parts.exists())
+
+    @override_settings(BOOK_UPLOAD_MAX_PART_SIZE=10)
+    def test_part_too_large(self):
+        upload_id = self.initiate()
+        self.assertEqual(self.put(upload_id, 1, PARTS[0]).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_whole_file_checksum(self):
+        upload_id = self.initiate(b'something else')
+        name = BookUpload.objects.get(pk=upload_id).name
+        for number, data in enumerate(PARTS, start=1):
+            self.put(upload_id, number, data)
+        response = self.client.post(f'/rest/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(BookUpload.objects.exists())
+        self.assertFalse(self.storage.exists(name))
+
+    def test_gaps(self):
+        upload_id = self.initiate()
+        self.put(upload_id, 2, PARTS[1])
+        response = self.client.post(f'/rest/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.put(upload_id, 0, PARTS[0]).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_abort(self):
+        upload_id = self.initiate()
+        self.put(upload_id, 1, PARTS[0])
+        self.assertEqual(self.client.delete(f'/rest/uploads/{upload_id}/').status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(BookUpload.objects.exists())
+        self.assertEqual(self.storage.listdir('uploads/')[1], [])
+
+    def test_cleanup(self):
+        stale, fresh = self.initiate(), self.initiate(b'other')
+        self.put(stale, 1, PARTS[0])
+        BookUpload.objects.filter(pk=stale).update(modified=get_datetime() - timedelta(days=2))
+        stdout = StringIO()
+        call_command('cleanup_uploads', stdout=stdout)
+        self.assertIn('1 abandoned', stdout.getvalue())
+        self.assertEqual([str(id_) for id_ in BookUpload.objects.values_list('id', flat=True)], [fresh])
+        self.assertEqual(self.storage.listdir('uploads/')[1], [])
+
+    def test_superuser_only(self):
+        self.client.force_authenticate(user=User.objects.create_user(username='user', password='user'))
+        response = self.client.post(
+            '/rest/uploads/', {'book': self.book.id, 'filename': 'scan.pdf', 'sha256': sha256(b'')},
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class MultipartBackendTest(TestCase):
+    def test_maps_onto_multipart_upload(self):
+        storage = mock.Mock(bucket='static')
+        storage.client._create_multipart_upload.return_value = 'upload-id'
+        storage.client._upload_part.side_effect = ['etag-1', 'etag-2']
+        backend = uploads.MultipartBackend(storage)
+        upload = BookUpload(name='2024-1-1/scan.pdf', upload_id=backend.create('2024-1-1/scan.pdf'))
+        self.assertEqual(upload.upload_id, 'upload-id')
+        parts = []
+        for number, data in enumerate(PARTS[:2], start=1):
+            file = StringIO(data.decode())
+            etag = backend.put_part(upload, number, file, len(data))
+            parts.append(uploads.BookUploadPart(number=number, etag=etag))
+        backend.complete(upload, parts)
+        _, _, _, completed = storage.client._complete_multipart_upload.call_args.args
+        self.assertEqual([(part.part_number, part.etag) for part in completed], [(1, 'etag-1'), (2, 'etag-2')])
+
+
+S3_XMLNS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+
+class StubHttp(PoolManager):
+    # stands in for the urllib3 pool of a real Minio client, so the private methods the backend
+    # relies on run as they are and a minio upgrade that changes them fails here
+    def __init__(self, responses: list[tuple[int, dict, str]]) -> None:
+        super().__init__()
+        self.responses = responses
+        self.requests = []
+
+    def urlopen(self, method, url, body=None, headers=None, preload_content=True):
+        self.requests.append((method, urlsplit(url), body))
+        status_code, headers, data = self.responses.pop(0)
+        return HTTPResponse(body=data.encode(), status=status_code, headers=headers, preload_content=True)
+
+
+class StubbedMinioTest(SimpleTestCase):
+    def backend(self, *responses) -> uploads.MultipartBackend:
+        self.http = StubHttp(list(responses))
+        client = Minio('minio:9000', 'access', 'secret', secure=False, region='us-east-1', http_client=self.http)
+        return uploads.MultipartBackend(mock.Mock(bucket='books', client=client))
+
+    def test_upload(self):
+        xml = {'Content-Type': 'application/xml'}
+        backend = self.backend(
+            (200, xml, f'<InitiateMultipartUploadResult xmlns="{S3_XMLNS}"><UploadId>upload-id</UploadId>'
+                       '</InitiateMultipartUploadResult>'),
+            (200, {'ETag': '"etag-1"'}, ''),
+            (200, xml, f'<CompleteMultipartUploadResult xmlns="{S3_XMLNS}"><Bucket>books</Bucket>'
+                       '<Key>scan.pdf</Key><ETag>"etag"</ETag></CompleteMultipartUploadResult>'),
+        )
+        upload = BookUpload(name='scan.pdf', upload_id=backend.create('scan.pdf'))
+        self.assertEqual(upload.upload_id, 'upload-id')
+        etag = backend.put_part(upload, 1, BytesIO(PARTS[0]), len(PARTS[0]))
+        self.assertEqual(etag, 'etag-1')
+        self.assertEqual(backend.complete(upload, [uploads.BookUploadPart(number=1, etag=etag)]), 'scan.pdf')
+        (create, _, _), (put, put_url, body), (complete, complete_url, completed) = self.http.requests
+        self.assertEqual((create, put, complete), ('POST', 'PUT', 'POST'))
+        self.assertEqual(put_url.path, '/books/scan.pdf')
+        self.assertEqual(parse_qs(put_url.query), {'partNumber': ['1'], 'uploadId': ['upload-id']})
+        self.assertEqual(body, PARTS[0])
+        self.assertEqual(parse_qs(complete_url.query), {'uploadId': ['upload-id']})
+        self.assertIn(b'<PartNumber>1</PartNumber><ETag>"etag-1"</ETag>', completed)
+
+    def test_rejected_completion(self):
+        backend = self.backend((
+            400, {'Content-Type': 'application/xml'},
+            '<Error><Code>EntityTooSmall</Code><Message>Your proposed upload is smaller than the minimum allowed '
+            'object size.</Message></Error>',
+        ))
+        upload = BookUpload(name='scan.pdf', upload_id='upload-id')
+        with self.assertRaisesRegex(uploads.UploadError, 'smaller than the minimum'):
+            backend.complete(upload, [uploads.BookUploadPart(number=1, etag='etag-1')])
+
+    def test_abort(self):
+        backend = self.backend((204, {}, ''))
+        backend.abort(BookUpload(name='scan.pdf', upload_id='upload-id'), [])
+        [(method, url, _)] = self.http.requests
+        self.assertEqual(
+            (method, url.path, parse_qs(url.query)), ('DELETE', '/books/scan.pdf', {'uploadId': ['upload-id']}),
+        )
+
+
+class BookFileBucketTest(SimpleTestCase):
+    def test_private(self):
+        bucket = Book._meta.get_field('file').storage._BUCKET_NAME
+        self.assertIn(bucket, settings.MINIO_PRIVATE_BUCKETS)
+        self.assertNotIn(bucket, settings.MINIO_PUBLIC_BUCKETS)
+
+
+class MoveBookFilesTest(TestCase):
+    def setUp(self):
+        self.storage = mock.Mock(spec=MinioBackend, bucket='books')
+        self.storage.client = mock.Mock()
+        self.legacy = {'2024-1-1/old.pdf'}
+        self.storage.client.stat_object.side_effect = self.stat
+        self.storage.exists.return_value = False
+        patcher = mock.patch.object(Book._meta.get_field('file'), 'storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        Book.objects.bulk_create([Book(title='A', volume=1, file='2024-1-1/old.pdf'), Book(title='B', volume=1)])
+        Blob.objects.create(sha256='a' * 64, name='blobs/new.pdf', size=1)
+
+    def stat(self, bucket, name):
+        if name not in self.legacy:
+            raise S3Error(None, 'NoSuchKey', 'missing', name, None, None)
+
+    def test_copied(self):
+        self.assertEqual(uploads.move_book_files(), 1)
+        self.storage.client.copy_object.assert_called_once()
+        bucket, name, source = self.storage.client.copy_object.call_args.args
+        self.assertEqual((bucket, name, source.bucket_name, source.object_name), (
+            'books', '2024-1-1/old.pdf', 'static', '2024-1-1/old.pdf',
+        ))
+        self.storage.client.remove_object.assert_not_called()
+
+    def test_delete(self):
+        call_command('move_book_files', '--delete', stdout=StringIO())
+        self.storage.client.remove_object.assert_called_once_with('static', '2024-1-1/old.pdf')
+
@@ -1,4 +1,6 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.test.client import Client as TestClient
 from django.urls import reverse
 from django.contrib.auth.models import User
@@ -86,3 +88,18 @@ TestNoAuth = type('TestNoAuth', (TestCase,), methods_no_auth)
 
 methods_intance = {f'test_{page[1]}': create_method_instance(*page) for page in instance_pages}
 TestInstancePages = type('TestInstancePages', (TestCase,), methods_intance)
+
+class ListColumnsTest(TestCase):
+    def test_only_shown_columns(self):
+        user = User.objects.create(username='user', password='user')
+        Client.objects.create(user=user)
+        self.client.force_login(user=user)
+        Book.objects.create(title='A', volume=1, description='long ' * 100)
+        Genre.objects.create(name='A', description='shown')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/books/')
+        self.assertContains(response, 'A')
+        page = [query['sql'] for query in context.captured_queries if 'LIMIT' in query['sql']][0]
+        self.assertNotIn('description', page)
+        self.assertNotIn('"file"', page)
+        self.assertContains(self.client.get('/genres/'), 'shown')